@@ -50,7 +50,23 @@ import sys
     show_default=True,
     help="output directory",
 )
-def main(make_file, sequence_id_file, download_type, output_dir):
+@click.option(
+    "-b",
+    "--batch_size",
+    default=200,
+    show_default=True,
+    help="number of accessions fetched per request",
+)
+@click.option(
+    "-c",
+    "--connections",
+    default=3,
+    show_default=True,
+    help="maximum concurrent requests to NCBI",
+)
+def main(
+    make_file, sequence_id_file, download_type, output_dir, batch_size, connections
+):
     """
     Download genbank sequences
 
@@ -60,10 +76,8 @@ def main(make_file, sequence_id_file, download_type, output_dir):
     print("\t{0:<20} :   {1:<10}".format("sequence ID file", sequence_id_file))
     print("\t{0:<20} :   {1:<10}".format("download type", download_type))
     print("\t{0:<20} :   {1:<10}".format("output dir", output_dir))
-
-    ext = "fasta"
-    if download_type == "genbank":
-        ext = "genbank"
+    print("\t{0:<20} :   {1:<10}".format("batch size", batch_size))
+    print("\t{0:<20} :   {1:<10}".format("connections", connections))
 
     release_number = subprocess.run(
         ["curl", f"https://ftp.ncbi.nlm.nih.gov/genbank/GB_Release_Number"],
@@ -113,19 +127,26 @@ def main(make_file, sequence_id_file, download_type, output_dir):
     print("Generating pipeline")
     pg = PipelineGenerator(make_file)
 
-    efetch = "/usr/local/edirect-17.0/efetch"
-
-    for id in ids:
-        output_sequence_file = f"{output_dir}/{id}.{ext}"
-        log = ""
-        err = f"{output_sequence_file}.err"
-        tgt = f"{output_sequence_file}.OK"
-        dep = ""
-        cmd = f"{efetch} -db nuccore -id {id} -format {download_type} > {output_sequence_file} 2> {err}"
-        pg.add(tgt, dep, cmd)
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except OSError as error:
+        print(f"Directory {output_dir} cannot be created")
+
+    # fetch in batches, a rerun only fetches the records not yet downloaded
+    efetch = "/home/atks/programs/CAVS-pipelines/gen/efetch.py"
+    id_file = f"{output_dir}/sequence_ids.txt"
+    with open(id_file, "w") as f:
+        for id in ids:
+            f.write(f"{id}\n")
+    log = f"{output_dir}/efetch.log"
+    err = f"{output_dir}/efetch.err"
+    tgt = f"{output_dir}/efetch.OK"
+    dep = ""
+    cmd = f"{efetch} -i {id_file} -f {download_type} -o {output_dir} -b {batch_size} -c {connections} > {log} 2> {err}"
+    pg.add(tgt, dep, cmd)
 
     # clean files
-    cmd = f"rm -fr {output_dir}/*.OK  {output_dir}/*.err"
+    cmd = f"rm -fr {output_dir}/*.OK  {output_dir}/*.err {output_dir}/*.log"
     pg.add_clean(cmd)
 
     # write make file
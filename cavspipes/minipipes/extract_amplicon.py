@@ -25,6 +25,9 @@ import subprocess
 import re
 from shutil import copy2
 
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../../gen")
+from seqkernel import reverse_complement
+
 
 @click.command()
 @click.option(
@@ -206,27 +209,6 @@ def main(output_dir, primer_fasta_file, reference_fasta_file):
     # write log file
     mpm.print_log()
 
-def reverse_complement(seq):
-    return (
-        seq[::-1]
-        .upper()
-        .replace("A", "t")
-        .replace("T", "a")
-        .replace("G", "c")
-        .replace("C", "g")
-        .replace("M", "k")
-        .replace("R", "y")
-        .replace("W", "w")
-        .replace("S", "s")
-        .replace("Y", "r")
-        .replace("K", "m")
-        .replace("V", "b")
-        .replace("H", "d")
-        .replace("D", "h")
-        .replace("B", "v")
-        .replace("N", "n")
-        .upper()
-    )
 
 # Aligned_sequences: 2
 # 1: primer2_reverse
@@ -113,6 +113,7 @@ def main(make_file, run_id, illumina_dir, working_dir, sample_file):
     multiqc = "docker run  -u \"root:root\" -t -v  `pwd`:`pwd` -w `pwd` multiqc/multiqc multiqc "
     spades = "/usr/local/SPAdes-3.15.4/bin/spades.py"
     bwa = "/usr/local/bwa-0.7.17/bwa"
+    refcache = "/home/atks/programs/CAVS-pipelines/gen/refcache.py"
     samtools = "/usr/local/samtools-1.17/bin/samtools"
     plot_bamstats = "/usr/local/samtools-1.17/bin/plot-bamstats"
 
@@ -241,11 +242,11 @@ def main(make_file, run_id, illumina_dir, working_dir, sample_file):
         align_dir = f"{analysis_dir}/{sample.idx}_{sample.id}/align_result"
         reference_fasta_file = f"{align_dir}/ref/contigs.fasta"
 
-        # construct reference
+        # construct reference, the index is built in the shared cache and linked
         log = f"{log_dir}/{sample.idx}_{sample.id}.ref.contigs.bwa_index.log"
         dep = f"{log_dir}/{sample.idx}_{sample.id}.ref.contigs.fasta.OK"
         tgt = f"{log_dir}/{sample.idx}_{sample.id}.ref.contigs.bwa_index.OK"
-        cmd = f"{bwa} index -a bwtsw {reference_fasta_file} 2> {log}"
+        cmd = f"{refcache} {reference_fasta_file} -x bwa -l 2> {log}"
         pg.add(tgt, dep, cmd)
 
         #  align
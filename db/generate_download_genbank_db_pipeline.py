@@ -20,10 +20,12 @@
 
 import click
 import os
-import re
 import subprocess
 import sys
 
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../gen")
+from release_sync import find_previous_release, sync_release, write_url_file
+
 
 @click.command()
 @click.option(
@@ -43,7 +45,20 @@ import sys
     show_default=True,
     help="output directory, database files will be downloaded to <out_dir>/<db_release>/<db>",
 )
-def main(make_file, database, output_directory):
+@click.option(
+    "-s",
+    "--sync",
+    is_flag=True,
+    help="hardlink files unchanged since the previous release instead of downloading them",
+)
+@click.option(
+    "-k",
+    "--kmer_index",
+    "build_kmer_index",
+    is_flag=True,
+    help="build a k-mer index for primer searches, about 5 bytes per base",
+)
+def main(make_file, database, output_directory, sync, build_kmer_index):
     """
     Download genbank database
 
@@ -57,6 +72,8 @@ def main(make_file, database, output_directory):
     print("\t{0:<20} :   {1:<10}".format("make_file", make_file))
     print("\t{0:<20} :   {1:<10}".format("database", database))
     print("\t{0:<20} :   {1:<10}".format("output_directory", output_directory))
+    print("\t{0:<20} :   {1:<10}".format("sync", str(sync)))
+    print("\t{0:<20} :   {1:<10}".format("kmer_index", str(build_kmer_index)))
 
     for database in database.split(","):
         if database not in [
@@ -122,83 +139,104 @@ def main(make_file, database, output_directory):
     except OSError as error:
         print(f"Directory {output_dir} cannot be created")
 
-    # get listing of files to download
+    # get listing of files to download, with a manifest to sync the next release
+    previous_dir = None
+    if sync:
+        previous_dir = find_previous_release(output_directory, release_number, database)
+        if previous_dir is None:
+            print("No previous release with a manifest to sync from")
+        else:
+            print(f"Syncing from {previous_dir}")
     print("Getting directory listings")
-    out = subprocess.run(
-        ["curl", f"https://ftp.ncbi.nlm.nih.gov/genbank/"],
-        text=True,
-        capture_output=True,
+    manifest, download_files = sync_release(
+        "https://ftp.ncbi.nlm.nih.gov/genbank/",
+        rf"^gb{database}\d+\.seq\.gz$",
+        output_dir,
+        previous_dir,
     )
 
-    files = []
-    for line in out.stdout.splitlines():
-        m = re.search(f".+(gb{database}\d+\.seq\.gz)<", line)
-        if m != None:
-            files.append(m.group(1))
-        else:
-            pass
-
-    # sort files?
-
-    print(f"Downloading {len(files)} files.")
+    print(f"Downloading {len(download_files)} of {len(manifest)} files.")
 
     # generate make file
     print("Generating pipeline")
     pg = PipelineGenerator(make_file)
 
-    concat_fasta_file_list = ""
-    concat_fasta_file_OK_list = ""
-
-    for file_name in files:
-        file_core = file_name.split(".")[0]
-
-        # download
-        output_genbank_file = f"{output_dir}/{file_name}"
-        log = f"{output_genbank_file}.log"
-        err = f"{output_genbank_file}.err"
-        dep = ""
-        tgt = f"{output_genbank_file}.OK"
-        cmd = f"wget -c https://ftp.ncbi.nlm.nih.gov/genbank/{file_name} -P {output_dir} > {log} 2> {err}"
-        pg.add(tgt, dep, cmd)
+    # download all files concurrently within NCBI's connection limit, verifying the
+    # md5 in the manifest, files already linked from the previous release are skipped
+    download = "/home/atks/programs/CAVS-pipelines/gen/download.py"
+    url_file = f"{output_dir}/download_urls.txt"
+    genbank_file_list = f"{output_dir}/genbank_files.txt"
+    write_url_file(url_file, "https://ftp.ncbi.nlm.nih.gov/genbank/", manifest)
+    with open(genbank_file_list, "w") as f:
+        for entry in manifest:
+            f.write(f"{output_dir}/{entry.name}\n")
+    # the exit file marks the end of the download whether it succeeded or not, it is
+    # removed in a step both the download and the conversion depend on so that the
+    # conversion never sees one left by an earlier run, a failed download resets that
+    # step so a rerun removes its exit file again
+    download_exit_file = f"{output_dir}/download.exit"
+    download_start_file = f"{output_dir}/download.start"
+    tgt = f"{download_start_file}.OK"
+    dep = ""
+    cmd = f"rm -f {download_exit_file}"
+    pg.add(tgt, dep, cmd)
 
-        # convert to fasta
-        gb2fasta = "/usr/local/cavstools-0.0.1/gb2fasta"
-        input_genbank_file = f"{output_dir}/{file_name}"
-        output_fasta_file = f"{output_dir}/{file_core}.fasta.gz"
-        log = f"{output_fasta_file}.err"
-        err = f"{output_fasta_file}.err"
-        dep = f"{input_genbank_file}.OK"
-        tgt = f"{output_fasta_file}.OK"
-        cmd = f"{gb2fasta} {input_genbank_file} -o {output_fasta_file} > {log} 2> {err}"
-        concat_fasta_file_list += f" {output_fasta_file}"
-        concat_fasta_file_OK_list += f" {output_fasta_file}.OK"
-        pg.add(tgt, dep, cmd)
+    log = f"{output_dir}/download.log"
+    err = f"{output_dir}/download.err"
+    tgt = f"{output_dir}/download.OK"
+    dep = f"{download_start_file}.OK"
+    cmd = (
+        f"{download} -i {url_file} -o {output_dir} -c 8 > {log} 2> {err}; "
+        f"status=$$?; touch {download_exit_file}; "
+        f"if [ $$status -ne 0 ]; then rm -f {download_start_file}.OK; fi; "
+        f"exit $$status"
+    )
+    pg.add(tgt, dep, cmd)
 
-    # combine into one file
+    # convert to a single BGZF fasta file with its headers as files finish downloading,
+    # giving up on a file missing once the download has ended
+    genbank2fasta = "/home/atks/programs/CAVS-pipelines/gen/genbank2fasta.py"
     output_fasta_file = f"{output_dir}/genbank.{release_number}.{database}.fasta.gz"
+    output_text_file = f"{output_dir}/genbank.{release_number}.{database}.id.txt"
+    log = f"{output_fasta_file}.log"
     err = f"{output_fasta_file}.err"
     tgt = f"{output_fasta_file}.OK"
-    dep = concat_fasta_file_OK_list
-    cmd = f"zcat {concat_fasta_file_list} | gzip > {output_fasta_file} 2> {err}"
+    dep = f"{download_start_file}.OK"
+    cmd = f"{genbank2fasta} -i {genbank_file_list} -o {output_fasta_file} -d {output_text_file} -t 8 -w 86400 -x {download_exit_file} > {log} 2> {err}"
     pg.add(tgt, dep, cmd)
 
-    # get headers
+    # index accessions for extracting sequences without decompressing the whole file
+    accession_index = "/home/atks/programs/CAVS-pipelines/gen/accession_index.py"
     input_fasta_file = f"{output_dir}/genbank.{release_number}.{database}.fasta.gz"
-    output_text_file = f"{output_dir}/genbank.{release_number}.{database}.id.txt"
-    log = f"{output_text_file}.log"
-    err = f"{output_text_file}.err"
-    tgt = f"{output_text_file}.OK"
+    output_index_file = f"{input_fasta_file}.acc.db"
+    log = f"{output_index_file}.log"
+    err = f"{output_index_file}.err"
+    tgt = f"{output_index_file}.OK"
     dep = f"{input_fasta_file}.OK"
-    cmd = f'zcat {input_fasta_file} | grep -P "^>" > {output_text_file} 2> {err}'
+    cmd = f"{accession_index} {input_fasta_file} > {log} 2> {err}"
     pg.add(tgt, dep, cmd)
 
-    # clean files
-    cmd = f"rm -fr {output_dir}/gbvrl*.gz  {output_dir}/*.OK {output_dir}/*.err {output_dir}/*.log"
+    # build k-mer index for primer and probe searches
+    if build_kmer_index:
+        kmer_index = "/home/atks/programs/CAVS-pipelines/gen/kmer_index.py"
+        input_fasta_file = f"{output_dir}/genbank.{release_number}.{database}.fasta.gz"
+        output_index_dir = f"{input_fasta_file}.k12.idx"
+        log = f"{output_index_dir}.log"
+        err = f"{output_index_dir}.err"
+        tgt = f"{output_index_dir}.OK"
+        dep = f"{input_fasta_file}.OK"
+        cmd = f"{kmer_index} {input_fasta_file} -k 12 -o {output_index_dir} > {log} 2> {err}"
+        pg.add(tgt, dep, cmd)
+
+    # clean files, the downloaded files are kept for the next release to hardlink from
+    # with --sync, delete them by hand once it is synced
+    cmd = f"rm -fr {output_dir}/*.OK {output_dir}/*.err {output_dir}/*.log {download_exit_file}"
     pg.add_clean(cmd)
 
     # write make file
     print("Writing pipeline")
     pg.write()
+    print(f"run with make -f {make_file} -j 2 to convert files while they download")
 
 
 class PipelineGenerator(object):
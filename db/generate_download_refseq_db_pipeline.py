@@ -22,9 +22,11 @@ import os
 import gzip
 import sys
 import click
-import re
 import subprocess
 
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../gen")
+from release_sync import find_previous_release, sync_release, write_url_file
+
 
 @click.command()
 @click.option(
@@ -44,7 +46,13 @@ import subprocess
     show_default=True,
     help="output directory, database files will be downloaded to <out_dir>/<db_release>/<db>",
 )
-def main(make_file, database, output_directory):
+@click.option(
+    "-s",
+    "--sync",
+    is_flag=True,
+    help="hardlink files unchanged since the previous release instead of downloading them",
+)
+def main(make_file, database, output_directory, sync):
     """
     generate_download_refseq_db_pipeline -d viral
 
@@ -84,11 +92,8 @@ def main(make_file, database, output_directory):
     print("\t{0:<20} :   {1:<10}".format("make_file", make_file))
     print("\t{0:<20} :   {1:<10}".format("database", database))
     print("\t{0:<20} :   {1:<10}".format("output_directory", output_directory))
+    print("\t{0:<20} :   {1:<10}".format("sync", str(sync)))
     print("\n")
-    print(
-        "Please invoked pipeline with not more than 8 jobs running concurrently due to NCBI restrictions"
-    )
-    print("i.e. make -f download_refseq.mk -j 8 -k")
 
     release_number = subprocess.run(
         ["curl", f"https://ftp.ncbi.nlm.nih.gov/refseq/release/RELEASE_NUMBER"],
@@ -104,46 +109,61 @@ def main(make_file, database, output_directory):
     except OSError as error:
         print(f"Directory {output_dir} cannot be created")
 
-    # get listing of files to download
+    # get listing of files to download, with a manifest to sync the next release
+    previous_dir = None
+    if sync:
+        previous_dir = find_previous_release(output_directory, release_number, database)
+        if previous_dir is None:
+            print("No previous release with a manifest to sync from")
+        else:
+            print(f"Syncing from {previous_dir}")
     print("Getting directory listings")
-    out = subprocess.run(
-        ["curl", f"https://ftp.ncbi.nlm.nih.gov/refseq/release/{database}/"],
-        text=True,
-        capture_output=True,
+    manifest, download_files = sync_release(
+        f"https://ftp.ncbi.nlm.nih.gov/refseq/release/{database}/",
+        r"genomic\.fna\.gz$",
+        output_dir,
+        previous_dir,
     )
 
-    files = []
-    for line in out.stdout.splitlines():
-        m = re.search(">(.+genomic.fna.gz)<", line)
-        if m != None:
-            files.append(m.group(1))
-
-    print(f"Downloading {len(files)} files.")
+    print(f"Downloading {len(download_files)} of {len(manifest)} files.")
 
     # generate make file
     print("Generating pipeline")
     pg = PipelineGenerator(make_file)
 
-    concat_file_list = ""
-    concat_file_OK_list = ""
-
-    # download each file
-    for file_name in files:
-        err = f"{output_dir}/{file_name}.err"
-        tgt = f"{output_dir}/{file_name}.OK"
-        dep = ""
-        cmd = f"wget -c https://ftp.ncbi.nlm.nih.gov/refseq/release/{database}/{file_name} -P {output_dir} 2> {err}"
-        concat_file_list += f" {output_dir}/{file_name}"
-        concat_file_OK_list += f" {output_dir}/{file_name}.OK"
-        pg.add(tgt, dep, cmd)
+    # download all files concurrently within NCBI's connection limit, verifying the
+    # md5 in the manifest, files already linked from the previous release are skipped
+    download = "/home/atks/programs/CAVS-pipelines/gen/download.py"
+    url_file = f"{output_dir}/download_urls.txt"
+    write_url_file(
+        url_file, f"https://ftp.ncbi.nlm.nih.gov/refseq/release/{database}/", manifest
+    )
+    log = f"{output_dir}/download.log"
+    err = f"{output_dir}/download.err"
+    tgt = f"{output_dir}/download.OK"
+    dep = ""
+    cmd = f"{download} -i {url_file} -o {output_dir} -c 8 > {log} 2> {err}"
+    pg.add(tgt, dep, cmd)
 
-    # combine into one file
+    # combine into one BGZF file for random access
+    bgzf = "/home/atks/programs/CAVS-pipelines/gen/bgzf.py"
     output_file = f"{output_dir}/refseq.{release_number}.{database}.fasta.gz"
     err = f"{output_file}.err"
     tgt = f"{output_file}.OK"
-    dep = concat_file_OK_list
+    dep = f"{output_dir}/download.OK"
     # using wild card for FASTA files here because the list can be too long resulting in a failure
-    cmd = f"cd {output_dir}; gunzip -c *.fna.gz | gzip > {output_file} 2> {err}"
+    cmd = f"cd {output_dir}; gunzip -c *.fna.gz | {bgzf} -o {output_file} 2> {err}"
+    pg.add(tgt, dep, cmd)
+
+    # index accessions for extracting sequences without decompressing the whole file
+    accession_index = "/home/atks/programs/CAVS-pipelines/gen/accession_index.py"
+    input_file = f"{output_dir}/refseq.{release_number}.{database}.fasta.gz"
+    output_file = f"{input_file}.acc.db"
+    log = f"{output_file}.log"
+    err = f"{output_file}.err"
+    tgt = f"{output_file}.OK"
+    dep = f"{input_file}.OK"
+    cmd = f"{accession_index} {input_file} > {log} 2> {err}"
     pg.add(tgt, dep, cmd)
 
     # get headers
@@ -155,8 +175,9 @@ def main(make_file, database, output_directory):
     cmd = f'gunzip -c {input_file} | grep -P "^>" > {output_file} 2> {err}'
     pg.add(tgt, dep, cmd)
 
-    # clean files
-    cmd = f"rm {output_dir}/*.fna.gz  {output_dir}/*.OK {output_dir}/*.err"
+    # clean files, the downloaded files are kept for the next release to hardlink from
+    # with --sync, delete them by hand once it is synced
+    cmd = f"rm -f {output_dir}/*.OK {output_dir}/*.err {output_dir}/*.log"
     pg.add_clean(cmd)
 
     # write make file
@@ -75,16 +75,40 @@ def main(make_file, output_dir):
     print("Generating pipeline")
     pg = PipelineGenerator(make_file)
 
-    # download
+    # md5 of the release file for verifying the download
+    metalink = subprocess.run(
+        [
+            "curl",
+            f"https://ftp.uniprot.org/pub/databases/uniprot/uniref/uniref90/RELEASE.metalink",
+        ],
+        text=True,
+        capture_output=True,
+    ).stdout
+    m = re.search(
+        r'<file name="uniref90.fasta.gz">.*?<hash type="md5">(\w+)</hash>',
+        metalink,
+        re.DOTALL,
+    )
+    md5 = m.group(1) if m is not None else ""
+    if md5 == "":
+        print("md5 of uniref90.fasta.gz not found, download will not be verified")
+
+    # download in concurrent byte ranges
+    download = "/home/atks/programs/CAVS-pipelines/gen/download.py"
     input_fasta_file = (
-        "https://ftp.uniprot.org/pub/databases/uniprot/uniref/uniref90/uniref90.fasta"
+        "https://ftp.uniprot.org/pub/databases/uniprot/uniref/uniref90/uniref90.fasta.gz"
     )
-    output_uniprot_file = f"uniref90.{release_number}.fasta.gz"
+    output_uniprot_file = f"{output_dir}/uniref90.{release_number}.fasta.gz"
+    url_file = f"{output_uniprot_file}.url.txt"
+    with open(url_file, "w") as f:
+        f.write(
+            f"{input_fasta_file}\t{os.path.basename(output_uniprot_file)}\t{md5}\n"
+        )
     log = f"{output_uniprot_file}.log"
     err = f"{output_uniprot_file}.err"
     dep = ""
     tgt = f"{output_uniprot_file}.OK"
-    cmd = f"wget -c {input_fasta_file} -P {output_dir} -O {output_uniprot_file} > {log} 2> {err}"
+    cmd = f"{download} -i {url_file} -o {output_dir} -s 8 > {log} 2> {err}"
     pg.add(tgt, dep, cmd)
 
     # clean files
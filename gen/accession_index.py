@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import click
+import sqlite3
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from bgzf import BgzfReader, make_virtual_offset, read_blocks
+
+# sequences inserted per transaction when building an index
+BATCH_SIZE = 10000
+
+
+@click.command()
+@click.argument("fasta_file")
+@click.argument("accessions", nargs=-1)
+@click.option(
+    "-i",
+    "--accession_file",
+    default=None,
+    help="file of accessions to extract, one per line",
+)
+@click.option("-o", "--output_file", default=None, help="output fasta file")
+def main(fasta_file, accessions, accession_file, output_file):
+    """
+    Indexes the accessions of a BGZF compressed fasta file and extracts sequences
+    by accession, with or without the version.
+
+    The index maps each accession to the virtual offset of its record, its length and
+    description, so only the blocks holding the extracted sequences are decompressed.
+    Without accessions, the index is built if it is missing or out of date.
+
+    e.g. accession_index.py genbank.260.vrl.fasta.gz -i panel.txt -o panel.fasta
+         accession_index.py refseq.226.viral.fasta.gz NC_001477
+    """
+    accessions = list(accessions)
+    if accession_file is not None:
+        with open(accession_file, "r") as f:
+            accessions.extend(line.strip() for line in f if line.strip() != "")
+
+    with AccessionIndex(fasta_file) as index:
+        if len(accessions) == 0:
+            print(f"{index.get_no_sequences()} sequences indexed in {index.index_file}")
+            return
+        out = open(output_file, "wb") if output_file else sys.stdout.buffer
+        entries, missing = index.lookup(accessions)
+        for header, seq in index.extract(entries):
+            out.write(header)
+            out.write(seq)
+        if output_file:
+            out.close()
+        else:
+            out.flush()
+    print(f"{len(entries)} sequences extracted", file=sys.stderr)
+    if len(missing) > 0:
+        print(f"{len(missing)} accessions not found", file=sys.stderr)
+        for accession in missing:
+            print(f"not found {accession}", file=sys.stderr)
+        sys.exit(1)
+
+
+class IndexEntry(object):
+    def __init__(self, name, offset, length, size, desc):
+        self.name = name
+        self.offset = offset
+        self.length = length
+        self.size = size
+        self.desc = desc
+
+
+class AccessionIndex(object):
+    """
+    SQLite index of the records of a BGZF fasta file, built next to the fasta file.
+
+    Each record is stored with the virtual offset of its header line, the number of
+    bases and the number of bytes of its sequence lines.
+    """
+
+    def __init__(self, fasta_file, index_file=None):
+        self.fasta_file = fasta_file
+        self.index_file = index_file or f"{fasta_file}.acc.db"
+        if not os.path.exists(self.index_file) or os.path.getmtime(
+            self.index_file
+        ) < os.path.getmtime(fasta_file):
+            build_index(fasta_file, self.index_file)
+        self.db = sqlite3.connect(self.index_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def get_no_sequences(self):
+        return self.db.execute("SELECT COUNT(*) FROM sequences").fetchone()[0]
+
+    def get(self, accession):
+        """
+        Returns the IndexEntry of an accession, the first version in the file if the
+        version is not given, None if not found.
+        """
+        row = self.db.execute(
+            "SELECT name, offset, length, size, desc FROM sequences WHERE name = ?",
+            (accession,),
+        ).fetchone()
+        if row is None:
+            row = self.db.execute(
+                "SELECT name, offset, length, size, desc FROM sequences "
+                "WHERE accession = ? ORDER BY offset LIMIT 1",
+                (accession,),
+            ).fetchone()
+        return IndexEntry(*row) if row is not None else None
+
+    def lookup(self, accessions):
+        """
+        Returns the IndexEntries of the accessions found and the accessions not found.
+        """
+        entries = []
+        missing = []
+        for accession in accessions:
+            entry = self.get(accession)
+            if entry is None:
+                missing.append(accession)
+            else:
+                entries.append(entry)
+        return entries, missing
+
+    def extract(self, entries):
+        """
+        Yields the header line and sequence lines of each entry as stored in the fasta
+        file, records are read in file order so each block is decompressed once.
+        """
+        with BgzfReader(self.fasta_file) as reader:
+            for entry in sorted(entries, key=lambda entry: entry.offset):
+                reader.seek(entry.offset)
+                header = reader.readline()
+                yield header, reader.read(entry.size)
+
+
+def get_accession(name):
+    """
+    Returns a sequence name without its version.
+    """
+    accession, _, version = name.rpartition(".")
+    return accession if accession and version.isdigit() else name
+
+
+def build_index(fasta_file, index_file):
+    """
+    Indexes the records of a BGZF fasta file in a single pass over its blocks, the
+    index is written to a temporary file that is moved into place at the end.
+    """
+    tmp_index_file = f"{index_file}.tmp"
+    if os.path.exists(tmp_index_file):
+        os.remove(tmp_index_file)
+    db = sqlite3.connect(tmp_index_file)
+    db.execute(
+        "CREATE TABLE sequences (name TEXT PRIMARY KEY, accession TEXT, "
+        "offset INTEGER, length INTEGER, size INTEGER, desc TEXT)"
+    )
+    batch = []
+    for entry in scan_records(fasta_file):
+        batch.append(
+            (
+                entry.name,
+                get_accession(entry.name),
+                entry.offset,
+                entry.length,
+                entry.size,
+                entry.desc,
+            )
+        )
+        if len(batch) == BATCH_SIZE:
+            insert_entries(db, batch)
+            batch = []
+    insert_entries(db, batch)
+    db.execute("CREATE INDEX sequences_accession ON sequences (accession)")
+    db.commit()
+    db.close()
+    os.replace(tmp_index_file, index_file)
+
+
+def insert_entries(db, batch):
+    # a duplicate name keeps its first record, as with samtools faidx
+    with db:
+        db.executemany(
+            "INSERT OR IGNORE INTO sequences VALUES (?, ?, ?, ?, ?, ?)", batch
+        )
+
+
+def scan_records(fasta_file):
+    """
+    Yields an IndexEntry for each record of a BGZF fasta file.
+
+    Only header lines are parsed, sequence lines are measured a block at a time.
+    """
+    entry = None
+    header = None
+    for block_offset, data in read_blocks(fasta_file):
+        pos = 0
+        while pos < len(data):
+            if header is not None:
+                end = data.find(b"\n", pos)
+                if end == -1:
+                    header.append(data[pos:])
+                    break
+                header.append(data[pos:end])
+                set_header(entry, header)
+                header = None
+                pos = end + 1
+            start = data.find(b">", pos)
+            end = start if start != -1 else len(data)
+            if entry is not None:
+                entry.size += end - pos
+                entry.length += (
+                    end - pos - data.count(b"\n", pos, end) - data.count(b"\r", pos, end)
+                )
+            if start == -1:
+                break
+            if entry is not None:
+                yield entry
+            entry = IndexEntry(None, make_virtual_offset(block_offset, start), 0, 0, None)
+            header = []
+            pos = start + 1
+    if entry is not None:
+        if header is not None:
+            set_header(entry, header)
+        yield entry
+
+
+def set_header(entry, header):
+    entry.desc = b"".join(header).decode().rstrip("\r")
+    words = entry.desc.split()
+    entry.name = words[0] if len(words) > 0 else ""
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
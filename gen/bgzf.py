@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import click
+import struct
+import zlib
+
+# Blocked gzip as used by samtools and tabix.
+#
+# A BGZF file is a series of gzip members of at most 64KB each, so it can be read
+# by any gzip reader and BGZF files can be concatenated by appending their blocks.
+# A position in the uncompressed data is addressed by a virtual offset, the file
+# offset of its block shifted left by 16 bits plus the offset within the block.
+
+# uncompressed bytes per block, as in htslib, so that a compressed block always fits
+BLOCK_SIZE = 0xFF00
+
+# empty block that marks the end of a BGZF file
+EOF_BLOCK = bytes.fromhex(
+    "1f8b08040000000000ff0600424302001b0003000000000000000000"
+)
+
+
+@click.command()
+@click.argument("input_file", required=False)
+@click.option("-o", "--output_file", required=True, help="output BGZF file")
+@click.option("-l", "--level", default=6, show_default=True, help="compression level")
+def main(input_file, output_file, level):
+    """
+    Compresses a file or stdin to BGZF for random access by virtual offset.
+
+    e.g. gunzip -c *.fna.gz | bgzf.py -o refseq.226.viral.fasta.gz
+    """
+    input = open(input_file, "rb") if input_file is not None else sys.stdin.buffer
+    with BgzfWriter(output_file, level) as out:
+        for data in iter(lambda: input.read(1 << 20), b""):
+            out.write(data)
+    input.close()
+
+
+def compress_block(data, level=6):
+    """
+    Returns a BGZF block of at most BLOCK_SIZE bytes of data.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    header = struct.pack(
+        "<BBBBIBBHBBHH",
+        0x1F,
+        0x8B,
+        8,
+        4,
+        0,
+        0,
+        0xFF,
+        6,
+        ord("B"),
+        ord("C"),
+        2,
+        len(deflated) + 25,
+    )
+    return header + deflated + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+def make_virtual_offset(block_offset, within_block_offset):
+    return block_offset << 16 | within_block_offset
+
+
+def split_virtual_offset(virtual_offset):
+    return virtual_offset >> 16, virtual_offset & 0xFFFF
+
+
+class BgzfWriter(object):
+    """
+    Writes data to a BGZF file a block at a time.
+    """
+
+    def __init__(self, file, level=6, eof=True):
+        self.file = open(file, "wb") if isinstance(file, str) else file
+        self.level = level
+        self.eof = eof
+        self.buffer = bytearray()
+        self.block_offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_SIZE:
+            self.flush_block(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+
+    def tell(self):
+        """
+        Returns the virtual offset of the next byte written.
+        """
+        return make_virtual_offset(self.block_offset, len(self.buffer))
+
+    def flush_block(self, data):
+        block = compress_block(data, self.level)
+        self.file.write(block)
+        self.block_offset += len(block)
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self.flush_block(bytes(self.buffer))
+            self.buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        if self.eof:
+            self.file.write(EOF_BLOCK)
+        self.file.close()
+
+
+def read_block_size(file):
+    """
+    Reads the header of the block at the current position of an open file and returns
+    the compressed size of the block and the length of its header, None at the end of
+    the file.
+    """
+    header = file.read(12)
+    if len(header) == 0:
+        return None
+    if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04":
+        raise ValueError(f"{file.name} is not a BGZF file")
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = file.read(xlen)
+    i = 0
+    while i + 4 <= xlen:
+        length = struct.unpack("<H", extra[i + 2 : i + 4])[0]
+        if extra[i : i + 2] == b"BC":
+            return struct.unpack("<H", extra[i + 4 : i + 6])[0] + 1, 12 + xlen
+        i += 4 + length
+    raise ValueError(f"{file.name} is not a BGZF file")
+
+
+def read_block(file):
+    """
+    Returns the uncompressed data and the compressed size of the block at the current
+    position of an open file, None at the end of the file.
+    """
+    sizes = read_block_size(file)
+    if sizes is None:
+        return None
+    block_size, header_size = sizes
+    rest = file.read(block_size - header_size)
+    return zlib.decompress(rest[:-8], -15), block_size
+
+
+def read_block_offsets(file):
+    """
+    Returns the file offsets of the blocks of a BGZF file, only the block headers are
+    read.
+    """
+    offsets = []
+    with open(file, "rb") as f:
+        offset = 0
+        while True:
+            f.seek(offset)
+            sizes = read_block_size(f)
+            if sizes is None:
+                break
+            offsets.append(offset)
+            offset += sizes[0]
+    return offsets
+
+
+def is_bgzf(file):
+    with open(file, "rb") as f:
+        try:
+            return read_block_size(f) is not None
+        except ValueError:
+            return False
+
+
+def read_blocks(file):
+    """
+    Yields the file offset and uncompressed data of each block of a BGZF file.
+    """
+    with open(file, "rb") as f:
+        offset = 0
+        while True:
+            block = read_block(f)
+            if block is None:
+                break
+            data, block_size = block
+            yield offset, data
+            offset += block_size
+
+
+class BgzfReader(object):
+    """
+    Reads a BGZF file from virtual offsets, only the blocks read are decompressed.
+    Empty blocks, such as the EOF blocks of concatenated BGZF files, are skipped and
+    reading stops only at the end of the file.
+    """
+
+    def __init__(self, file):
+        self.file = open(file, "rb")
+        self.block_offset = -1
+        self.next_block_offset = 0
+        self.data = b""
+        self.pos = 0
+        self.eof = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def load_block(self, offset):
+        self.file.seek(offset)
+        block = read_block(self.file)
+        self.block_offset = offset
+        self.eof = block is None
+        if block is None:
+            self.data, self.next_block_offset = b"", offset
+        else:
+            self.data, block_size = block
+            self.next_block_offset = offset + block_size
+        self.pos = 0
+
+    def seek(self, virtual_offset):
+        block_offset, within_block_offset = split_virtual_offset(virtual_offset)
+        if block_offset != self.block_offset:
+            self.load_block(block_offset)
+        self.pos = within_block_offset
+
+    def readline(self):
+        """
+        Returns the next line including its newline, an empty bytes at the end.
+        """
+        parts = []
+        while True:
+            end = self.data.find(b"\n", self.pos)
+            if end != -1:
+                parts.append(self.data[self.pos : end + 1])
+                self.pos = end + 1
+                break
+            parts.append(self.data[self.pos :])
+            if self.eof:
+                break
+            self.load_block(self.next_block_offset)
+        return b"".join(parts)
+
+    def read(self, size):
+        """
+        Returns the next size bytes, fewer at the end.
+        """
+        parts = []
+        while size > 0:
+            part = self.data[self.pos : self.pos + size]
+            parts.append(part)
+            self.pos += len(part)
+            size -= len(part)
+            if size > 0:
+                if self.eof:
+                    break
+                self.load_block(self.next_block_offset)
+        return b"".join(parts)
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import fcntl
+import shutil
+import hashlib
+import tempfile
+
+# Helpers shared by the caches of indices, databases, records and metadata.
+#
+# A cache can be shared between users and projects by pointing its environment
+# variable to a common directory.  Cache files are created with the permissions the
+# umask allows, so the users sharing a cache need a common group, a umask of 002 and
+# a top directory with the setgid bit set for new directories to keep the group, e.g.
+#
+#   mkdir /data/cavspipes && chgrp cavs /data/cavspipes && chmod 2775 /data/cavspipes
+
+
+def get_default_cache_path(variable, name):
+    """
+    Returns the cache path set in an environment variable, by default name in the
+    user's cache directory.
+    """
+    return os.environ.get(variable, os.path.expanduser(f"~/.cache/cavspipes/{name}"))
+
+
+class FileLock(object):
+    """
+    Exclusive lock on a lock file, held within a with block.  The lock file is opened
+    for appending so that a lock file created by another user of the group can be
+    locked without truncating it.
+    """
+
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self.file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_file)), exist_ok=True)
+        self.file = open(self.lock_file, "a")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def build_once(entry_dir, ok_file, build):
+    """
+    Builds a cache entry unless its OK file exists.  build is called with a temporary
+    directory in the entry under an exclusive lock and moves its output into place,
+    the OK file is written after it returns with the text it returns, so a present OK
+    file implies a complete entry.  Concurrent builders wait for the first to finish.
+    """
+    if os.path.exists(ok_file):
+        return
+    with FileLock(f"{entry_dir}/.lock"):
+        # someone else built it while we were waiting
+        if os.path.exists(ok_file):
+            return
+        tmp_dir = tempfile.mkdtemp(dir=entry_dir, prefix=".build.")
+        try:
+            text = build(tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        with open(ok_file, "w") as f:
+            f.write(text or "")
+
+
+def write_atomically(file, data):
+    """
+    Writes data to a temporary file moved into place, created with the permissions
+    the umask allows like any other cache file.
+    """
+    directory = os.path.dirname(os.path.abspath(file))
+    os.makedirs(directory, exist_ok=True)
+    tmp_file = f"{directory}/.{os.path.basename(file)}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def compute_file_hash(file):
+    sha256 = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_file_hash(file, hash_dir):
+    """
+    Returns the sha256 of a file, remembered in hash_dir by path, size and
+    modification time as hashing a large fasta file takes minutes.
+    """
+    path = os.path.abspath(file)
+    stat = os.stat(path)
+    key = hashlib.sha256(path.encode()).hexdigest()
+    hash_file = f"{hash_dir}/{key}"
+    signature = f"{path}\t{stat.st_size}\t{stat.st_mtime}"
+    if os.path.exists(hash_file):
+        with open(hash_file, "r") as f:
+            cached_signature, _, digest = f.read().rstrip("\n").rpartition("\t")
+        if cached_signature == signature:
+            return digest
+    digest = compute_file_hash(path)
+    write_atomically(hash_file, f"{signature}\t{digest}\n".encode())
+    return digest
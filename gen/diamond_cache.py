@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import re
+import sys
+import click
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from cache_util import build_once, get_default_cache_path, get_file_hash
+
+DEFAULT_CACHE_DIR = get_default_cache_path("CAVSPIPES_DIAMOND_CACHE", "diamond")
+
+
+@click.command()
+@click.argument("protein_fasta_file")
+@click.option(
+    "-r",
+    "--release",
+    default=None,
+    help="database release, taken from a file name like uniref90.2024_02.fasta.gz by default",
+)
+@click.option(
+    "-t",
+    "--threads",
+    default=os.cpu_count(),
+    show_default=True,
+    help="number of threads to build the database with",
+)
+@click.option(
+    "-c",
+    "--cache_dir",
+    default=DEFAULT_CACHE_DIR,
+    show_default=True,
+    help="DIAMOND database cache directory",
+)
+@click.option(
+    "-o",
+    "--output_file",
+    default=None,
+    help="symlink the cached .dmnd database to this file",
+)
+def main(protein_fasta_file, release, threads, cache_dir, output_file):
+    """
+    Builds a DIAMOND database of a protein fasta file in a shared cache keyed by the
+    database release and file content.
+
+    The database is built only once for a release regardless of the path of the
+    fasta file, concurrent invocations wait for the first to finish.  The cached
+    database path is printed out.
+
+    e.g. diamond_cache.py uniref90.2024_02.fasta.gz -t 32 -o out/nr.dmnd
+    """
+    cache = DiamondCache(cache_dir)
+    if output_file is not None:
+        db = cache.link_db(protein_fasta_file, output_file, release, threads)
+    else:
+        db = cache.get_db(protein_fasta_file, release, threads)
+    print(db)
+
+
+class DiamondCache(object):
+    # programs
+    diamond = "/usr/local/diamond-2.0.11/diamond"
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = os.path.abspath(cache_dir)
+
+    def get_entry_dir(self, fasta_file, release=None):
+        release = release or get_release(fasta_file)
+        digest = get_file_hash(fasta_file, f"{self.cache_dir}/hashes")
+        return f"{self.cache_dir}/{release}/{digest[:16]}"
+
+    def get_db(self, fasta_file, release=None, threads=os.cpu_count()):
+        """
+        Returns the path to the cached .dmnd database, building it if it does not
+        exist yet.
+
+        The database is built in a temporary directory under an exclusive lock and
+        moved into place before the OK file is written, so a present OK file implies a
+        complete database.
+        """
+        entry_dir = self.get_entry_dir(fasta_file, release)
+        db = f"{entry_dir}/db.dmnd"
+        ok_file = f"{entry_dir}/db.OK"
+
+        build_once(
+            entry_dir,
+            ok_file,
+            lambda tmp_dir: self.build_db(fasta_file, db, tmp_dir, threads),
+        )
+        return db
+
+    def build_db(self, fasta_file, db, tmp_dir, threads):
+        """
+        Builds the database of a fasta file in tmp_dir and moves it to db, returns the
+        fasta file path recorded in the OK file.
+        """
+        fasta_file = os.path.abspath(fasta_file)
+        cmd = (
+            f"{self.diamond} makedb --in {fasta_file} -d {tmp_dir}/db "
+            f"--threads {threads}"
+        )
+        # stderr is passed through so a failed build can be diagnosed
+        subprocess.run(cmd, shell=True, check=True, stdout=subprocess.DEVNULL)
+        os.replace(f"{tmp_dir}/db.dmnd", db)
+        return f"{fasta_file}\n"
+
+    def link_db(self, fasta_file, output_file, release=None, threads=os.cpu_count()):
+        """
+        Symlinks the cached database to output_file so that a pipeline can refer to it
+        at a path of its own.  Returns the cached database path.
+        """
+        db = self.get_db(fasta_file, release, threads)
+        if os.path.lexists(output_file):
+            os.remove(output_file)
+        os.symlink(db, output_file)
+        return db
+
+
+def get_release(fasta_file):
+    """
+    Returns the release in a UniRef file name, e.g. 2024_02 of uniref90.2024_02.fasta.gz.
+    """
+    m = re.search(r"\.(\d{4}_\d{2})\.", os.path.basename(fasta_file))
+    return m.group(1) if m is not None else "unknown_release"
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,623 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import click
+import hashlib
+import random
+import re
+import threading
+import time
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+# Concurrent HTTP(S) download manager.
+#
+# Files are downloaded by a pool of threads that each keep one persistent
+# connection per host.  Every host has a politeness limiter that caps the number
+# of concurrent requests and spaces out their starts, so the pool can be sized for
+# bandwidth without exceeding a server's limits, e.g. NCBI asks for no more than
+# 8 concurrent connections.  Downloads are written to a .part file that is resumed
+# with a range request after a failure and renamed into place when complete, so a
+# file that exists is complete.
+#
+# A very large file can be split into byte ranges that are downloaded concurrently
+# into a preallocated .part file.  The progress of each range is recorded in a
+# .part.segments file so that each range is resumed where it stopped.
+
+# bytes read from a response at a time
+CHUNK_SIZE = 1 << 20
+
+# responses worth retrying
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+
+# smallest byte range a file is split into
+MIN_SEGMENT_SIZE = 64 << 20
+
+# seconds between saves of the progress of a segmented download
+SAVE_INTERVAL = 5
+
+
+@click.command()
+@click.argument("urls", nargs=-1)
+@click.option(
+    "-i",
+    "--url_file",
+    default=None,
+    help="file of URLs, one per line, optionally followed by tab separated output file name and md5",
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    default=os.getcwd(),
+    show_default=True,
+    help="output directory",
+)
+@click.option(
+    "-c",
+    "--connections",
+    default=8,
+    show_default=True,
+    help="maximum concurrent connections to a host",
+)
+@click.option(
+    "-r",
+    "--rate",
+    default=3.0,
+    show_default=True,
+    help="maximum requests started per second to a host",
+)
+@click.option(
+    "-n",
+    "--retries",
+    default=5,
+    show_default=True,
+    help="number of retries of a failed download",
+)
+@click.option(
+    "-s",
+    "--segments",
+    default=1,
+    show_default=True,
+    help="number of byte ranges a large file is downloaded in concurrently",
+)
+def main(urls, url_file, output_dir, connections, rate, retries, segments):
+    """
+    Downloads files concurrently within per host connection and request rate limits.
+
+    Partial downloads are resumed, failures are retried with exponential backoff and
+    progress is reported on stderr.  Files with a md5 given are verified.  Exits with
+    an error if any file fails.
+
+    e.g. download.py -i urls.txt -o /home/atks/downloads/260/vrl -c 8
+         download.py https://ftp.ncbi.nlm.nih.gov/genbank/gbvrl1.seq.gz
+         download.py -s 8 https://ftp.uniprot.org/pub/databases/uniprot/uniref/uniref90/uniref90.fasta.gz
+    """
+    jobs = []
+    if url_file is not None:
+        jobs.extend(read_url_file(url_file))
+    jobs.extend((url, get_file_name(url), "") for url in urls)
+    if len(jobs) == 0:
+        exit("no URLs to download")
+
+    os.makedirs(output_dir, exist_ok=True)
+    downloader = Downloader(connections, rate, retries, segments=segments)
+    failed = downloader.download_all(
+        [(url, f"{output_dir}/{file_name}", md5) for url, file_name, md5 in jobs]
+    )
+    if len(failed) > 0:
+        for url, error in failed:
+            print(f"failed {url} : {error}", file=sys.stderr)
+        sys.exit(1)
+
+
+class DownloadError(Exception):
+    def __init__(self, msg, retry=True, retry_after=None):
+        super().__init__(msg)
+        self.retry = retry
+        self.retry_after = retry_after
+
+
+class HostLimiter(object):
+    """
+    Caps the concurrent requests to a host and spaces out the start of requests.
+    """
+
+    def __init__(self, connections, rate):
+        self.semaphore = threading.BoundedSemaphore(connections)
+        self.interval = 1 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_start = 0
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        time.sleep(start - now)
+        return self
+
+    def __exit__(self, *args):
+        self.semaphore.release()
+
+
+class Progress(object):
+    """
+    Thread safe download counters reported on stderr at regular intervals.
+    """
+
+    def __init__(self, no_files, interval=10):
+        self.no_files = no_files
+        self.interval = interval
+        self.no_done = 0
+        self.no_failed = 0
+        self.no_bytes = 0
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.reporter = threading.Thread(target=self.report_periodically, daemon=True)
+
+    def __enter__(self):
+        self.reporter.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.reporter.join()
+        self.report()
+
+    def add_bytes(self, n):
+        with self.lock:
+            self.no_bytes += n
+
+    def add_file(self, ok):
+        with self.lock:
+            if ok:
+                self.no_done += 1
+            else:
+                self.no_failed += 1
+
+    def report_periodically(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.start
+            mb = self.no_bytes / (1 << 20)
+            rate = mb / elapsed if elapsed > 0 else 0
+            print(
+                f"{self.no_done}/{self.no_files} files downloaded, {self.no_failed} failed, "
+                f"{mb:.1f} MB in {elapsed:.0f}s ({rate:.2f} MB/s)",
+                file=sys.stderr,
+                flush=True,
+            )
+
+
+class Downloader(object):
+    def __init__(
+        self,
+        connections=8,
+        rate=3.0,
+        retries=5,
+        backoff=2,
+        max_backoff=120,
+        segments=1,
+    ):
+        self.connections = connections
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.segments = segments
+        self.limiters = dict()
+        self.limiters_lock = threading.Lock()
+        self.local = threading.local()
+        self.progress = Progress(0)
+
+    def download_all(self, jobs, threads=None):
+        """
+        Downloads a list of (url, file) or (url, file, md5) and returns the (url, error)
+        of the failures.
+        """
+        failed = []
+        with Progress(len(jobs)) as self.progress:
+            with ThreadPoolExecutor(threads or self.connections) as executor:
+                for (url, file, *_), error in zip(
+                    jobs, executor.map(lambda job: self.try_download(*job), jobs)
+                ):
+                    if error is not None:
+                        failed.append((url, error))
+        return failed
+
+    def try_download(self, url, file, md5=""):
+        try:
+            self.download(url, file, md5)
+            self.progress.add_file(True)
+            return None
+        except Exception as e:
+            self.progress.add_file(False)
+            return str(e)
+
+    def download(self, url, file, md5=""):
+        """
+        Downloads url to file resuming any partial download, retries with exponential
+        backoff and jitter.  A large file is downloaded in segments if the server
+        supports range requests.
+        """
+        if os.path.exists(file):
+            return
+        part_file = f"{file}.part"
+        head = self.retry(url, self.head, url) if self.segments > 1 else None
+        if head is not None and head[1] is not None and head[2] and (
+            os.path.exists(f"{part_file}.segments") or head[1] >= 2 * MIN_SEGMENT_SIZE
+        ):
+            SegmentedDownload(self, head[0], part_file, head[1], head[3]).run()
+        else:
+            self.retry(url, self.fetch, url, part_file)
+        if md5:
+            verify_md5(part_file, md5)
+        os.replace(part_file, file)
+
+    def head(self, url):
+        """
+        Returns the final URL after redirects, size, range support and validator of a
+        remote file.
+        """
+        for i in range(MAX_REDIRECTS + 1):
+            with self.get_limiter(url):
+                response = self.request(url, {}, "HEAD")
+                response.read()
+            if response.status in REDIRECT_STATUSES:
+                url = urljoin(url, response.getheader("Location"))
+                continue
+            if response.status in RETRY_STATUSES:
+                raise DownloadError(f"{url} returned {response.status}")
+            if response.status != 200:
+                raise DownloadError(f"{url} returned {response.status}", retry=False)
+            size = response.getheader("Content-Length")
+            ranges = response.getheader("Accept-Ranges", "").lower() == "bytes"
+            validator = response.getheader("ETag") or response.getheader(
+                "Last-Modified", ""
+            )
+            return url, int(size) if size is not None else None, ranges, validator
+        raise DownloadError(f"{url} redirected too many times", retry=False)
+
+    def retry(self, url, function, *args):
+        """
+        Returns function(*args), retried with exponential backoff and jitter after
+        connection and retryable HTTP errors.
+        """
+        attempt = 0
+        while True:
+            try:
+                return function(*args)
+            except (OSError, http.client.HTTPException, DownloadError) as e:
+                self.close_connection(url)
+                retry = getattr(e, "retry", True)
+                if not retry or attempt >= self.retries:
+                    raise
+                delay = getattr(e, "retry_after", None)
+                if delay is None:
+                    delay = min(self.max_backoff, self.backoff * 2**attempt)
+                    delay *= 1 + random.random() / 2
+                print(f"retrying {url} in {delay:.0f}s : {e}", file=sys.stderr)
+                time.sleep(delay)
+                attempt += 1
+
+    def fetch(self, url, part_file):
+        """
+        Appends the rest of url to part_file with a range request.
+        """
+        for i in range(MAX_REDIRECTS + 1):
+            offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+            with self.get_limiter(url):
+                response = self.request(url, headers)
+                if response.status in REDIRECT_STATUSES:
+                    response.read()
+                    url = urljoin(url, response.getheader("Location"))
+                    continue
+                if response.status == 416:
+                    # nothing left to fetch if the part file is already complete
+                    response.read()
+                    total = response.getheader("Content-Range", "").split("/")[-1]
+                    if total.isdigit() and int(total) == offset:
+                        return
+                    os.remove(part_file)
+                    raise DownloadError(f"{url} range not satisfiable")
+                if response.status in RETRY_STATUSES:
+                    response.read()
+                    retry_after = response.getheader("Retry-After")
+                    raise DownloadError(
+                        f"{url} returned {response.status}",
+                        retry_after=float(retry_after)
+                        if retry_after and retry_after.isdigit()
+                        else None,
+                    )
+                if response.status not in (200, 206):
+                    response.read()
+                    raise DownloadError(f"{url} returned {response.status}", retry=False)
+                # the server ignored the range request so start over
+                mode = "ab" if response.status == 206 else "wb"
+                expected = response.getheader("Content-Length")
+                received = 0
+                with open(part_file, mode) as f:
+                    while True:
+                        chunk = response.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        received += len(chunk)
+                        self.progress.add_bytes(len(chunk))
+                if expected is not None and received != int(expected):
+                    raise DownloadError(
+                        f"{url} incomplete, {received}/{expected} bytes received"
+                    )
+                if response.getheader("Connection", "").lower() == "close":
+                    self.close_connection(url)
+                return
+        raise DownloadError(f"{url} redirected too many times", retry=False)
+
+    def request(self, url, headers, method="GET", body=None):
+        parts = urlsplit(url)
+        connection = self.get_connection(parts)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        connection.request(method, path, body=body, headers=headers)
+        return connection.getresponse()
+
+    def get_limiter(self, url):
+        host = urlsplit(url).netloc
+        with self.limiters_lock:
+            if host not in self.limiters:
+                self.limiters[host] = HostLimiter(self.connections, self.rate)
+            return self.limiters[host]
+
+    def get_connection(self, parts):
+        """
+        Returns the persistent connection of this thread to a host.
+        """
+        if not hasattr(self.local, "connections"):
+            self.local.connections = dict()
+        key = (parts.scheme, parts.netloc)
+        if key not in self.local.connections:
+            if parts.scheme == "https":
+                connection = http.client.HTTPSConnection(parts.netloc, timeout=60)
+            else:
+                connection = http.client.HTTPConnection(parts.netloc, timeout=60)
+            self.local.connections[key] = connection
+        return self.local.connections[key]
+
+    def close_connection(self, url):
+        parts = urlsplit(url)
+        connections = getattr(self.local, "connections", {})
+        connection = connections.pop((parts.scheme, parts.netloc), None)
+        if connection is not None:
+            connection.close()
+
+
+class Segment(object):
+    def __init__(self, beg, end, done=0):
+        self.beg = beg
+        self.end = end
+        self.done = done
+
+    def get_offset(self):
+        return self.beg + self.done
+
+    def is_complete(self):
+        return self.beg + self.done == self.end
+
+
+class SegmentedDownload(object):
+    """
+    Downloads byte ranges of a file concurrently into a preallocated part file.
+
+    The segments and the bytes done of each are saved to a .segments file next to the
+    part file, data is synced to disk before the progress is saved so a resumed
+    download never skips bytes that were not written.
+    """
+
+    def __init__(self, downloader, url, part_file, size, validator):
+        self.downloader = downloader
+        self.url = url
+        self.part_file = part_file
+        self.state_file = f"{part_file}.segments"
+        self.size = size
+        self.validator = validator
+        self.segments = []
+        self.lock = threading.Lock()
+        self.last_save = 0
+        self.fd = None
+
+    def run(self):
+        self.load_segments()
+        self.fd = os.open(self.part_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(self.fd).st_size < self.size:
+                os.ftruncate(self.fd, self.size)
+                try:
+                    os.posix_fallocate(self.fd, 0, self.size)
+                except (AttributeError, OSError):
+                    # sparse file on file systems without preallocation
+                    pass
+            self.save_segments(force=True)
+            pending = [segment for segment in self.segments if not segment.is_complete()]
+            errors = []
+            with ThreadPoolExecutor(max(1, len(pending))) as executor:
+                futures = [
+                    executor.submit(
+                        self.downloader.retry, self.url, self.fetch_segment, segment
+                    )
+                    for segment in pending
+                ]
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors.append(e)
+            self.save_segments(force=True)
+        finally:
+            os.close(self.fd)
+        if len(errors) > 0:
+            raise errors[0]
+        # the part file is preallocated to its full size, so only the segments tell
+        # whether every byte was written
+        incomplete = [segment for segment in self.segments if not segment.is_complete()]
+        if len(incomplete) > 0:
+            raise DownloadError(
+                f"{self.url} incomplete, {len(incomplete)} segments not done"
+            )
+        os.remove(self.state_file)
+
+    def load_segments(self):
+        """
+        Resumes the saved segments if the remote file is unchanged, otherwise splits
+        the file into segments, after any prefix already downloaded as a single stream.
+        """
+        if os.path.exists(self.state_file):
+            with open(self.state_file, "r") as f:
+                size, validator = f.readline().rstrip("\n").lstrip("#").split("\t")
+                if int(size) == self.size and validator == self.validator:
+                    for line in f:
+                        beg, end, done = line.split()
+                        self.segments.append(Segment(int(beg), int(end), int(done)))
+                    return
+            print(f"{self.url} changed, restarting download", file=sys.stderr)
+            os.remove(self.state_file)
+            if os.path.exists(self.part_file):
+                os.remove(self.part_file)
+
+        start = 0
+        if os.path.exists(self.part_file):
+            start = min(os.path.getsize(self.part_file), self.size)
+        no_segments = max(
+            1,
+            min(
+                self.downloader.segments,
+                (self.size - start) // MIN_SEGMENT_SIZE,
+            ),
+        )
+        segment_size = -(-(self.size - start) // no_segments)
+        for beg in range(start, self.size, segment_size):
+            self.segments.append(Segment(beg, min(beg + segment_size, self.size)))
+
+    def save_segments(self, force=False):
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_save < SAVE_INTERVAL:
+                return
+            self.last_save = now
+            # the progress is read before syncing, bytes counted in it were written
+            # before it was read and so are on disk once the sync returns
+            progress = [
+                (segment.beg, segment.end, segment.done) for segment in self.segments
+            ]
+            os.fsync(self.fd)
+            with open(f"{self.state_file}.tmp", "w") as f:
+                f.write(f"#{self.size}\t{self.validator}\n")
+                for beg, end, done in progress:
+                    f.write(f"{beg}\t{end}\t{done}\n")
+            os.replace(f"{self.state_file}.tmp", self.state_file)
+
+    def fetch_segment(self, segment):
+        headers = {"Range": f"bytes={segment.get_offset()}-{segment.end - 1}"}
+        if self.validator:
+            headers["If-Range"] = self.validator
+        with self.downloader.get_limiter(self.url):
+            response = self.downloader.request(self.url, headers)
+            if response.status in RETRY_STATUSES:
+                response.read()
+                raise DownloadError(f"{self.url} returned {response.status}")
+            if response.status != 206:
+                response.read()
+                raise DownloadError(
+                    f"{self.url} returned {response.status} for a range request, "
+                    "the file may have changed",
+                    retry=False,
+                )
+            content_range = response.getheader("Content-Range", "")
+            match = re.match(r"bytes (\d+)-(\d+)/", content_range)
+            if (
+                match is None
+                or int(match.group(1)) != segment.get_offset()
+                or int(match.group(2)) < segment.end - 1
+            ):
+                response.read()
+                raise DownloadError(f"{self.url} returned range {content_range}")
+            while not segment.is_complete():
+                chunk = response.read(min(CHUNK_SIZE, segment.end - segment.get_offset()))
+                if not chunk:
+                    break
+                os.pwrite(self.fd, chunk, segment.get_offset())
+                segment.done += len(chunk)
+                self.downloader.progress.add_bytes(len(chunk))
+                self.save_segments()
+            if not segment.is_complete():
+                raise DownloadError(
+                    f"{self.url} incomplete range, {segment.get_offset()}/{segment.end}"
+                )
+            response.read()
+
+
+def verify_md5(file, md5):
+    """
+    Raises a DownloadError and removes a downloaded file whose md5 does not match.
+    """
+    digest = hashlib.md5()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    if digest.hexdigest() != md5.lower():
+        os.remove(file)
+        raise DownloadError(
+            f"{os.path.basename(file)} md5 {digest.hexdigest()} does not match {md5}",
+            retry=False,
+        )
+
+
+def get_file_name(url):
+    return os.path.basename(urlsplit(url).path)
+
+
+def read_url_file(url_file):
+    jobs = []
+    with open(url_file, "r") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] == "":
+                continue
+            file_name = fields[1] if len(fields) > 1 else ""
+            file_name = file_name or get_file_name(fields[0])
+            md5 = fields[2] if len(fields) > 2 else ""
+            jobs.append((fields[0], file_name, md5))
+    return jobs
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import click
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from accession_index import get_accession
+from download import Downloader, DownloadError, RETRY_STATUSES
+
+# NCBI E-utilities, a local server can stand in for testing
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+
+# efetch rettype of each download type
+RETTYPES = {"fasta": "fasta", "genbank": "gb"}
+
+
+@click.command()
+@click.argument("ids", nargs=-1)
+@click.option(
+    "-i", "--id_file", default=None, help="file of accessions to fetch, one per line"
+)
+@click.option(
+    "-f",
+    "--download_type",
+    default="fasta",
+    type=click.Choice(["fasta", "genbank"]),
+    show_default=True,
+    help="download type - fasta or genbank",
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    default=os.getcwd(),
+    show_default=True,
+    help="output directory",
+)
+@click.option(
+    "-b",
+    "--batch_size",
+    default=200,
+    show_default=True,
+    help="number of accessions fetched per request",
+)
+@click.option(
+    "-c",
+    "--connections",
+    default=3,
+    show_default=True,
+    help="maximum concurrent requests",
+)
+@click.option(
+    "-k",
+    "--api_key",
+    default=os.environ.get("NCBI_API_KEY"),
+    help="NCBI API key, allows 10 instead of 3 requests per second",
+)
+@click.option(
+    "-u",
+    "--eutils_url",
+    default=EUTILS_URL,
+    show_default=True,
+    help="E-utilities base URL",
+)
+def main(
+    ids, id_file, download_type, output_dir, batch_size, connections, api_key, eutils_url
+):
+    """
+    Fetches nucleotide records from NCBI in batches and writes one file per accession.
+
+    Accessions may be given with or without the version, accessions that already have
+    an output file are skipped so an interrupted run can be rerun.  Exits with an error
+    if any accession is not returned.
+
+    e.g. efetch.py -i id.txt -f genbank -o /home/atks/downloads -b 200
+    """
+    ids = list(ids)
+    if id_file is not None:
+        with open(id_file, "r") as f:
+            ids.extend(line.strip() for line in f if line.strip() != "")
+    if len(ids) == 0:
+        exit("no accessions to fetch")
+
+    os.makedirs(output_dir, exist_ok=True)
+    rate = 10 if api_key else 3
+    fetcher = EFetcher(eutils_url, api_key, connections, rate)
+    missing = fetcher.fetch_all(ids, download_type, output_dir, batch_size)
+    if len(missing) > 0:
+        for id in missing:
+            print(f"not fetched {id}", file=sys.stderr)
+        sys.exit(1)
+
+
+class EFetcher(Downloader):
+    """
+    Batched efetch requests within the NCBI request rate limits.
+    """
+
+    def __init__(self, eutils_url=EUTILS_URL, api_key=None, connections=3, rate=3):
+        super().__init__(connections, rate)
+        self.url = f"{eutils_url}/efetch.fcgi"
+        self.api_key = api_key
+
+    def fetch_all(self, ids, download_type, output_dir, batch_size=200):
+        """
+        Fetches the records of ids not yet downloaded to output_dir in batches and
+        returns the ids not fetched.
+        """
+        ext = download_type
+        ids = [
+            id
+            for id in dict.fromkeys(ids)
+            if not os.path.exists(f"{output_dir}/{id}.{ext}")
+        ]
+        batches = [ids[i : i + batch_size] for i in range(0, len(ids), batch_size)]
+        print(f"fetching {len(ids)} records in {len(batches)} batches", file=sys.stderr)
+
+        missing = []
+        with ThreadPoolExecutor(self.connections) as executor:
+            for i, batch_missing in enumerate(
+                executor.map(
+                    lambda batch: self.try_fetch_batch(
+                        batch, download_type, output_dir
+                    ),
+                    batches,
+                )
+            ):
+                missing.extend(batch_missing)
+                print(
+                    f"batch {i + 1}/{len(batches)} : "
+                    f"{len(batches[i]) - len(batch_missing)}/{len(batches[i])} records",
+                    file=sys.stderr,
+                    flush=True,
+                )
+        return missing
+
+    def try_fetch_batch(self, ids, download_type, output_dir):
+        try:
+            text = self.retry(self.url, self.post, ids, download_type)
+        except Exception as e:
+            print(f"failed batch {ids[0]}..{ids[-1]} : {e}", file=sys.stderr)
+            return ids
+        return write_records(text, ids, download_type, output_dir)
+
+    def post(self, ids, download_type):
+        """
+        Returns the text of the records of a batch of ids, the ids are posted as NCBI
+        recommends for more than 200 ids.
+        """
+        params = {
+            "db": "nuccore",
+            "id": ",".join(ids),
+            "rettype": RETTYPES[download_type],
+            "retmode": "text",
+        }
+        if self.api_key:
+            params["api_key"] = self.api_key
+        with self.get_limiter(self.url):
+            response = self.request(
+                self.url,
+                {"Content-Type": "application/x-www-form-urlencoded"},
+                "POST",
+                urlencode(params),
+            )
+            text = response.read()
+            if response.status in RETRY_STATUSES:
+                retry_after = response.getheader("Retry-After")
+                raise DownloadError(
+                    f"efetch returned {response.status}",
+                    retry_after=float(retry_after)
+                    if retry_after and retry_after.isdigit()
+                    else None,
+                )
+            if response.status != 200:
+                raise DownloadError(f"efetch returned {response.status}", retry=False)
+        return text.decode()
+
+
+def split_records(text, download_type):
+    """
+    Yields the accession and text of each record of an efetch response.
+    """
+    if download_type == "fasta":
+        start = text.find(">")
+        while start != -1:
+            end = text.find("\n>", start)
+            end = end + 1 if end != -1 else len(text)
+            record = text[start:end]
+            yield record[1:].split(maxsplit=1)[0], record
+            start = text.find(">", end) if end < len(text) else -1
+    else:
+        record = []
+        accession = None
+        for line in text.splitlines(keepends=True):
+            if line.strip() == "" and len(record) == 0:
+                continue
+            record.append(line)
+            if line.startswith("VERSION") or (
+                line.startswith("ACCESSION") and accession is None
+            ):
+                accession = line.split()[1]
+            elif line.startswith("//"):
+                yield accession, "".join(record)
+                record = []
+                accession = None
+
+
+def match_records(text, ids, download_type):
+    """
+    Yields the requested id, accession and text of each record of an efetch response
+    that was requested, an id without a version matches any version.
+    """
+    requested = set(ids)
+    matched = set()
+    for accession, record in split_records(text, download_type):
+        id = accession if accession in requested else get_accession(accession)
+        if id not in requested or id in matched:
+            continue
+        matched.add(id)
+        yield id, accession, record
+
+
+def write_records(text, ids, download_type, output_dir):
+    """
+    Writes each record of a batch to the file of its requested id and returns the ids
+    without a record.
+    """
+    ext = download_type
+    written = set()
+    for id, accession, record in match_records(text, ids, download_type):
+        file = f"{output_dir}/{id}.{ext}"
+        with open(f"{file}.tmp", "w") as f:
+            f.write(record)
+        os.replace(f"{file}.tmp", file)
+        written.add(id)
+    return [id for id in ids if id not in written]
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import re
+import sys
+import click
+import gzip
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from accession_index import AccessionIndex, get_accession
+from bgzf import is_bgzf, read_block, read_block_offsets
+from fasta import build_fai, get_name, write_fai
+
+# BGZF blocks scanned per task, about 16MB of uncompressed fasta
+CHUNK_BLOCKS = 256
+
+# bytes read at a time from a fasta file that is not BGZF compressed
+READ_SIZE = 1 << 24
+
+
+@click.command()
+@click.argument("fasta_files", nargs=-1, required=True)
+@click.option(
+    "-a",
+    "--accession_file",
+    default=None,
+    help="file of accessions to select, one per line, with or without the version",
+)
+@click.option(
+    "-r",
+    "--organism",
+    default=None,
+    help="regular expression searched for in the header line, e.g. the organism name",
+)
+@click.option(
+    "-x",
+    "--taxid",
+    multiple=True,
+    type=int,
+    help="select sequences of this taxon and its descendants, may be repeated",
+)
+@click.option(
+    "-n",
+    "--taxdump_dir",
+    default=None,
+    help="NCBI taxdump directory with nodes.dmp, required with a taxid",
+)
+@click.option(
+    "-m",
+    "--accession2taxid_file",
+    multiple=True,
+    help="NCBI accession2taxid file, e.g. nucl_gb.accession2taxid.gz, required with "
+    "a taxid",
+)
+@click.option("-o", "--output_file", required=True, help="output fasta file")
+@click.option(
+    "-t",
+    "--threads",
+    default=4,
+    show_default=True,
+    help="number of processes scanning blocks of a BGZF fasta file",
+)
+def main(
+    fasta_files,
+    accession_file,
+    organism,
+    taxid,
+    taxdump_dir,
+    accession2taxid_file,
+    output_file,
+    threads,
+):
+    """
+    Extracts a subset of the sequences of local fasta databases into an uncompressed
+    fasta file indexed for samtools faidx.
+
+    Sequences are selected by accession, by a regular expression on the header line
+    and by taxon, a sequence must meet every criterion given.  With accessions, the
+    sequences of a BGZF fasta file with an accession index from accession_index.py
+    are looked up in the index.  Otherwise BGZF fasta files are scanned a run of
+    blocks at a time in parallel, other fasta files are scanned in a single stream.  A sequence found in more than one file is written once.  Exits
+    with an error if an accession in the accession file is not found.
+
+    e.g. extract_fasta_subset.py refseq.226.viral.fasta.gz genbank.260.vrl.fasta.gz
+            -x 10244 -n taxdump -m nucl_gb.accession2taxid.gz -o poxviridae.fasta
+    """
+    accessions = None
+    if accession_file is not None:
+        with open(accession_file, "r") as f:
+            accessions = [line.strip() for line in f if line.strip() != ""]
+    taxid_accessions = None
+    if len(taxid) > 0:
+        if taxdump_dir is None or len(accession2taxid_file) == 0:
+            exit("a taxid requires a taxdump directory and an accession2taxid file")
+        taxids = read_descendants(f"{taxdump_dir}/nodes.dmp", taxid)
+        taxid_accessions = read_taxid_accessions(accession2taxid_file, taxids)
+        print(
+            f"{len(taxids)} taxa with {len(taxid_accessions)} accessions",
+            file=sys.stderr,
+        )
+    if accessions is None and organism is None and taxid_accessions is None:
+        exit("no accessions, organism or taxid to select sequences by")
+
+    selector = Selector(accessions, organism, taxid_accessions)
+    names = extract(fasta_files, selector, output_file, threads)
+
+    if accessions is not None:
+        found = set(names) | set(get_accession(name) for name in names)
+        missing = [accession for accession in accessions if accession not in found]
+        if len(missing) > 0:
+            for accession in missing:
+                print(f"not found {accession}", file=sys.stderr)
+            sys.exit(1)
+
+
+class Selector(object):
+    """
+    Selects fasta records by the header line, a record must meet every criterion set.
+    """
+
+    def __init__(self, accessions=None, organism=None, taxid_accessions=None):
+        self.accessions = set(accessions) if accessions is not None else None
+        self.pattern = re.compile(organism) if organism is not None else None
+        self.taxid_accessions = taxid_accessions
+
+    def is_selected(self, desc):
+        name = get_name(desc)
+        if self.accessions is not None and not has_accession(self.accessions, name):
+            return False
+        if self.pattern is not None and self.pattern.search(desc) is None:
+            return False
+        if self.taxid_accessions is not None and not has_accession(
+            self.taxid_accessions, name
+        ):
+            return False
+        return True
+
+
+def has_accession(accessions, name):
+    return name in accessions or get_accession(name) in accessions
+
+
+def read_descendants(nodes_file, taxids):
+    """
+    Returns taxids and all their descendants from a taxdump nodes.dmp file.
+    """
+    children = dict()
+    with open(nodes_file, "r") as f:
+        for line in f:
+            fields = line.split("\t|\t", 2)
+            child, parent = int(fields[0]), int(fields[1])
+            if child != parent:
+                children.setdefault(parent, []).append(child)
+    descendants = set(taxids)
+    stack = list(taxids)
+    while stack:
+        for child in children.get(stack.pop(), []):
+            if child not in descendants:
+                descendants.add(child)
+                stack.append(child)
+    return descendants
+
+
+def read_taxid_accessions(accession2taxid_files, taxids):
+    """
+    Returns the versioned accessions assigned to taxids in accession2taxid files.
+    """
+    taxids = set(str(taxid) for taxid in taxids)
+    accessions = set()
+    for file in accession2taxid_files:
+        with gzip.open(file, "rt") if file.endswith(".gz") else open(file, "r") as f:
+            # accession, accession.version, taxid, gi
+            next(f, None)
+            for line in f:
+                fields = line.split("\t", 3)
+                if fields[2] in taxids:
+                    accessions.add(fields[1])
+    return accessions
+
+
+def extract(fasta_files, selector, output_file, threads=4):
+    """
+    Writes the selected records of fasta files to output_file in the order of the
+    files and returns their names, the output is written to a temporary file that is
+    moved into place with its index at the end.
+    """
+    tmp_output_file = f"{output_file}.tmp"
+    names = dict()
+    no_duplicates = 0
+    try:
+        with open(tmp_output_file, "wb") as out:
+            for fasta_file in fasta_files:
+                no_records = 0
+                if selector.accessions is not None and has_index(fasta_file):
+                    chunks = scan_index(fasta_file, selector)
+                elif is_bgzf(fasta_file):
+                    chunks = scan_bgzf(fasta_file, selector, threads)
+                else:
+                    chunks = scan_stream(fasta_file, selector)
+                for records in chunks:
+                    for name, record in records:
+                        if name in names:
+                            no_duplicates += 1
+                            continue
+                        names[name] = fasta_file
+                        out.write(record)
+                        no_records += 1
+                print(
+                    f"{no_records} sequences selected from {fasta_file}",
+                    file=sys.stderr,
+                )
+    except BaseException:
+        os.remove(tmp_output_file)
+        raise
+    if no_duplicates > 0:
+        print(
+            f"{no_duplicates} sequences already selected were skipped",
+            file=sys.stderr,
+        )
+    os.replace(tmp_output_file, output_file)
+    write_fai(f"{output_file}.fai", build_fai(output_file))
+    print(f"{len(names)} sequences written to {output_file}", file=sys.stderr)
+    return list(names)
+
+
+def has_index(fasta_file):
+    """
+    Returns true if a fasta file has an accession index that is up to date.
+    """
+    index_file = f"{fasta_file}.acc.db"
+    return os.path.exists(index_file) and os.path.getmtime(
+        index_file
+    ) >= os.path.getmtime(fasta_file)
+
+
+def scan_index(fasta_file, selector):
+    """
+    Yields the selected records of a BGZF fasta file looked up by accession in its
+    accession index, only the blocks holding the records are decompressed.
+    """
+    with AccessionIndex(fasta_file) as index:
+        entries, _ = index.lookup(selector.accessions)
+        # an accession listed with and without its version is extracted once
+        entries = list({entry.name: entry for entry in entries}.values())
+        records = []
+        for header, seq in index.extract(entries):
+            desc = header[1:].decode().rstrip("\r\n")
+            if selector.is_selected(desc):
+                record = header + seq
+                if not record.endswith(b"\n"):
+                    record += b"\n"
+                records.append((get_name(desc), record))
+        yield records
+
+
+def scan_bgzf(fasta_file, selector, threads=4):
+    """
+    Yields the selected records of a BGZF fasta file a chunk of blocks at a time,
+    chunks are scanned in a process pool and yielded in file order.
+    """
+    offsets = read_block_offsets(fasta_file)
+    offsets.append(os.path.getsize(fasta_file))
+    chunks = [
+        (offsets[i], offsets[min(i + CHUNK_BLOCKS, len(offsets) - 1)])
+        for i in range(0, len(offsets) - 1, CHUNK_BLOCKS)
+    ]
+    pending = deque()
+    with ProcessPoolExecutor(
+        threads, initializer=set_selector, initargs=(selector,)
+    ) as executor:
+        for start, end in chunks:
+            pending.append(executor.submit(scan_chunk, fasta_file, start, end))
+            # bound the number of chunks held in memory
+            while len(pending) > 2 * threads or (pending and pending[0].done()):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def set_selector(selector):
+    global chunk_selector
+    chunk_selector = selector
+
+
+def scan_chunk(fasta_file, start, end):
+    """
+    Returns the selected records of the blocks from file offset start to end.
+
+    A record belongs to the chunk holding the newline before its header line, or to
+    the first chunk if it starts the file, so blocks past the end are read to find
+    the end of the last record.
+    """
+    with open(fasta_file, "rb") as f:
+        f.seek(start)
+        data = bytearray()
+        while f.tell() < end:
+            data += read_block(f)[0]
+        size = len(data)
+        # the byte after the chunk tells if a newline at its end ends a record
+        eof = False
+        while size > 0 and len(data) == size and not eof:
+            eof = not read_ahead(f, data)
+        headers = [0] if start == 0 and data.startswith(b">") else []
+        headers.extend(find_headers(data, 0, size))
+        if len(headers) == 0:
+            return []
+        pos = headers[-1]
+        record_end = data.find(b"\n>", pos)
+        while record_end == -1 and not eof:
+            pos = max(pos, len(data) - 1)
+            eof = not read_ahead(f, data)
+            record_end = data.find(b"\n>", pos)
+    record_end = record_end + 1 if record_end != -1 else len(data)
+    return select_records(bytes(data[:record_end]), headers, chunk_selector)
+
+
+def read_ahead(file, data):
+    """
+    Appends the next block of an open BGZF file to data, returns false at the end.
+    """
+    block = read_block(file)
+    if block is None:
+        return False
+    data += block[0]
+    return True
+
+
+def scan_stream(fasta_file, selector):
+    """
+    Yields the selected records of a fasta file that may be gzipped, a block of the
+    file at a time.
+    """
+    with gzip.open(fasta_file, "rb") if fasta_file.endswith(
+        ".gz"
+    ) else open(fasta_file, "rb") as f:
+        data = b""
+        for part in iter(lambda: f.read(READ_SIZE), b""):
+            data += part
+            # the leftover always begins at a header or the start of the file
+            headers = [0] if data.startswith(b">") else []
+            headers.extend(find_headers(data, 0, len(data)))
+            if len(headers) > 1:
+                yield select_records(data[: headers[-1]], headers[:-1], selector)
+                data = data[headers[-1] :]
+        headers = [0] if data.startswith(b">") else []
+        headers.extend(find_headers(data, 0, len(data)))
+        yield select_records(data, headers, selector)
+
+
+def find_headers(data, start, end):
+    """
+    Yields the positions of the header lines whose preceding newline is in
+    data[start:end].
+    """
+    pos = data.find(b"\n>", start, end + 1)
+    while pos != -1:
+        yield pos + 1
+        pos = data.find(b"\n>", pos + 1, end + 1)
+
+
+def select_records(data, headers, selector):
+    """
+    Returns the names and text of the selected records at the header positions, each
+    record runs to the next header or the end of data.
+    """
+    records = []
+    for i, header in enumerate(headers):
+        end = headers[i + 1] if i + 1 < len(headers) else len(data)
+        line_end = data.find(b"\n", header, end)
+        desc = data[header + 1 : line_end if line_end != -1 else end]
+        desc = desc.decode().rstrip("\r")
+        if selector.is_selected(desc):
+            record = data[header:end]
+            if not record.endswith(b"\n"):
+                record += b"\n"
+            records.append((get_name(desc), record))
+    return records
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import click
+import gzip
+import mmap
+
+
+@click.command()
+@click.argument("fasta_file")
+@click.argument("regions", nargs=-1)
+def main(fasta_file, regions):
+    """
+    Indexes a fasta file and prints sequences or regions from it, the index is
+    compatible with samtools faidx.
+
+    Regions are given as name, name:beg or name:beg-end with 1-based inclusive
+    coordinates.  Without regions, the index is built and the sequence names and
+    lengths are printed.
+
+    e.g. fasta.py ref.fasta MT851941.1:1000-2000
+    """
+    fasta = FastaFile(fasta_file)
+    if len(regions) == 0:
+        for name in fasta.names:
+            print(f"{name}\t{fasta.get_length(name)}")
+    for region in regions:
+        name, start, end = parse_region(region)
+        seq = fasta.fetch(name, start, end)
+        print(f">{region}")
+        for i in range(0, len(seq), 60):
+            print(seq[i : i + 60])
+
+
+class FastaRecord(object):
+    def __init__(self, name, desc, seq):
+        self.name = name
+        self.desc = desc
+        self.seq = seq
+
+    def print(self):
+        print(f"name  : {self.name}")
+        print(f"desc  : {self.desc}")
+        print(f"seq   : {self.seq}")
+
+
+def read_fasta(file):
+    """
+    Yields the FastaRecords in a fasta file one at a time, the fasta file may be gzipped.
+
+    The name is the first word of the header line and desc is the whole header line
+    without the leading >.
+    """
+    desc = None
+    seq = []
+    with gzip.open(file, "rt") if file.endswith(".gz") else open(file, "r") as f:
+        for line in f:
+            if line.startswith(">"):
+                if desc is not None:
+                    yield FastaRecord(get_name(desc), desc, "".join(seq))
+                desc = line[1:].rstrip()
+                seq = []
+            else:
+                seq.append(line.rstrip())
+    if desc is not None:
+        yield FastaRecord(get_name(desc), desc, "".join(seq))
+
+
+def get_name(desc):
+    words = desc.split()
+    return words[0] if len(words) > 0 else ""
+
+
+class FaiEntry(object):
+    def __init__(self, name, length, offset, linebases, linewidth):
+        self.name = name
+        self.length = length
+        self.offset = offset
+        self.linebases = linebases
+        self.linewidth = linewidth
+
+    def get_offset(self, pos):
+        """
+        Returns the file offset of a 0-based position in the sequence.
+        """
+        return (
+            self.offset
+            + pos // self.linebases * self.linewidth
+            + pos % self.linebases
+        )
+
+    def to_fai(self):
+        return "\t".join(
+            str(field)
+            for field in [
+                self.name,
+                self.length,
+                self.offset,
+                self.linebases,
+                self.linewidth,
+            ]
+        )
+
+
+class FastaFile(object):
+    """
+    Random access to the sequences of an uncompressed fasta file through a .fai index
+    and a memory map of the file, only the bytes of a fetched region are read.
+
+    A gzipped fasta file or one that samtools faidx cannot index, with lines of
+    different lengths or duplicate names, is read into memory instead.
+    """
+
+    def __init__(self, fasta_file):
+        self.fasta_file = fasta_file
+        self.entries = None
+        self.sequences = None
+        self.file = None
+        self.mm = b""
+        if fasta_file.endswith(".gz"):
+            self.load()
+            return
+        fai_file = f"{fasta_file}.fai"
+        if os.path.exists(fai_file) and os.path.getmtime(
+            fai_file
+        ) >= os.path.getmtime(fasta_file):
+            self.entries = read_fai(fai_file)
+        else:
+            try:
+                self.entries = build_fai(fasta_file)
+            except ValueError as error:
+                print(f"{error}, reading {fasta_file} into memory", file=sys.stderr)
+                self.load()
+                return
+            # the index is only kept in memory beside read only inputs
+            if os.access(os.path.dirname(os.path.abspath(fai_file)), os.W_OK):
+                try:
+                    write_fai(f"{fai_file}.{os.getpid()}", self.entries)
+                    os.replace(f"{fai_file}.{os.getpid()}", fai_file)
+                except OSError:
+                    pass
+        self.names = list(self.entries.keys())
+        self.file = open(fasta_file, "rb")
+        if os.path.getsize(fasta_file) > 0:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def load(self):
+        """
+        Reads all sequences into memory, the first of sequences with the same name is
+        kept as with samtools faidx.
+        """
+        self.sequences = dict()
+        for record in read_fasta(self.fasta_file):
+            if record.name in self.sequences:
+                print(
+                    f"duplicate sequence {record.name} in {self.fasta_file} ignored",
+                    file=sys.stderr,
+                )
+                continue
+            self.sequences[record.name] = record.seq
+        self.names = list(self.sequences.keys())
+
+    def __contains__(self, name):
+        if self.sequences is not None:
+            return name in self.sequences
+        return name in self.entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        if self.file is not None:
+            self.file.close()
+
+    def get_length(self, name):
+        if self.sequences is not None:
+            return len(self.sequences[name])
+        return self.entries[name].length
+
+    def fetch(self, name, start=None, end=None):
+        """
+        Returns the sequence of name from 0-based start to end exclusive, the whole
+        sequence by default.
+        """
+        if name not in self:
+            raise KeyError(f"sequence {name} not in {self.fasta_file}")
+        length = self.get_length(name)
+        start = 0 if start is None else max(0, start)
+        end = length if end is None else min(end, length)
+        if start >= end:
+            return ""
+        if self.sequences is not None:
+            return self.sequences[name][start:end]
+        entry = self.entries[name]
+        data = self.mm[entry.get_offset(start) : entry.get_offset(end - 1) + 1]
+        return data.replace(b"\n", b"").replace(b"\r", b"").decode()
+
+    def records(self):
+        """
+        Yields the sequences in the order of the fasta file as FastaRecords, desc is
+        the name as the index does not keep header lines.
+        """
+        for name in self.names:
+            yield FastaRecord(name, name, self.fetch(name))
+
+
+def build_fai(fasta_file):
+    """
+    Returns the index entries of a fasta file, lines of a sequence must all be of the
+    same length except for the last one as required by samtools faidx.
+    """
+    entries = dict()
+    name = None
+    length = offset = linebases = linewidth = 0
+    last_line = False
+    pos = 0
+    with open(fasta_file, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if name is not None:
+                    entries[name] = FaiEntry(name, length, offset, linebases, linewidth)
+                name = get_name(line[1:].decode())
+                if name in entries:
+                    raise ValueError(f"duplicate sequence {name} in {fasta_file}")
+                length = linebases = linewidth = 0
+                offset = pos + len(line)
+                last_line = False
+            elif name is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if bases > 0:
+                    if last_line or (linebases != 0 and bases > linebases):
+                        raise ValueError(
+                            f"{name} in {fasta_file} has lines of different lengths"
+                        )
+                    if linebases == 0:
+                        linebases = bases
+                        linewidth = len(line)
+                    elif bases < linebases or len(line) != linewidth:
+                        last_line = True
+                    length += bases
+                elif length > 0:
+                    last_line = True
+            pos += len(line)
+    if name is not None:
+        entries[name] = FaiEntry(name, length, offset, linebases, linewidth)
+    return entries
+
+
+def read_fai(fai_file):
+    entries = dict()
+    with open(fai_file, "r") as f:
+        for line in f:
+            name, length, offset, linebases, linewidth = line.rstrip().split("\t")[:5]
+            entries[name] = FaiEntry(
+                name, int(length), int(offset), int(linebases), int(linewidth)
+            )
+    return entries
+
+
+def write_fai(fai_file, entries):
+    with open(fai_file, "w") as f:
+        for entry in entries.values():
+            f.write(f"{entry.to_fai()}\n")
+
+
+def parse_region(region):
+    """
+    Returns the name and 0-based half open interval of a samtools style region.
+    """
+    if ":" not in region:
+        return region, None, None
+    name, interval = region.rsplit(":", 1)
+    interval = interval.replace(",", "")
+    if "-" in interval:
+        beg, end = interval.split("-")
+        return name, int(beg) - 1, int(end)
+    return name, int(interval) - 1, None
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
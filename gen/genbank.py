@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import click
+import gzip
+import re
+from seqkernel import reverse_complement
+
+# Streaming GenBank flat file parser.
+#
+# Files hold any number of records, each running from a LOCUS line to a // line,
+# and may be gzipped like the gb*.seq.gz division files which also start with a
+# release header that is skipped.  Records are split off one at a time so that a
+# division never has to be held in memory.
+
+# qualifiers whose values are wrapped without spaces
+UNSPACED_QUALIFIERS = {"translation"}
+
+SIMPLE_LOCATION = re.compile(r"<?(\d+)(?:(\.\.|\.|\^)>?(\d+))?")
+
+
+@click.command()
+@click.argument("genbank_file")
+def main(genbank_file):
+    """
+    Summarises the records of a genbank file, the genbank file may be gzipped.
+
+    e.g. genbank.py gbvrl1.seq.gz
+    """
+    for record in read_genbank(genbank_file, sequence=False):
+        print(
+            f"{record.get_id()}\t{record.length}\t{len(record.features)}\t{record.organism}"
+        )
+
+
+class Location(object):
+    """
+    A feature location as parts with 0-based half open coordinates on the forward
+    strand, listed in the order they are transcribed.  Parts on other records are
+    dropped.  Sites between two bases, e.g. 123^124, span no bases and are kept
+    apart from the parts as the 0-based positions of the base after the site.
+    """
+
+    def __init__(self, parts, strand, partial5=False, partial3=False, sites=None):
+        self.parts = parts
+        self.strand = strand
+        self.partial5 = partial5
+        self.partial3 = partial3
+        self.sites = sites if sites is not None else []
+        self.beg = min(beg for beg, end in parts) if parts else 0
+        self.end = max(end for beg, end in parts) if parts else 0
+
+    def get_blocks(self):
+        """
+        Returns the parts sorted by position with overlapping parts merged.
+        """
+        blocks = []
+        for beg, end in sorted(self.parts):
+            if blocks and beg <= blocks[-1][1]:
+                blocks[-1][1] = max(blocks[-1][1], end)
+            else:
+                blocks.append([beg, end])
+        return blocks
+
+    def extract(self, seq):
+        """
+        Returns the spliced sequence of the location from the sequence of its record.
+        """
+        if self.strand == "-":
+            return reverse_complement(
+                "".join(seq[beg:end] for beg, end in self.parts[::-1])
+            )
+        return "".join(seq[beg:end] for beg, end in self.parts)
+
+
+class Feature(object):
+    def __init__(self, type, location_text):
+        self.type = type
+        self.location_text = location_text
+        self.qualifiers = dict()
+        self._location = None
+
+    @property
+    def location(self):
+        if self._location is None:
+            self._location = parse_location(self.location_text)
+        return self._location
+
+    def get(self, key, default=None):
+        """
+        Returns the first value of a qualifier.
+        """
+        values = self.qualifiers.get(key)
+        return values[0] if values else default
+
+    def get_label(self):
+        for key in ["gene", "locus_tag", "product", "protein_id"]:
+            if key in self.qualifiers:
+                return self.qualifiers[key][0]
+        return "."
+
+    def print(self):
+        print(f"type      : {self.type}")
+        print(f"location  : {self.location_text}")
+        for key, values in self.qualifiers.items():
+            for value in values:
+                print(f"  {key:<8}: {value}")
+
+
+class GenBankRecord(object):
+    def __init__(self):
+        self.name = ""
+        self.length = 0
+        self.mol_type = ""
+        self.topology = ""
+        self.division = ""
+        self.date = ""
+        self.definition = ""
+        self.accession = ""
+        self.version = ""
+        self.organism = ""
+        self.taxonomy = []
+        self.keywords = dict()
+        self.references = []
+        self.features = []
+        self.seq = ""
+
+    def get_id(self):
+        """
+        Returns the versioned accession, falling back on the accession and locus name.
+        """
+        return self.version or self.accession or self.name
+
+    def get_features(self, types):
+        return [feature for feature in self.features if feature.type in types]
+
+    def get_submission_date(self):
+        """
+        Returns the date of the latest direct submission reference, e.g. 15-MAY-2007.
+        """
+        date = ""
+        for reference in self.references:
+            journal = reference.get("JOURNAL", "")
+            if journal.startswith("Submitted ("):
+                date = journal[11 : journal.find(")")]
+        return date
+
+    def get_source(self, key, default=""):
+        """
+        Returns a qualifier of the source feature.
+        """
+        for feature in self.features:
+            if feature.type == "source":
+                return feature.get(key, default)
+        return default
+
+    def print(self):
+        print(f"id        : {self.get_id()}")
+        print(f"length    : {self.length}")
+        print(f"division  : {self.division}")
+        print(f"date      : {self.date}")
+        print(f"desc      : {self.definition}")
+        print(f"organism  : {self.organism}")
+        print(f"taxonomy  : {'; '.join(self.taxonomy)}")
+        print(f"features  : {len(self.features)}")
+
+
+def open_genbank(file):
+    return gzip.open(file, "rt") if file.endswith(".gz") else open(file, "r")
+
+
+def split_genbank(file):
+    """
+    Yields the records of a genbank file one at a time as lists of lines, text before
+    the first LOCUS line is skipped.
+    """
+    lines = None
+    with open_genbank(file) as f:
+        for line in f:
+            if line.startswith("LOCUS"):
+                lines = [line]
+            elif lines is not None:
+                if line.startswith("//"):
+                    yield lines
+                    lines = None
+                else:
+                    lines.append(line)
+    if lines is not None:
+        yield lines
+
+
+def read_genbank(file, sequence=True):
+    """
+    Yields the GenBankRecords of a genbank file one at a time, the sequence is not kept
+    if not required.
+    """
+    for lines in split_genbank(file):
+        yield parse_genbank(lines, sequence)
+
+
+def parse_genbank(lines, sequence=True):
+    """
+    Returns the GenBankRecord of the lines of a single record.
+    """
+    record = GenBankRecord()
+    parse_locus(record, lines[0])
+    seq = []
+    lineage = []
+    section = ""
+    subkeyword = ""
+    feature = None
+    qualifier = None
+    for line in lines[1:]:
+        if line[:1] not in (" ", "\n", ""):
+            # new top level keyword
+            keyword = line[:12].strip()
+            value = line[12:].strip()
+            section = keyword
+            if keyword in ["FEATURES", "ORIGIN"]:
+                continue
+            if keyword == "DEFINITION":
+                record.definition = value
+            elif keyword == "ACCESSION":
+                record.accession = value.split()[0] if value else ""
+            elif keyword == "VERSION":
+                record.version = value.split()[0] if value else ""
+            elif keyword == "REFERENCE":
+                record.references.append({"REFERENCE": value})
+                subkeyword = "REFERENCE"
+            elif keyword not in record.keywords:
+                record.keywords[keyword] = value
+        elif section == "ORIGIN":
+            if sequence:
+                seq.append("".join(line[10:].split()))
+        elif section == "FEATURES":
+            content = line[21:].strip()
+            if line[5:6] != " ":
+                feature = Feature(line[5:21].strip(), content)
+                record.features.append(feature)
+                qualifier = None
+            elif feature is None:
+                continue
+            elif content.startswith("/") and (
+                qualifier is None or is_closed(feature.qualifiers[qualifier][-1])
+            ):
+                key, _, value = content[1:].partition("=")
+                qualifier = key
+                feature.qualifiers.setdefault(key, []).append(value)
+            elif qualifier is None:
+                feature.location_text += content
+            else:
+                sep = "" if qualifier in UNSPACED_QUALIFIERS else " "
+                values = feature.qualifiers[qualifier]
+                values[-1] = f"{values[-1]}{sep}{content}"
+        elif section == "DEFINITION":
+            record.definition = f"{record.definition} {line.strip()}"
+        elif section == "SOURCE" and line.startswith("  ORGANISM"):
+            record.organism = line[12:].strip()
+            section = "ORGANISM"
+        elif section == "ORGANISM":
+            lineage.append(line.strip())
+        elif section == "REFERENCE":
+            reference = record.references[-1]
+            if line[2:3] != " ":
+                subkeyword = line[:12].strip()
+                reference[subkeyword] = line[12:].strip()
+            else:
+                reference[subkeyword] = f"{reference[subkeyword]} {line.strip()}"
+        elif section in record.keywords and line.startswith(" " * 12):
+            record.keywords[section] = f"{record.keywords[section]} {line.strip()}"
+
+    # the trailing period of the definition is not part of the description
+    if record.definition.endswith("."):
+        record.definition = record.definition[:-1]
+    record.taxonomy = [
+        taxon.strip() for taxon in " ".join(lineage).rstrip(".").split(";")
+    ]
+    record.taxonomy = [taxon for taxon in record.taxonomy if taxon != ""]
+
+    # unquote qualifier values
+    for feature in record.features:
+        for values in feature.qualifiers.values():
+            for i, value in enumerate(values):
+                if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+                    values[i] = value[1:-1].replace('""', '"')
+    record.seq = "".join(seq).upper()
+    return record
+
+
+def parse_fasta(lines):
+    """
+    Returns the versioned accession, definition and sequence of the lines of a single
+    record, skipping the feature table for conversion to fasta.
+    """
+    name = lines[0].split()[1] if len(lines[0].split()) > 1 else ""
+    accession = version = ""
+    definition = []
+    seq = []
+    section = ""
+    for line in lines[1:]:
+        if line[:1] not in (" ", "\n", ""):
+            section = line[:12].strip()
+            value = line[12:].strip()
+            if section == "DEFINITION":
+                definition.append(value)
+            elif section == "ACCESSION":
+                accession = value.split()[0] if value else ""
+            elif section == "VERSION":
+                version = value.split()[0] if value else ""
+        elif section == "ORIGIN":
+            seq.append("".join(line[10:].split()))
+        elif section == "DEFINITION":
+            definition.append(line.strip())
+    definition = " ".join(definition)
+    if definition.endswith("."):
+        definition = definition[:-1]
+    return version or accession or name, definition, "".join(seq).upper()
+
+
+def parse_locus(record, line):
+    """
+    Parses a LOCUS line, the fields are separated by whitespace as their columns
+    are not respected by all files.
+    """
+    fields = line.split()
+    record.name = fields[1] if len(fields) > 1 else ""
+    for i, field in enumerate(fields[2:], 2):
+        if field in ["bp", "aa"] and fields[i - 1].isdigit():
+            record.length = int(fields[i - 1])
+        elif field in ["linear", "circular"]:
+            record.topology = field
+        elif "NA" in field or field == "DNA":
+            record.mol_type = field
+    if len(fields) >= 2 and re.match(r"\d{2}-[A-Z]{3}-\d{4}", fields[-1]):
+        record.date = fields[-1]
+        if len(fields[-2]) == 3 and fields[-2].isupper():
+            record.division = fields[-2]
+
+
+def is_closed(value):
+    """
+    Returns true if a qualifier value is not an open quoted string.
+    """
+    return not value.startswith('"') or (len(value) > 1 and value.count('"') % 2 == 0)
+
+
+def parse_location(text):
+    """
+    Returns the Location of a feature location string with complement, join and order
+    operators, e.g. complement(join(<1..200,300..>450)).
+    """
+    text = text.replace(" ", "")
+    parts = []
+    flags = {"partial5": False, "partial3": False, "sites": []}
+    strands = []
+    collect_parts(text, "+", parts, strands, flags)
+    if len(parts) == 0:
+        return Location([], "+", sites=flags["sites"])
+    strand = strands[0]
+    partial5, partial3 = flags["partial5"], flags["partial3"]
+    if strand == "-":
+        partial5, partial3 = partial3, partial5
+    return Location(parts, strand, partial5, partial3, flags["sites"])
+
+
+def collect_parts(text, strand, parts, strands, flags):
+    if text.startswith("complement(") and text.endswith(")"):
+        inner = []
+        inner_strands = []
+        collect_parts(text[11:-1], flip(strand), inner, inner_strands, flags)
+        parts.extend(inner[::-1])
+        strands.extend(inner_strands[::-1])
+        return
+    for operator in ["join(", "order("]:
+        if text.startswith(operator) and text.endswith(")"):
+            for item in split_top_level(text[len(operator) : -1]):
+                collect_parts(item, strand, parts, strands, flags)
+            return
+    if ":" in text:
+        # part on another record
+        return
+    m = SIMPLE_LOCATION.fullmatch(text)
+    if m is None:
+        return
+    beg = int(m.group(1))
+    end = int(m.group(3)) if m.group(3) else beg
+    if m.group(2) == "^":
+        # site between two bases, it has no bases to be a part
+        flags["sites"].append(beg)
+        return
+    if text.startswith("<"):
+        flags["partial5"] = True
+    if ">" in text:
+        flags["partial3"] = True
+    parts.append((beg - 1, end))
+    strands.append(strand)
+
+
+def split_top_level(text):
+    """
+    Splits a comma separated list of locations ignoring commas within parentheses.
+    """
+    items = []
+    depth = 0
+    beg = 0
+    for i, c in enumerate(text):
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "," and depth == 0:
+            items.append(text[beg:i])
+            beg = i + 1
+    items.append(text[beg:])
+    return items
+
+
+def flip(strand):
+    return "-" if strand == "+" else "+"
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import click
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from bgzf import BgzfWriter, EOF_BLOCK
+from genbank import split_genbank, parse_fasta
+
+# sequence line width
+LINE_WIDTH = 60
+
+
+@click.command()
+@click.argument("genbank_files", nargs=-1)
+@click.option(
+    "-i",
+    "--genbank_file_list",
+    default=None,
+    help="file listing the genbank files to convert, one per line",
+)
+@click.option("-o", "--fasta_file", required=True, help="output BGZF fasta file")
+@click.option(
+    "-d",
+    "--header_file",
+    default=None,
+    help="output file of the fasta header lines",
+)
+@click.option(
+    "-t",
+    "--threads",
+    default=4,
+    show_default=True,
+    help="number of genbank files converted concurrently",
+)
+@click.option(
+    "-w",
+    "--wait",
+    default=0,
+    show_default=True,
+    help="seconds to wait for a genbank file that is still being downloaded",
+)
+@click.option(
+    "-x",
+    "--download_exit_file",
+    default=None,
+    help="file created when the download ends, files still missing then are not "
+    "waited for",
+)
+def main(
+    genbank_files,
+    genbank_file_list,
+    fasta_file,
+    header_file,
+    threads,
+    wait,
+    download_exit_file,
+):
+    """
+    Converts genbank files to a single BGZF compressed fasta file, the genbank files
+    may be gzipped division files.
+
+    Files are converted in parallel and appended to the output in the order given
+    with the header lines written out in the same pass.  With a wait, conversion
+    starts on each file as soon as it is downloaded, and fails as soon as the download
+    exit file appears without the file.
+
+    e.g. genbank2fasta.py gbvrl*.seq.gz -o genbank.260.vrl.fasta.gz -d genbank.260.vrl.id.txt
+    """
+    genbank_files = list(genbank_files)
+    if genbank_file_list is not None:
+        with open(genbank_file_list, "r") as f:
+            genbank_files.extend(line.strip() for line in f if line.strip() != "")
+    if len(genbank_files) == 0:
+        exit("no genbank files to convert")
+
+    convert(genbank_files, fasta_file, header_file, threads, wait, download_exit_file)
+
+
+def convert(
+    genbank_files,
+    fasta_file,
+    header_file=None,
+    threads=4,
+    wait=0,
+    download_exit_file=None,
+):
+    """
+    Converts genbank files into parts in a process pool and appends the parts to the
+    output in order as they complete, the output is written to a temporary file that
+    is moved into place at the end.
+    """
+    tmp_fasta_file = f"{fasta_file}.tmp"
+    tmp_header_file = f"{header_file}.tmp"
+    headers = open(tmp_header_file, "w") if header_file is not None else None
+    no_records = 0
+    pending = deque()
+    try:
+        with open(tmp_fasta_file, "wb") as out, ProcessPoolExecutor(
+            threads
+        ) as executor:
+            for i, genbank_file in enumerate(genbank_files):
+                wait_for_file(genbank_file, wait, download_exit_file)
+                part_file = f"{fasta_file}.part{i}"
+                pending.append(
+                    (part_file, executor.submit(convert_part, genbank_file, part_file))
+                )
+                # bound the number of parts on disk
+                while len(pending) > 2 * threads or (pending and pending[0][1].done()):
+                    no_records += append_part(out, headers, *pending.popleft())
+            while pending:
+                no_records += append_part(out, headers, *pending.popleft())
+            out.write(EOF_BLOCK)
+    except BaseException:
+        for part_file, future in pending:
+            if os.path.exists(part_file):
+                os.remove(part_file)
+        os.remove(tmp_fasta_file)
+        if headers is not None:
+            headers.close()
+            os.remove(tmp_header_file)
+        raise
+    os.replace(tmp_fasta_file, fasta_file)
+    if headers is not None:
+        headers.close()
+        os.replace(tmp_header_file, header_file)
+    print(f"{no_records} records from {len(genbank_files)} files written to {fasta_file}")
+
+
+def wait_for_file(file, wait, download_exit_file=None):
+    """
+    Waits up to wait seconds for a file to appear, downloaded files only appear once
+    they are complete.  Stops waiting once the download exit file exists as the file
+    will not appear after the download has ended.
+    """
+    deadline = time.monotonic() + wait
+    while not os.path.exists(file):
+        if download_exit_file is not None and os.path.exists(download_exit_file):
+            # the download may have ended just after the file was checked
+            if os.path.exists(file):
+                break
+            raise FileNotFoundError(f"{file} not found after the download ended")
+        if time.monotonic() >= deadline:
+            raise FileNotFoundError(f"{file} not found")
+        time.sleep(min(10, max(0, deadline - time.monotonic())))
+
+
+def convert_part(genbank_file, part_file):
+    """
+    Writes the records of a genbank file as BGZF blocks without an end of file marker
+    and returns the header lines.
+    """
+    headers = []
+    with BgzfWriter(part_file, eof=False) as out:
+        for lines in split_genbank(genbank_file):
+            id, definition, seq = parse_fasta(lines)
+            header = f">{id} {definition}" if definition else f">{id}"
+            headers.append(header)
+            out.write(f"{header}\n".encode())
+            for j in range(0, len(seq), LINE_WIDTH):
+                out.write(f"{seq[j : j + LINE_WIDTH]}\n".encode())
+    return headers
+
+
+def append_part(out, headers, part_file, future):
+    part_headers = future.result()
+    with open(part_file, "rb") as part:
+        shutil.copyfileobj(part, out, 1 << 20)
+    os.remove(part_file)
+    if headers is not None:
+        for header in part_headers:
+            headers.write(f"{header}\n")
+    return len(part_headers)
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
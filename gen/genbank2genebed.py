@@ -18,58 +18,100 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import os.path
+import os
 import sys
 import click
-import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from genbank import read_genbank
 
 
 @click.command()
-@click.argument("genbank_file", nargs=1)
+@click.argument("genbank_files", nargs=-1, required=True)
 @click.option("-o", "--bed_file", required=False, default="", help="output bed file")
-def main(genbank_file, bed_file):
+@click.option(
+    "-f",
+    "--feature_types",
+    default="gene",
+    show_default=True,
+    help="comma separated feature types to extract",
+)
+@click.option(
+    "-b",
+    "--bed12",
+    is_flag=True,
+    default=False,
+    help="write BED12 with the feature type as a 13th column instead of BED4",
+)
+@click.option(
+    "-t",
+    "--threads",
+    default=4,
+    show_default=True,
+    help="number of genbank files processed concurrently",
+)
+def main(genbank_files, bed_file, feature_types, bed12, threads):
     """
-    Extracts genes from a genbank file
+    Extracts genes from genbank files
+
+    Every record of each file is read, files may be gzipped division files.  Features
+    are written in BED4 with the gene name, spanning all the parts of a joined
+    location.  With BED12, joined locations are written as blocks and complemented
+    ones on the reverse strand, with the feature type as a 13th column.  Sites
+    between two bases have no bases and are skipped.
 
     e.g. genbank2genebed.py ref.genbank -o out.bed
+         genbank2genebed.py gbvrl*.seq.gz -f gene,CDS,mRNA -b -t 8 -o vrl.bed
     """
+    types = set(feature_types.split(","))
+    ofile = sys.stdout if bed_file == "" else open(bed_file, "w")
+    with ProcessPoolExecutor(threads) as executor:
+        for bed in executor.map(
+            partial(extract_features, types=types, bed12=bed12), genbank_files
+        ):
+            ofile.write(bed)
+    if ofile is not sys.stdout:
+        ofile.close()
 
-    with open(genbank_file) as ifile:
-        if bed_file == "":
-            ofile = sys.stdout
-        else:
-            ofile = open(bed_file, "w")
 
-        gene_name_line = False
-        beg = -1
-        end = -1
-        id = ""
-        for line in ifile:
-            line = line.strip()
-            if line.startswith("VERSION"):
-                m = re.match("VERSION\s+(\S+)", line)
-                id = m.group(1)
-            elif line.startswith("ORIGIN"):
-                break
-            elif line.startswith("gene"):
-                # ofile.write(f'\t{line}\n')
-                m = re.match("[^\d]+(\d+)\.\.>?(\d+).*", line)
-                beg = int(m.group(1))
-                end = int(m.group(2))
-                gene_name_line = True
-            elif gene_name_line:
-                # ofile.write(f'\t\t{line}\n')
-                m = re.match('/gene="(.+)"', line)
-                gene = m.group(1)
-                if beg <= end:
-                    ofile.write(f"{id}\t{beg-1}\t{end}\t{gene}\n")
-                else:
-                    ofile.write(f"\t\tOOPS::{gene}\t{beg-1}\t{end}\n")
-                gene_name_line = False
-                beg = -1
-                end = -1
+def extract_features(genbank_file, types, bed12=False):
+    """
+    Returns the BED lines of the features of a set of types in a genbank file.
+    """
+    lines = []
+    for record in read_genbank(genbank_file, sequence=False):
+        id = record.get_id()
+        for feature in record.get_features(types):
+            location = feature.location
+            if len(location.parts) == 0:
+                continue
+            if bed12:
+                lines.append(to_bed12(id, feature.get_label(), feature.type, location))
             else:
-                pass
+                lines.append(to_bed4(id, feature.get_label(), location))
+    return "".join(lines)
+
+
+def to_bed4(id, name, location):
+    return f"{id}\t{location.beg}\t{location.end}\t{name}\n"
+
+
+def to_bed12(id, name, type, location):
+    """
+    Returns a BED12 line of a feature location, only CDS are given a thick region.
+    """
+    blocks = location.get_blocks()
+    beg = blocks[0][0]
+    end = blocks[-1][1]
+    thick_end = end if type == "CDS" else beg
+    sizes = ",".join(str(block_end - block_beg) for block_beg, block_end in blocks)
+    starts = ",".join(str(block_beg - beg) for block_beg, block_end in blocks)
+    return (
+        f"{id}\t{beg}\t{end}\t{name}\t0\t{location.strand}\t{beg}\t{thick_end}\t0\t"
+        f"{len(blocks)}\t{sizes},\t{starts},\t{type}\n"
+    )
 
 
 if __name__ == "__main__":
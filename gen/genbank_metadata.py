@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import click
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from genbank import read_genbank
+from cache_util import compute_file_hash, get_default_cache_path
+
+DEFAULT_CACHE_FILE = get_default_cache_path(
+    "CAVSPIPES_GENBANK_METADATA_CACHE", "genbank_metadata.db"
+)
+
+
+@click.command()
+@click.argument("genbank_files", nargs=-1, required=True)
+@click.option(
+    "-c",
+    "--cache_file",
+    default=DEFAULT_CACHE_FILE,
+    show_default=True,
+    help="metadata cache file",
+)
+@click.option(
+    "-t",
+    "--threads",
+    default=4,
+    show_default=True,
+    help="number of genbank files parsed concurrently",
+)
+def main(genbank_files, cache_file, threads):
+    """
+    Extracts the accession, country, collection date, submission date and organism of
+    every record of a set of genbank files.
+
+    Metadata is cached by file content so only new or modified files are parsed.
+
+    e.g. genbank_metadata.py *.genbank
+    """
+    print("accession\tcountry\tcollection_date\tsubmission_date\torganism")
+    with GenBankMetadataCache(cache_file) as cache:
+        for records in cache.get_metadata(genbank_files, threads).values():
+            for metadata in records:
+                print(metadata.to_tsv())
+
+
+class Metadata(object):
+    FIELDS = [
+        "accession",
+        "country",
+        "collection_date",
+        "submission_date",
+        "organism",
+        "definition",
+    ]
+
+    def __init__(
+        self,
+        accession,
+        country,
+        collection_date,
+        submission_date,
+        organism,
+        definition,
+    ):
+        self.accession = accession
+        self.country = country
+        self.collection_date = collection_date
+        self.submission_date = submission_date
+        self.organism = organism
+        self.definition = definition
+
+    def get_submission_year(self):
+        return self.submission_date.split("-")[-1] if self.submission_date else ""
+
+    def to_tsv(self):
+        return "\t".join(
+            [
+                self.accession,
+                self.country,
+                self.collection_date,
+                self.submission_date,
+                self.organism,
+            ]
+        )
+
+
+class GenBankMetadataCache(object):
+    """
+    SQLite cache of the metadata of the records of genbank files keyed by file hash.
+
+    Files are hashed only when their size or modification time has changed since they
+    were last seen and parsed only when their hash has not been seen before.
+    """
+
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE):
+        self.cache_file = cache_file
+        cache_dir = os.path.dirname(os.path.abspath(cache_file))
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(cache_file, timeout=60)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, size INTEGER, mtime REAL, hash TEXT);
+            CREATE TABLE IF NOT EXISTS parsed (
+                hash TEXT PRIMARY KEY, no_records INTEGER);
+            CREATE TABLE IF NOT EXISTS records (
+                hash TEXT, no INTEGER, accession TEXT, country TEXT,
+                collection_date TEXT, submission_date TEXT, organism TEXT,
+                definition TEXT, PRIMARY KEY (hash, no));
+            CREATE INDEX IF NOT EXISTS records_accession ON records (accession);
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def get_metadata(self, genbank_files, threads=4):
+        """
+        Returns the Metadata of the records of each genbank file in a dict keyed by file,
+        uncached files are hashed and parsed in a process pool.
+        """
+        paths = {file: os.path.abspath(file) for file in genbank_files}
+        hashes = self.get_hashes(list(paths.values()), threads)
+
+        parsed = set()
+        for hash in set(hashes.values()):
+            row = self.db.execute(
+                "SELECT 1 FROM parsed WHERE hash = ?", (hash,)
+            ).fetchone()
+            if row is not None:
+                parsed.add(hash)
+        unparsed = {}
+        for path, hash in hashes.items():
+            if hash not in parsed:
+                unparsed.setdefault(hash, path)
+        if len(unparsed) > 0:
+            with ProcessPoolExecutor(threads) as executor:
+                for hash, records in zip(
+                    unparsed.keys(),
+                    executor.map(extract_metadata, unparsed.values()),
+                ):
+                    self.add(hash, records)
+
+        metadata = dict()
+        for file, path in paths.items():
+            metadata[file] = [
+                Metadata(*row)
+                for row in self.db.execute(
+                    f"SELECT {', '.join(Metadata.FIELDS)} FROM records "
+                    "WHERE hash = ? ORDER BY no",
+                    (hashes[path],),
+                )
+            ]
+        return metadata
+
+    def get_accession(self, accession):
+        """
+        Returns the cached Metadata of an accession, None if it has not been seen.
+        """
+        row = self.db.execute(
+            f"SELECT {', '.join(Metadata.FIELDS)} FROM records WHERE accession = ?",
+            (accession,),
+        ).fetchone()
+        return Metadata(*row) if row is not None else None
+
+    def get_hashes(self, paths, threads):
+        hashes = dict()
+        stale = []
+        for path in paths:
+            stat = os.stat(path)
+            row = self.db.execute(
+                "SELECT hash FROM files WHERE path = ? AND size = ? AND mtime = ?",
+                (path, stat.st_size, stat.st_mtime),
+            ).fetchone()
+            if row is not None:
+                hashes[path] = row[0]
+            else:
+                stale.append((path, stat))
+        if len(stale) > 0:
+            with ProcessPoolExecutor(threads) as executor:
+                for (path, stat), hash in zip(
+                    stale, executor.map(compute_file_hash, [path for path, _ in stale])
+                ):
+                    hashes[path] = hash
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                        (path, stat.st_size, stat.st_mtime, hash),
+                    )
+            self.db.commit()
+        return hashes
+
+    def add(self, hash, records):
+        with self.db:
+            for no, metadata in enumerate(records):
+                self.db.execute(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        hash,
+                        no,
+                        *[getattr(metadata, field) for field in Metadata.FIELDS],
+                    ),
+                )
+            self.db.execute(
+                "INSERT OR REPLACE INTO parsed VALUES (?, ?)", (hash, len(records))
+            )
+
+
+def extract_metadata(genbank_file):
+    """
+    Returns the Metadata of the records of a genbank file.
+    """
+    records = []
+    for record in read_genbank(genbank_file, sequence=False):
+        records.append(
+            Metadata(
+                record.get_id(),
+                record.get_source("country") or record.get_source("geo_loc_name"),
+                record.get_source("collection_date"),
+                record.get_submission_date(),
+                record.organism,
+                record.definition,
+            )
+        )
+    return records
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import click
+import shutil
+import numpy as np
+from fasta import read_fasta
+from seqkernel import AMBIGUOUS, to_array
+from seqkernel import hash_kmers as hash_codes
+
+# A k-mer index of a fasta file stored in a directory of memory mapped files.
+#
+# sequences.txt  name, start and length of each sequence in the concatenated sequence
+# sequence.bin   the concatenated sequences as one base bitmask per byte
+# offsets.npy    start of the positions of each k-mer, 4^k + 1 entries
+# positions.npy  positions in the concatenated sequence grouped by k-mer, uint32
+#                when the concatenated sequence is shorter than 4G bases
+# params.txt     k, step and version
+#
+# The index is built in two passes without holding the positions in memory, the
+# first counts the k-mers while writing out the sequences and the second places
+# the positions of each k-mer in its slot.  Only k-mers starting at multiples of
+# step in each sequence are indexed, ambiguous bases are indexed as A.
+#
+# A pattern is seeded by splitting it into p disjoint blocks of k + step - 1 bases,
+# one k-mer of each block starts at an indexed position.  A site with at most m
+# mismatches has a block with at most m // p mismatches, so looking up every k-mer
+# within m // p mismatches of each block seeds every site.  An ambiguous base of a
+# site is a mismatch, indexing it as A can only bring the k-mer closer to the
+# pattern.  Patterns with too many k-mers to look up are matched against the whole
+# concatenated sequence instead.
+
+# IUPAC bases as bitmasks of A, C, G and T
+IUPAC_MASKS = {
+    "A": 1,
+    "C": 2,
+    "G": 4,
+    "T": 8,
+    "U": 8,
+    "M": 3,
+    "R": 5,
+    "W": 9,
+    "S": 6,
+    "Y": 10,
+    "K": 12,
+    "V": 7,
+    "H": 11,
+    "D": 13,
+    "B": 14,
+    "N": 15,
+    "I": 15,
+}
+
+# genome bases, ambiguous bases are 0 so that they never match
+GENOME_ENCODING = np.zeros(256, dtype=np.uint8)
+for base in "ACGTU":
+    GENOME_ENCODING[ord(base)] = IUPAC_MASKS[base]
+    GENOME_ENCODING[ord(base.lower())] = IUPAC_MASKS[base]
+
+# complement of a bitmask is the bitmask reversed, A <-> T and C <-> G
+COMPLEMENT_MASKS = np.array(
+    [int(f"{mask:04b}"[::-1], 2) for mask in range(16)], dtype=np.uint8
+)
+
+# 2 bit codes of the bases of bitmasks
+MASK_CODES = np.full(16, AMBIGUOUS, dtype=np.uint8)
+for code, mask in enumerate([1, 2, 4, 8]):
+    MASK_CODES[mask] = code
+
+# 2 bit codes of the genome bases indexed, ambiguous bases are indexed as A
+INDEX_CODES = MASK_CODES.copy()
+INDEX_CODES[0] = 0
+
+MASK_BASES = np.frombuffer(b"NACNGNNNTNNNNNNN", dtype=np.uint8)
+
+# patterns seeded by more k-mers than this are matched against the whole sequence
+MAX_SEED_CODES = 1 << 16
+
+# version of the index format, indices of other versions have to be rebuilt
+VERSION = 2
+
+# number of bases hashed at a time when building the index
+CHUNK_SIZE = 1 << 24
+
+
+@click.command()
+@click.argument("fasta_file")
+@click.option(
+    "-k",
+    default=12,
+    show_default=True,
+    help="k-mer length, patterns of at least k + step - 1 bases are seeded",
+)
+@click.option(
+    "-s",
+    "--step",
+    default=1,
+    show_default=True,
+    help="index k-mers starting at every step bases",
+)
+@click.option(
+    "-o",
+    "--index_dir",
+    default=None,
+    help="index directory [default: <fasta_file>.k<k>.idx]",
+)
+def main(fasta_file, k, step, index_dir):
+    """
+    Builds a memory mapped k-mer index of a fasta file, the fasta file may be gzipped.
+
+    The index is built once and reused by the programs that seed searches with it.
+
+    e.g. kmer_index.py genbank.260.vrl.fasta.gz -k 12
+    """
+    if index_dir is None:
+        index_dir = f"{fasta_file}.k{k}.idx"
+    if os.path.exists(f"{index_dir}/index.OK"):
+        print(f"{index_dir} already built")
+        return
+    build_index(fasta_file, index_dir, k, step)
+    print(f"index written to {index_dir}")
+
+
+def build_index(fasta_file, index_dir, k=12, step=1):
+    """
+    Builds the index in a temporary directory that is moved into place when complete.
+    """
+    tmp_dir = f"{index_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # pass 1 - write out sequences and count k-mers
+    counts = np.zeros(4**k, dtype=np.int64)
+    total = 0
+    with open(f"{tmp_dir}/sequences.txt", "w") as sequences, open(
+        f"{tmp_dir}/sequence.bin", "wb"
+    ) as out:
+        for record in read_fasta(fasta_file):
+            masks = GENOME_ENCODING[to_array(record.seq)]
+            out.write(masks.tobytes())
+            sequences.write(f"{record.name}\t{total}\t{len(masks)}\n")
+            for positions, codes in hash_kmers(masks, k, step):
+                counts += np.bincount(codes, minlength=4**k)
+            total += len(masks)
+
+    offsets = np.zeros(4**k + 1, dtype=np.uint64)
+    np.cumsum(counts, out=offsets[1:])
+    np.save(f"{tmp_dir}/offsets.npy", offsets)
+    del counts
+
+    # pass 2 - place the positions of each k-mer in its slot
+    dtype = np.uint32 if total < 1 << 32 else np.uint64
+    positions = np.lib.format.open_memmap(
+        f"{tmp_dir}/positions.npy", mode="w+", dtype=dtype, shape=(int(offsets[-1]),)
+    )
+    cursor = offsets[:-1].copy()
+    sequence = np.memmap(f"{tmp_dir}/sequence.bin", dtype=np.uint8, mode="r")
+    for name, start, length in read_sequences(f"{tmp_dir}/sequences.txt"):
+        for pos, codes in hash_kmers(sequence[start : start + length], k, step):
+            order = np.argsort(codes, kind="stable")
+            codes = codes[order]
+            kmers, first, counts = np.unique(codes, return_index=True, return_counts=True)
+            rank = np.arange(len(codes)) - np.repeat(first, counts)
+            positions[cursor[codes] + rank.astype(np.uint64)] = pos[order] + start
+            cursor[kmers] += counts.astype(np.uint64)
+    positions.flush()
+    del positions, sequence
+
+    with open(f"{tmp_dir}/params.txt", "w") as f:
+        f.write(f"k\t{k}\nstep\t{step}\nversion\t{VERSION}\n")
+    open(f"{tmp_dir}/index.OK", "w").close()
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+
+
+def hash_kmers(masks, k, step=1):
+    """
+    Yields the 0-based positions and 2 bit codes of the k-mers of a sequence of base
+    bitmasks that start at multiples of step with ambiguous bases as A, a chunk at a
+    time.
+    """
+    for beg in range(0, max(0, len(masks) - k + 1), CHUNK_SIZE):
+        pos, codes = hash_codes(INDEX_CODES[masks[beg : beg + CHUNK_SIZE + k - 1]], k)
+        pos += beg
+        if step > 1:
+            keep = pos % step == 0
+            pos, codes = pos[keep], codes[keep]
+        yield pos, codes
+
+
+class KmerIndex(object):
+    def __init__(self, index_dir):
+        if not os.path.exists(f"{index_dir}/index.OK"):
+            raise FileNotFoundError(f"{index_dir} is not a complete k-mer index")
+        self.index_dir = index_dir
+        with open(f"{index_dir}/params.txt", "r") as f:
+            params = dict(line.rstrip().split("\t") for line in f)
+        if int(params.get("version", 1)) != VERSION:
+            raise ValueError(f"{index_dir} is of an older format, rebuild it")
+        self.k = int(params["k"])
+        self.step = int(params["step"])
+        self.names = []
+        starts = []
+        lengths = []
+        for name, start, length in read_sequences(f"{index_dir}/sequences.txt"):
+            self.names.append(name)
+            starts.append(start)
+            lengths.append(length)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.lengths = np.array(lengths, dtype=np.int64)
+        self.offsets = np.load(f"{index_dir}/offsets.npy", mmap_mode="r")
+        self.positions = np.load(f"{index_dir}/positions.npy", mmap_mode="r")
+        self.sequence = np.memmap(f"{index_dir}/sequence.bin", dtype=np.uint8, mode="r")
+
+    def lookup(self, codes):
+        """
+        Returns the positions in the concatenated sequence of a set of k-mer codes.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        begs = self.offsets[codes].astype(np.int64)
+        counts = self.offsets[codes + 1].astype(np.int64) - begs
+        # the positions of each k-mer are contiguous, gather them all at once
+        shifts = np.repeat(begs - (np.cumsum(counts) - counts), counts)
+        return self.positions[np.arange(len(shifts)) + shifts].astype(np.int64)
+
+    def get_seeds(self, masks, weights, max_score):
+        """
+        Returns the pattern offsets and codes of the k-mers that seed every site of a
+        pattern with a weighted mismatch score of at most max_score, None if the
+        pattern is too short or would be seeded by too many k-mers.
+        """
+        block = self.k + self.step - 1
+        no_blocks = len(masks) // block
+        min_weight = int(weights.min()) if len(masks) > 0 else 0
+        if no_blocks == 0 or min_weight <= 0:
+            return None
+        max_mismatches = int(max_score) // min_weight // no_blocks
+        seeds = []
+        no_codes = 0
+        for beg in range(0, no_blocks * block, block):
+            for i in range(beg, beg + self.step):
+                codes = expand_kmer(masks[i : i + self.k], max_mismatches)
+                if codes is None:
+                    return None
+                no_codes += len(codes)
+                if no_codes > MAX_SEED_CODES:
+                    return None
+                seeds.append((i, codes))
+        return seeds
+
+    def is_seedable(self, masks, weights, max_score):
+        """
+        Returns true if the sites of a pattern are seeded from the index rather than
+        by matching the pattern against the whole concatenated sequence.
+        """
+        return self.get_seeds(masks, weights, max_score) is not None
+
+    def seed(self, seeds):
+        """
+        Returns the candidate start positions in the concatenated sequence of a pattern
+        seeded by the k-mer codes at each pattern offset.
+        """
+        candidates = [self.lookup(codes) - i for i, codes in seeds]
+        if len(candidates) == 0:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.unique(np.concatenate(candidates))
+        return candidates[candidates >= 0]
+
+    def scan(self, masks, weights, max_score):
+        """
+        Returns the start positions of the sites of a pattern with a weighted mismatch
+        score of at most max_score by matching it at every position of the
+        concatenated sequence, a chunk at a time.
+        """
+        length = len(masks)
+        total = len(self.sequence)
+        begs = [np.zeros(0, dtype=np.int64)]
+        for beg in range(0, max(0, total - length + 1), CHUNK_SIZE):
+            n = min(CHUNK_SIZE, total - length + 1 - beg)
+            score = np.zeros(n, dtype=np.int32)
+            for i in range(length):
+                score += ((self.sequence[beg + i : beg + i + n] & masks[i]) == 0) * int(
+                    weights[i]
+                )
+            begs.append(np.flatnonzero(score <= max_score).astype(np.int64) + beg)
+        return np.concatenate(begs)
+
+    def match(self, masks, weights, max_score):
+        """
+        Verifies the candidates of a pattern of base bitmasks and returns the start
+        positions in the concatenated sequence, the weighted mismatch scores and the
+        numbers of mismatches of the sites with a score of at most max_score.
+
+        Candidates are seeded from the index when the pattern is long enough for
+        every such site to be seeded, otherwise every position is a candidate.
+        """
+        length = len(masks)
+        seeds = self.get_seeds(masks, weights, max_score)
+        if seeds is not None:
+            begs = self.seed(seeds)
+        else:
+            begs = self.scan(masks, weights, max_score)
+        # keep sites that lie within a single sequence
+        seq_ids = self.locate(begs)
+        ends = self.starts[seq_ids] + self.lengths[seq_ids]
+        begs = begs[begs + length <= ends]
+        mismatch = (self.sequence[begs[:, None] + np.arange(length)] & masks) == 0
+        scores = (mismatch * weights).sum(axis=1)
+        keep = scores <= max_score
+        return begs[keep], scores[keep], mismatch[keep].sum(axis=1)
+
+    def locate(self, positions):
+        """
+        Returns the indices of the sequences containing positions in the concatenated sequence.
+        """
+        return np.searchsorted(self.starts, positions, side="right") - 1
+
+    def fetch(self, i):
+        """
+        Returns sequence i, ambiguous bases are returned as N.
+        """
+        masks = self.sequence[self.starts[i] : self.starts[i] + self.lengths[i]]
+        return MASK_BASES[masks].tobytes().decode()
+
+
+def expand_kmer(masks, max_mismatches=0):
+    """
+    Returns the codes of all k-mers within max_mismatches of a possibly degenerate
+    k-mer, None if there are more than MAX_SEED_CODES of them.
+    """
+    bases = np.arange(4, dtype=np.int64)
+    codes = np.zeros(1, dtype=np.int64)
+    mismatches = np.zeros(1, dtype=np.int64)
+    for mask in masks:
+        mismatch = (int(mask) >> bases & 1) == 0
+        codes = (codes[:, None] * 4 + bases).ravel()
+        mismatches = (mismatches[:, None] + mismatch).ravel()
+        keep = mismatches <= max_mismatches
+        codes, mismatches = codes[keep], mismatches[keep]
+        if len(codes) == 0 or len(codes) > MAX_SEED_CODES:
+            return None
+    return codes
+
+
+def encode_pattern(seq):
+    """
+    Returns the base bitmasks of a possibly degenerate sequence.
+    """
+    return np.array([IUPAC_MASKS[base] for base in seq.upper()], dtype=np.uint8)
+
+
+def read_sequences(file):
+    with open(file, "r") as f:
+        for line in f:
+            name, start, length = line.rstrip().split("\t")
+            yield name, int(start), int(length)
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
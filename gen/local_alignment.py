@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import click
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from fasta import read_fasta
+from seqkernel import reverse_complement
+
+# Smith-Waterman local alignment with affine gaps scored like EMBOSS water.
+#
+# The dynamic programming matrix is filled one query row at a time with every
+# row vectorised over the whole target.  The within-row horizontal gap recurrence
+# is resolved with a prefix maximum, which is exact because opening a gap never
+# costs less than extending one.  Scores are doubled internally so that the
+# default gap extension penalty of 0.5 stays integral.
+
+# EDNAFULL (NUC.4.4) as used by water
+EDNAFULL_ALPHABET = "ATGCSWRYKMBVHDNU"
+EDNAFULL = [
+    [5, -4, -4, -4, -4, 1, 1, -4, -4, 1, -4, -1, -1, -1, -2, -4],
+    [-4, 5, -4, -4, -4, 1, -4, 1, 1, -4, -1, -4, -1, -1, -2, 5],
+    [-4, -4, 5, -4, 1, -4, 1, -4, 1, -4, -1, -1, -4, -1, -2, -4],
+    [-4, -4, -4, 5, 1, -4, -4, 1, -4, 1, -1, -1, -1, -4, -2, -4],
+    [-4, -4, 1, 1, -1, -4, -2, -2, -2, -2, -1, -1, -3, -3, -1, -4],
+    [1, 1, -4, -4, -4, -1, -2, -2, -2, -2, -3, -3, -1, -1, -1, 1],
+    [1, -4, 1, -4, -2, -2, -1, -4, -2, -2, -3, -1, -3, -1, -1, -4],
+    [-4, 1, -4, 1, -2, -2, -4, -1, -2, -2, -1, -3, -1, -3, -1, 1],
+    [-4, 1, 1, -4, -2, -2, -2, -2, -1, -4, -1, -3, -3, -1, -1, 1],
+    [1, -4, -4, 1, -2, -2, -2, -2, -4, -1, -3, -1, -1, -3, -1, -4],
+    [-4, -1, -1, -1, -1, -3, -3, -1, -1, -3, -1, -2, -2, -2, -1, -1],
+    [-1, -4, -1, -1, -1, -3, -1, -3, -3, -1, -2, -1, -2, -2, -1, -4],
+    [-1, -1, -4, -1, -3, -1, -3, -1, -3, -1, -2, -2, -1, -2, -1, -1],
+    [-1, -1, -1, -4, -3, -1, -1, -3, -1, -3, -2, -2, -2, -1, -1, -1],
+    [-2, -2, -2, -2, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -2],
+    [-4, 5, -4, -4, -4, 1, -4, 1, 1, -4, -1, -4, -1, -1, -2, 5],
+]
+
+SCALE = 2
+NEG = -(1 << 30)
+
+# characters outside the alphabet are scored as N
+ENCODING = np.full(256, EDNAFULL_ALPHABET.index("N"), dtype=np.uint8)
+for i, base in enumerate(EDNAFULL_ALPHABET):
+    ENCODING[ord(base)] = i
+    ENCODING[ord(base.lower())] = i
+
+# code of the padding symbol that left aligns queries of different lengths in a
+# batch, it scores so badly that no alignment passes through it
+PAD = len(EDNAFULL_ALPHABET)
+PAD_SCORE = -(1 << 20)
+
+# number of target bases aligned against all queries at a time
+BLOCK_SIZE = 16384
+
+# traceback flags
+DIAG = 1
+UP = 2
+LEFT = 4
+UP_EXTEND = 8
+
+
+@click.command()
+@click.argument("query_fasta_file")
+@click.argument("target_fasta_file")
+@click.option("-o", "--gap_open", default=10.0, show_default=True, help="gap open penalty")
+@click.option(
+    "-e", "--gap_extend", default=0.5, show_default=True, help="gap extension penalty"
+)
+def main(query_fasta_file, target_fasta_file, gap_open, gap_extend):
+    """
+    Smith-Waterman local alignment of every query sequence against both strands of every target sequence
+
+    e.g. local_alignment.py primers.fasta ref.fasta
+    """
+    queries = list(read_fasta(query_fasta_file))
+    qnames = [query.name for query in queries]
+    qseqs = [query.seq for query in queries]
+    for target in read_fasta(target_fasta_file):
+        alignments = align_strands(
+            qseqs, target.seq, qnames, target.name, gap_open, gap_extend
+        )
+        for forward, reverse in alignments:
+            for alignment in [forward, reverse]:
+                print("==========")
+                alignment.print()
+
+
+def align(query, target, qname="query", tname="target", gap_open=10, gap_extend=0.5):
+    """
+    Returns the best local Alignment of query against target.
+
+    Coordinates in the alignment are 1-based and inclusive as in water reports.  An
+    Alignment with a score of 0 and no aligned bases is returned if nothing aligns.
+    """
+    matrix, go, ge = get_scoring(gap_open, gap_extend)
+    t = encode(target)
+    hits = scan(pad([encode(query)]), t, matrix, go, ge)
+    return get_alignment(query, target, qname, tname, *hits[0], matrix, go, ge)
+
+
+def align_strands(
+    queries, target, qnames=None, tname="target", gap_open=10, gap_extend=0.5
+):
+    """
+    Aligns a batch of queries against both strands of target in a single pass over it.
+
+    Returns a [forward, reverse] pair of Alignments for each query.  The reverse strand
+    Alignment is that of the reverse complemented query against target so its target
+    coordinates are on the forward strand like the forward Alignment, its qbeg and qend
+    are positions in the reverse complemented query.
+    """
+    if qnames is None:
+        qnames = [f"query{i+1}" for i in range(len(queries))]
+    matrix, go, ge = get_scoring(gap_open, gap_extend)
+    t = encode(target)
+
+    seqs = []
+    for query in queries:
+        seqs.append(query)
+        seqs.append(reverse_complement(query))
+    hits = scan(pad([encode(seq) for seq in seqs]), t, matrix, go, ge)
+
+    alignments = []
+    for i, qname in enumerate(qnames):
+        forward = get_alignment(
+            seqs[2 * i], target, qname, tname, *hits[2 * i], matrix, go, ge
+        )
+        reverse = get_alignment(
+            seqs[2 * i + 1],
+            target,
+            qname,
+            tname,
+            *hits[2 * i + 1],
+            matrix,
+            go,
+            ge,
+            strand="-",
+        )
+        alignments.append([forward, reverse])
+    return alignments
+
+
+def align_records(
+    queries, records, qnames=None, threads=1, gap_open=10, gap_extend=0.5
+):
+    """
+    Aligns a batch of queries against both strands of each of a stream of FastaRecords
+    in a process pool.
+
+    Yields each record with its align_strands Alignments in the order of the records,
+    only a few records per process are held in memory at a time.
+    """
+    with ProcessPoolExecutor(threads) as executor:
+        pending = deque()
+        for record in records:
+            future = executor.submit(
+                align_strands,
+                queries,
+                record.seq,
+                qnames,
+                record.name,
+                gap_open,
+                gap_extend,
+            )
+            pending.append((record, future))
+            if len(pending) >= 4 * threads:
+                record, future = pending.popleft()
+                yield record, future.result()
+        while pending:
+            record, future = pending.popleft()
+            yield record, future.result()
+
+
+def get_scoring(gap_open, gap_extend):
+    go = int(round(gap_open * SCALE))
+    ge = int(round(gap_extend * SCALE))
+    matrix = np.array(EDNAFULL, dtype=np.int32) * SCALE
+    matrix = np.vstack([matrix, np.full(matrix.shape[1], PAD_SCORE, dtype=np.int32)])
+    return matrix, go, ge
+
+
+def get_alignment(
+    query, target, qname, tname, score, qend, tend, matrix, go, ge, strand="+"
+):
+    """
+    Traces back the alignment of query ending at 1-based query and target end positions.
+    """
+    if score <= 0:
+        return Alignment(qname, tname, 0, 0, 0, 0, 0, "", "", strand)
+
+    # the alignment ending at (qend, tend) can only span as many target bases as
+    # the query bases up to qend plus the longest total gap its score can pay for
+    q = encode(query)
+    t = encode(target)
+    max_match = int(matrix.max())
+    span = qend + (max_match * qend - score) // ge + 1
+    tbeg = max(0, tend - span)
+
+    # the span of a weak hit is many times the query length, so the start of the
+    # alignment is found in linear memory first and only the window of the
+    # alignment itself is traced back
+    qlen, tlen = find_start(
+        q[:qend][::-1], t[tbeg:tend][::-1], score, matrix, go, ge
+    )
+    qbeg = qend - qlen
+    tbeg = tend - tlen
+    i, tbeg, qaln, taln = traceback(
+        q[qbeg:qend], t[tbeg:tend], query[qbeg:qend], target, tbeg, matrix, go, ge
+    )
+    qbeg += i
+
+    return Alignment(
+        qname, tname, score / SCALE, qbeg + 1, qend, tbeg + 1, tend, qaln, taln, strand
+    )
+
+
+def encode(seq):
+    return ENCODING[np.frombuffer(seq.encode(), dtype=np.uint8)]
+
+
+def pad(queries):
+    """
+    Left pads encoded queries into a single matrix with one query per row.
+
+    The rows of the dynamic programming matrix stay 0 over the padding so a padded
+    query aligns exactly as it would on its own.
+    """
+    width = max(len(q) for q in queries)
+    padded = np.full((len(queries), width), PAD, dtype=np.uint8)
+    for i, q in enumerate(queries):
+        padded[i, width - len(q) :] = q
+    return padded
+
+
+def scan(queries, t, matrix, go, ge):
+    """
+    Returns the best local alignment score and its 1-based query and target end positions
+    for each row of a padded query matrix.
+
+    The target is processed in blocks of columns small enough to stay in cache with all
+    queries aligned against each block before moving on, so the target is read once.
+    The last column of H and of the horizontal gap scores of every query row are carried
+    over from one block to the next.
+    """
+    b, m = queries.shape
+    n = len(t)
+    Hlast = np.zeros((m + 1, b), dtype=np.int32)
+    Elast = np.full((m + 1, b), NEG, dtype=np.int32)
+    best = np.zeros(b, dtype=np.int64)
+    best_i = np.zeros(b, dtype=np.int64)
+    best_j = np.zeros(b, dtype=np.int64)
+    rows = np.arange(b)
+    for beg in range(0, n, BLOCK_SIZE):
+        w = min(BLOCK_SIZE, n - beg)
+        profile = matrix[:, t[beg : beg + w]]
+        offsets = np.arange(w + 1, dtype=np.int32) * ge
+        H = np.zeros((b, w + 1), dtype=np.int32)
+        F = np.full((b, w + 1), NEG, dtype=np.int32)
+        Ht = np.empty((b, w + 1), dtype=np.int32)
+        E = np.empty((b, w + 1), dtype=np.int32)
+        E[:, 0] = NEG
+        last = Hlast[0].copy()
+        for i in range(m):
+            # column 0 is the last column of the previous block
+            H[:, 0] = last
+            F = np.maximum(H - go, F - ge)
+            Ht[:, 1:] = H[:, :-1] + profile[queries[:, i]]
+            np.maximum(Ht, F, out=Ht)
+            np.maximum(Ht, 0, out=Ht)
+            last = Hlast[i + 1].copy()
+            Ht[:, 0] = last
+            E[:, 1:] = np.maximum(
+                np.maximum.accumulate(Ht + offsets, axis=1)[:, :-1] - go - offsets[:-1],
+                Elast[i + 1][:, None] - offsets[1:],
+            )
+            H = np.maximum(Ht, E)
+            Hlast[i + 1] = H[:, w]
+            Elast[i + 1] = E[:, w]
+
+            # ties go to the smallest query and then target end position
+            j = H.argmax(axis=1)
+            score = H[rows, j]
+            tied = (score == best) & (score > 0)
+            earlier = (i + 1 < best_i) | ((i + 1 == best_i) & (beg + j < best_j))
+            better = (score > best) | (tied & earlier)
+            best[better] = score[better]
+            best_i[better] = i + 1
+            best_j[better] = beg + j[better]
+
+    # convert query end positions of padded rows back to positions in the query
+    lengths = (queries != PAD).sum(axis=1)
+    best_i = np.where(best > 0, best_i - (m - lengths), 0)
+    return [(int(best[k]), int(best_i[k]), int(best_j[k])) for k in range(b)]
+
+
+def find_start(q, t, score, matrix, go, ge):
+    """
+    Returns the query and target lengths of the alignment of the reversed q and t
+    that starts at their first bases and scores score, the one spanning the most
+    target bases if there are several.
+
+    Only a row of the dynamic programming matrix is kept at a time.
+    """
+    m = len(q)
+    n = len(t)
+    profile = matrix[:, t]
+    offsets = np.arange(n + 1, dtype=np.int64) * ge
+    H = np.full(n + 1, NEG, dtype=np.int64)
+    H[0] = 0
+    F = np.full(n + 1, NEG, dtype=np.int64)
+    E = np.full(n + 1, NEG, dtype=np.int64)
+    start = (m, n)
+    tlen = -1
+    for i in range(1, m + 1):
+        F = np.maximum(np.maximum(H - go, F - ge), NEG)
+        Ht = np.full(n + 1, NEG, dtype=np.int64)
+        Ht[1:] = np.maximum(H[:-1] + profile[q[i - 1]], F[1:])
+        running = np.maximum.accumulate(Ht + offsets)
+        E[1:] = running[:-1] - go - offsets[:-1]
+        H = np.maximum(np.maximum(Ht, E), NEG)
+        hits = np.flatnonzero(H == score)
+        if len(hits) > 0 and hits[-1] > tlen:
+            tlen = int(hits[-1])
+            start = (i, tlen)
+    return start
+
+
+def traceback(q, t, query, target, offset, matrix, go, ge):
+    """
+    Aligns q against the target window t ending at the last bases of both and returns
+    the 0-based start positions and the aligned query and target strings.
+    """
+    m = len(q)
+    n = len(t)
+    profile = matrix[:, t]
+    offsets = np.arange(n + 1, dtype=np.int32) * ge
+    columns = np.arange(n + 1, dtype=np.int32)
+    flags = np.zeros((m + 1, n + 1), dtype=np.uint8)
+    sources = np.zeros((m + 1, n + 1), dtype=np.int32)
+    H = np.zeros(n + 1, dtype=np.int32)
+    F = np.full(n + 1, NEG, dtype=np.int32)
+    Ht = np.zeros(n + 1, dtype=np.int32)
+    E = np.full(n + 1, NEG, dtype=np.int32)
+    for i in range(1, m + 1):
+        opened = H - go
+        extended = F - ge
+        F = np.maximum(opened, extended)
+        diag = np.full(n + 1, NEG, dtype=np.int32)
+        diag[1:] = H[:-1] + profile[q[i - 1]]
+        Ht = np.maximum(np.maximum(diag, F), 0)
+        Ht[0] = 0
+        prefix = Ht + offsets
+        running = np.maximum.accumulate(prefix)
+        # last column at which the running maximum was attained, i.e. where the gap opens
+        source = np.maximum.accumulate(np.where(prefix == running, columns, 0))
+        E[1:] = running[:-1] - go - offsets[:-1]
+        H = np.maximum(Ht, E)
+
+        row = np.where(diag >= F, DIAG, UP).astype(np.uint8)
+        row[Ht <= 0] = 0
+        row[E > Ht] |= LEFT
+        row[extended > opened] |= UP_EXTEND
+        flags[i] = row
+        sources[i, 1:] = source[:-1]
+
+    qaln = []
+    taln = []
+    i, j = m, n
+    state = "H"
+    while i > 0 and j > 0:
+        if state == "H":
+            if flags[i, j] & LEFT:
+                k = int(sources[i, j])
+                qaln.append("-" * (j - k))
+                taln.append(target[offset + k : offset + j][::-1])
+                j = k
+            state = "Ht"
+        elif state == "Ht":
+            move = flags[i, j] & (DIAG | UP)
+            if move == DIAG:
+                qaln.append(query[i - 1])
+                taln.append(target[offset + j - 1])
+                i -= 1
+                j -= 1
+                state = "H"
+            elif move == UP:
+                state = "F"
+            else:
+                break
+        else:
+            qaln.append(query[i - 1])
+            taln.append("-")
+            extend = flags[i, j] & UP_EXTEND
+            i -= 1
+            state = "F" if extend else "H"
+
+    return i, offset + j, "".join(qaln)[::-1], "".join(taln)[::-1]
+
+
+class Alignment(object):
+    def __init__(self, qseq, rseq, score, qbeg, qend, beg, end, qaln, raln, strand="+"):
+        self.qseq = qseq
+        self.rseq = rseq
+        self.score = score
+        self.qbeg = qbeg
+        self.qend = qend
+        self.beg = beg
+        self.end = end
+        self.qaln = qaln
+        self.raln = raln
+        self.strand = strand
+        self.length = len(qaln)
+        self.identity = sum(a == b for a, b in zip(qaln.upper(), raln.upper()))
+        self.similarity = sum(
+            a != "-" and b != "-" and score_pair(a, b) > 0 for a, b in zip(qaln, raln)
+        )
+        self.gaps = qaln.count("-") + raln.count("-")
+        self.align = self.format()
+
+    def get_similarity_score(self):
+        return int(self.identity) / int(self.length) * 100 if self.length else 0
+
+    def get_similarity(self):
+        return f"{self.get_similarity_score():.2f}% ({self.identity}/{self.length})"
+
+    def format(self, width=50):
+        lines = []
+        qpos = self.qbeg
+        rpos = self.beg
+        for i in range(0, self.length, width):
+            qaln = self.qaln[i : i + width]
+            raln = self.raln[i : i + width]
+            match = "".join(match_symbol(a, b) for a, b in zip(qaln, raln))
+            qlen = len(qaln) - qaln.count("-")
+            rlen = len(raln) - raln.count("-")
+            lines.append(f"{self.qseq[:13]:<13} {qpos:>8} {qaln} {qpos + qlen - 1:>8}")
+            lines.append(f"{'':<13} {'':>8} {match}")
+            lines.append(f"{self.rseq[:13]:<13} {rpos:>8} {raln} {rpos + rlen - 1:>8}")
+            lines.append("")
+            qpos += qlen
+            rpos += rlen
+        return "\n".join(lines)
+
+    def print(self):
+        print(f"qseq      : {self.qseq}")
+        print(f"rseq      : {self.rseq}")
+        print(f"strand    : {self.strand}")
+        print(f"length    : {self.length}")
+        print(f"identity  : {self.identity}")
+        print(f"gaps      : {self.gaps}")
+        print(f"score     : {self.score}")
+        print(f"beg       : {self.beg}")
+        print(f"end       : {self.end}")
+        print(f"\n{self.align}")
+
+
+def score_pair(a, b):
+    return EDNAFULL[ENCODING[ord(a)]][ENCODING[ord(b)]]
+
+
+def match_symbol(a, b):
+    if a == "-" or b == "-":
+        return " "
+    elif a.upper() == b.upper():
+        return "|"
+    elif score_pair(a, b) > 0:
+        return ":"
+    else:
+        return "."
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import click
+import hashlib
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from cache_util import FileLock, get_default_cache_path, write_atomically
+from efetch import EFetcher, EUTILS_URL, match_records
+
+DEFAULT_STORE_DIR = get_default_cache_path("CAVSPIPES_RECORD_STORE", "records")
+
+# accessions fetched per request
+BATCH_SIZE = 200
+
+
+@click.command()
+@click.argument("ids", nargs=-1)
+@click.option(
+    "-i", "--id_file", default=None, help="file of accessions to get, one per line"
+)
+@click.option(
+    "-f",
+    "--download_type",
+    default="fasta",
+    type=click.Choice(["fasta", "genbank"]),
+    show_default=True,
+    help="record format - fasta or genbank",
+)
+@click.option(
+    "-o",
+    "--output_file",
+    default=None,
+    help="output file of the records, the stored record paths are printed otherwise",
+)
+@click.option(
+    "-s",
+    "--store_dir",
+    default=DEFAULT_STORE_DIR,
+    show_default=True,
+    help="record store directory",
+)
+@click.option(
+    "-r",
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="fetch the records again, e.g. to get the latest version of an accession",
+)
+@click.option(
+    "-u",
+    "--eutils_url",
+    default=EUTILS_URL,
+    show_default=True,
+    help="E-utilities base URL",
+)
+def main(ids, id_file, download_type, output_file, store_dir, refresh, eutils_url):
+    """
+    Gets nucleotide records from a shared local store, fetching them from NCBI only
+    if they have not been fetched before.
+
+    Records are stored by content and looked up by accession with or without the
+    version, an accession without a version resolves to the version first fetched.
+
+    e.g. record_store.py AJ810453.1 -f genbank -o ref/AJ810453.1.genbank
+    """
+    ids = list(ids)
+    if id_file is not None:
+        with open(id_file, "r") as f:
+            ids.extend(line.strip() for line in f if line.strip() != "")
+    if len(ids) == 0:
+        exit("no accessions to get")
+
+    store = RecordStore(store_dir, eutils_url)
+    if output_file is not None:
+        missing = store.export(ids, download_type, output_file, refresh)
+    else:
+        files, missing = store.fetch(ids, download_type, refresh)
+        for id, file in files.items():
+            print(f"{id}\t{file}")
+    if len(missing) > 0:
+        for id in missing:
+            print(f"not fetched {id}", file=sys.stderr)
+        sys.exit(1)
+
+
+class RecordStore(object):
+    """
+    Content addressed store of fetched records.
+
+    A record is stored once under the sha256 of its text in objects/ and referenced by
+    each name it was requested or returned under in refs/<format>/, so the same record
+    fetched as KM067908 and KM067908.1 is stored once.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR, eutils_url=EUTILS_URL, api_key=None):
+        self.store_dir = os.path.abspath(store_dir)
+        self.eutils_url = eutils_url
+        self.api_key = api_key or os.environ.get("NCBI_API_KEY")
+
+    def get_ref_file(self, id, download_type):
+        return f"{self.store_dir}/refs/{download_type}/{id}"
+
+    def get_object_file(self, digest):
+        return f"{self.store_dir}/objects/{digest[:2]}/{digest}"
+
+    def lookup(self, id, download_type):
+        """
+        Returns the stored file of the record of an id, None if it is not stored.
+        """
+        ref_file = self.get_ref_file(id, download_type)
+        if not os.path.exists(ref_file):
+            return None
+        with open(ref_file, "r") as f:
+            object_file = self.get_object_file(f.read().strip())
+        return object_file if os.path.exists(object_file) else None
+
+    def add(self, record, names, download_type):
+        """
+        Stores the text of a record under each of its names and returns the stored file.
+        """
+        data = record.encode()
+        object_file = self.get_object_file(hashlib.sha256(data).hexdigest())
+        if not os.path.exists(object_file):
+            write_atomically(object_file, data)
+        digest = os.path.basename(object_file)
+        for name in names:
+            write_atomically(self.get_ref_file(name, download_type), digest.encode())
+        return object_file
+
+    def fetch(self, ids, download_type, refresh=False):
+        """
+        Returns the stored files of the records of ids in a dict keyed by id and the ids
+        that could not be fetched.
+
+        Records not in the store are fetched in batches under an exclusive lock so
+        concurrent invocations fetch a record only once.
+        """
+        ids = list(dict.fromkeys(ids))
+        files = dict()
+        for id in ids:
+            file = None if refresh else self.lookup(id, download_type)
+            if file is not None:
+                files[id] = file
+        unstored = [id for id in ids if id not in files]
+        if len(unstored) > 0:
+            with FileLock(f"{self.store_dir}/.lock"):
+                # someone else fetched them while we were waiting
+                if not refresh:
+                    for id in unstored:
+                        file = self.lookup(id, download_type)
+                        if file is not None:
+                            files[id] = file
+                    unstored = [id for id in unstored if id not in files]
+                files.update(self.fetch_records(unstored, download_type))
+        missing = [id for id in ids if id not in files]
+        return {id: files[id] for id in ids if id in files}, missing
+
+    def fetch_records(self, ids, download_type):
+        """
+        Fetches the records of ids from NCBI into the store and returns their files.
+        """
+        files = dict()
+        if len(ids) == 0:
+            return files
+        fetcher = EFetcher(self.eutils_url, self.api_key, 1, 10 if self.api_key else 3)
+        for i in range(0, len(ids), BATCH_SIZE):
+            batch = ids[i : i + BATCH_SIZE]
+            try:
+                text = fetcher.retry(fetcher.url, fetcher.post, batch, download_type)
+            except Exception as e:
+                print(f"failed batch {batch[0]}..{batch[-1]} : {e}", file=sys.stderr)
+                continue
+            for id, accession, record in match_records(text, batch, download_type):
+                files[id] = self.add(record, {id, accession}, download_type)
+        print(f"{len(files)} of {len(ids)} records fetched", file=sys.stderr)
+        return files
+
+    def export(self, ids, download_type, output_file, refresh=False):
+        """
+        Writes the records of ids to output_file in the order given and returns the ids
+        that could not be fetched, the output file is only written if all are found.
+        """
+        files, missing = self.fetch(ids, download_type, refresh)
+        if len(missing) == 0:
+            data = []
+            for file in files.values():
+                with open(file, "rb") as f:
+                    data.append(f.read())
+            write_atomically(output_file, b"".join(data))
+        return missing
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import sys
+import click
+import shutil
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from cache_util import build_once, get_default_cache_path, get_file_hash
+
+DEFAULT_CACHE_DIR = get_default_cache_path("CAVSPIPES_REFERENCE_CACHE", "reference")
+
+
+@click.command()
+@click.argument("reference_fasta_file")
+@click.option(
+    "-x",
+    "--indexer",
+    default="all",
+    show_default=True,
+    type=click.Choice(["bwa", "minimap2", "all"]),
+    help="index to build",
+)
+@click.option(
+    "-c",
+    "--cache_dir",
+    default=DEFAULT_CACHE_DIR,
+    show_default=True,
+    help="reference cache directory",
+)
+@click.option(
+    "-l",
+    "--link",
+    is_flag=True,
+    default=False,
+    help="symlink the cached index files next to the reference fasta file",
+)
+def main(reference_fasta_file, indexer, cache_dir, link):
+    """
+    Builds bwa and minimap2 indices of a reference fasta file in a shared cache keyed by file content.
+
+    The index is built only once for the same reference sequences regardless of the
+    path and name of the fasta file, concurrent invocations wait for the first to
+    finish.  The cached index path is printed out.
+
+    e.g. refcache.py ref.fasta -x bwa
+    """
+    cache = ReferenceCache(cache_dir)
+    indexers = ["bwa", "minimap2"] if indexer == "all" else [indexer]
+    for indexer in indexers:
+        if link:
+            index = cache.link_index(reference_fasta_file, indexer)
+        else:
+            index = cache.get_index(reference_fasta_file, indexer)
+        print(index)
+
+
+class ReferenceCache(object):
+    # programs
+    bwa = "/usr/local/bwa-0.7.17/bwa"
+    minimap2 = "/usr/local/minimap2-2.24/minimap2"
+
+    # index files written by each indexer for a reference fasta file
+    INDEX_EXTENSIONS = {
+        "bwa": [".amb", ".ann", ".bwt", ".pac", ".sa"],
+        "minimap2": [".mmi"],
+    }
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = os.path.abspath(cache_dir)
+
+    def get_entry_dir(self, fasta_file):
+        digest = get_file_hash(fasta_file, f"{self.cache_dir}/hashes")
+        return f"{self.cache_dir}/{digest[:2]}/{digest}"
+
+    def get_bwa_index(self, fasta_file):
+        return self.get_index(fasta_file, "bwa")
+
+    def get_minimap2_index(self, fasta_file):
+        return self.get_index(fasta_file, "minimap2")
+
+    def get_index(self, fasta_file, indexer):
+        """
+        Returns the path to the cached index, building it if it does not exist yet.
+
+        For bwa this is the index prefix and for minimap2 the .mmi file.  The index is
+        built in a temporary directory under an exclusive lock and moved into place
+        before the OK file is written, so a present OK file implies a complete index.
+        """
+        entry_dir = self.get_entry_dir(fasta_file)
+        ref_fasta_file = f"{entry_dir}/ref.fasta"
+        index = ref_fasta_file if indexer == "bwa" else f"{ref_fasta_file}.mmi"
+        ok_file = f"{entry_dir}/{indexer}_index.OK"
+
+        build_once(
+            entry_dir,
+            ok_file,
+            lambda tmp_dir: self.build_index(fasta_file, indexer, entry_dir, tmp_dir),
+        )
+        return index
+
+    def build_index(self, fasta_file, indexer, entry_dir, tmp_dir):
+        """
+        Builds the index of a fasta file in tmp_dir and moves it into the entry
+        directory, the fasta file is copied into the entry directory first.
+        """
+        ref_fasta_file = f"{entry_dir}/ref.fasta"
+        tmp_fasta_file = f"{tmp_dir}/ref.fasta"
+        if not os.path.exists(ref_fasta_file):
+            shutil.copyfile(fasta_file, tmp_fasta_file)
+            os.replace(tmp_fasta_file, ref_fasta_file)
+
+        if indexer == "bwa":
+            cmd = f"{self.bwa} index -a bwtsw -p {tmp_fasta_file} {ref_fasta_file}"
+        else:
+            cmd = f"{self.minimap2} -d {tmp_fasta_file}.mmi {ref_fasta_file}"
+        # stderr is passed through so a failed build can be diagnosed
+        subprocess.run(cmd, shell=True, check=True, stdout=subprocess.DEVNULL)
+
+        for ext in self.INDEX_EXTENSIONS[indexer]:
+            os.replace(f"{tmp_fasta_file}{ext}", f"{ref_fasta_file}{ext}")
+
+    def link_index(self, fasta_file, indexer):
+        """
+        Symlinks the cached index files next to a fasta file so that tools expecting the
+        index alongside the fasta file work unchanged.  Returns the cached index path.
+        """
+        index = self.get_index(fasta_file, indexer)
+        ref_fasta_file = f"{os.path.dirname(index)}/ref.fasta"
+        for ext in self.INDEX_EXTENSIONS[indexer]:
+            link = f"{fasta_file}{ext}"
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(f"{ref_fasta_file}{ext}", link)
+        return index
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
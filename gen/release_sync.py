@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import re
+import sys
+import click
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from download import Downloader, DownloadError
+
+# Incremental sync of a remote release directory.
+#
+# Every release directory gets a manifest of the size, last modified time and md5,
+# where the server publishes one, of each remote file.  When a new release is set
+# up, files that are unchanged since the previous release are hardlinked from the
+# previous release directory so only new and changed files need downloading.
+
+MANIFEST_FILE = "manifest.tsv"
+
+# checksum file published alongside the files of some NCBI directories
+MD5_FILE = "md5checksums.txt"
+
+
+@click.command()
+@click.argument("url")
+@click.option(
+    "-p",
+    "--pattern",
+    default=".",
+    show_default=True,
+    help="regular expression of the file names to sync",
+)
+@click.option("-o", "--output_dir", required=True, help="output directory")
+@click.option(
+    "-r",
+    "--previous_dir",
+    default=None,
+    help="directory of the previous release with a manifest",
+)
+@click.option(
+    "-u",
+    "--url_file",
+    default=None,
+    help="output file of the URLs of the files to download",
+)
+def main(url, pattern, output_dir, previous_dir, url_file):
+    """
+    Hardlinks the files of a remote directory that are unchanged since the previous
+    release and lists the files that need downloading.
+
+    e.g. release_sync.py https://ftp.ncbi.nlm.nih.gov/refseq/release/viral/
+            -p "genomic.fna.gz$" -o 227/viral -r 226/viral -u urls.txt
+         download.py -i urls.txt -o 227/viral
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest, download = sync_release(url, pattern, output_dir, previous_dir)
+    if url_file is not None:
+        download = set(download)
+        write_url_file(
+            url_file, url, [entry for entry in manifest if entry.name in download]
+        )
+
+
+class ManifestEntry(object):
+    def __init__(self, name, size, last_modified, md5):
+        self.name = name
+        self.size = size
+        self.last_modified = last_modified
+        self.md5 = md5
+
+    def is_unchanged(self, previous):
+        """
+        Returns true if the remote file is the same as in the previous release, by
+        checksum when both have one, otherwise by size and modification time.
+        """
+        if self.size != previous.size:
+            return False
+        if self.md5 and previous.md5:
+            return self.md5 == previous.md5
+        return self.last_modified != "" and self.last_modified == previous.last_modified
+
+    def to_tsv(self):
+        return f"{self.name}\t{self.size}\t{self.last_modified}\t{self.md5}"
+
+
+def read_manifest(file):
+    """
+    Returns the ManifestEntries of a manifest file keyed by file name.
+    """
+    entries = dict()
+    with open(file, "r") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            name, size, last_modified, md5 = line.rstrip("\n").split("\t")
+            entries[name] = ManifestEntry(name, int(size), last_modified, md5)
+    return entries
+
+
+def write_manifest(file, entries):
+    with open(f"{file}.tmp", "w") as f:
+        f.write("#file\tsize\tlast_modified\tmd5\n")
+        for entry in entries:
+            f.write(f"{entry.to_tsv()}\n")
+    os.replace(f"{file}.tmp", file)
+
+
+def get_url(url, name):
+    return f"{url.rstrip('/')}/{name}"
+
+
+def write_url_file(file, url, entries):
+    """
+    Writes the URLs of the ManifestEntries of a remote directory with their md5 in the
+    url, file name, md5 format of download.py so that the downloads are verified.
+    """
+    with open(file, "w") as f:
+        for entry in entries:
+            f.write(f"{get_url(url, entry.name)}\t\t{entry.md5}\n")
+
+
+def list_directory(url, downloader=None):
+    """
+    Returns the file names linked from a HTTP directory listing.
+    """
+    downloader = downloader or Downloader()
+    text = downloader.retry(url, get_text, downloader, url)
+    names = []
+    for name in re.findall(r'href="([^"?/]+)"', text):
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def get_text(downloader, url):
+    with downloader.get_limiter(url):
+        response = downloader.request(url, {})
+        text = response.read()
+        if response.status != 200:
+            raise DownloadError(f"{url} returned {response.status}")
+    return text.decode()
+
+
+def get_file_info(downloader, url):
+    """
+    Returns the size and last modified time of a remote file from a HEAD request.
+    """
+    with downloader.get_limiter(url):
+        response = downloader.request(url, {}, "HEAD")
+        response.read()
+        if response.status != 200:
+            raise DownloadError(f"{url} returned {response.status}")
+        size = response.getheader("Content-Length")
+        if size is None:
+            raise DownloadError(f"{url} has no size", retry=False)
+    return int(size), response.getheader("Last-Modified", "")
+
+
+def get_md5s(url, names, listing, downloader):
+    """
+    Returns the md5 checksums published for the files of a remote directory, either in
+    a md5checksums.txt file or in a .md5 file per file.
+    """
+    md5s = dict()
+    if MD5_FILE in listing:
+        text = downloader.retry(url, get_text, downloader, get_url(url, MD5_FILE))
+        for line in text.splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                md5s[os.path.basename(fields[1])] = fields[0]
+    for name in names:
+        if name not in md5s and f"{name}.md5" in listing:
+            md5_url = get_url(url, f"{name}.md5")
+            text = downloader.retry(md5_url, get_text, downloader, md5_url)
+            fields = text.split()
+            md5s[name] = fields[0] if len(fields) > 0 else ""
+    return md5s
+
+
+def get_manifest(url, names, listing, downloader):
+    """
+    Returns the ManifestEntries of files of a remote directory.
+    """
+    md5s = get_md5s(url, names, set(listing), downloader)
+    with ThreadPoolExecutor(downloader.connections) as executor:
+        infos = executor.map(
+            lambda name: downloader.retry(
+                get_url(url, name), get_file_info, downloader, get_url(url, name)
+            ),
+            names,
+        )
+        return [
+            ManifestEntry(name, size, last_modified, md5s.get(name, ""))
+            for name, (size, last_modified) in zip(names, infos)
+        ]
+
+
+def find_previous_release(output_directory, release_number, database):
+    """
+    Returns the database directory of the latest release before release_number that
+    has a manifest, None if there is none.
+    """
+    releases = []
+    for release in os.listdir(output_directory):
+        if not re.fullmatch(r"\d+(\.\d+)?", release):
+            continue
+        if float(release) >= float(release_number):
+            continue
+        if os.path.exists(f"{output_directory}/{release}/{database}/{MANIFEST_FILE}"):
+            releases.append(release)
+    if len(releases) == 0:
+        return None
+    release = max(releases, key=float)
+    return f"{output_directory}/{release}/{database}"
+
+
+def sync_release(url, pattern, output_dir, previous_dir=None, downloader=None):
+    """
+    Lists the files of a remote directory matching pattern, writes their manifest to
+    output_dir and hardlinks the files that are unchanged from previous_dir.  Returns
+    the ManifestEntries of the files and the names of the files to download.
+
+    A previous file is only linked if it is complete, download.py only moves a file
+    into place once it is complete.
+    """
+    downloader = downloader or Downloader()
+    listing = list_directory(url, downloader)
+    names = [name for name in listing if re.search(pattern, name)]
+    manifest = get_manifest(url, names, listing, downloader)
+    write_manifest(f"{output_dir}/{MANIFEST_FILE}", manifest)
+    previous = dict()
+    if previous_dir is not None:
+        previous = read_manifest(f"{previous_dir}/{MANIFEST_FILE}")
+
+    no_linked = 0
+    download = []
+    for entry in manifest:
+        file = f"{output_dir}/{entry.name}"
+        if os.path.exists(file):
+            if os.path.getsize(file) == entry.size:
+                continue
+            # changed on the server since it was downloaded
+            os.remove(file)
+        if entry.name in previous and entry.is_unchanged(previous[entry.name]):
+            previous_file = f"{previous_dir}/{entry.name}"
+            if (
+                os.path.exists(previous_file)
+                and os.path.getsize(previous_file) == entry.size
+            ):
+                try:
+                    os.link(previous_file, file)
+                    no_linked += 1
+                    continue
+                except OSError as e:
+                    print(f"cannot link {previous_file} : {e}", file=sys.stderr)
+        download.append(entry.name)
+    print(
+        f"{len(manifest)} files, {no_linked} linked from "
+        f"{previous_dir}, {len(download)} to download"
+    )
+    return manifest, download
+
+
+if __name__ == "__main__":
+    main()  # type: ignore
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import numpy as np
+
+# Vectorised nucleotide sequence kernels.
+#
+# Sequences are handled as uint8 arrays of ASCII characters, as uint8 arrays of
+# 2 bit base codes (A=0, C=1, G=2, T=3 and 4 for anything else) or packed with
+# 4 bases per byte.  Every function accepts a str, bytes or a uint8 array and
+# works on the whole sequence with lookup tables instead of per base Python code.
+
+# IUPAC complements, case is preserved
+COMPLEMENT = np.arange(256, dtype=np.uint8)
+for base, complement in zip(
+    b"ACGTUMRWSYKVHDBNacgtumrwsykvhdbn", b"TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn"
+):
+    COMPLEMENT[base] = complement
+
+# 2 bit base codes, 4 marks an ambiguous base
+AMBIGUOUS = 4
+CODES = np.full(256, AMBIGUOUS, dtype=np.uint8)
+for code, bases in enumerate([b"Aa", b"Cc", b"Gg", b"TtUu"]):
+    for base in bases:
+        CODES[base] = code
+BASES = np.frombuffer(b"ACGTN", dtype=np.uint8)
+
+# standard genetic code indexed by 16 * first + 4 * second + third base code
+STANDARD_CODE = "KNKNTTTTRSRSIIMIQHQHPPPPRRRRLLLLEDEDAAAAGGGGVVVV*Y*YSSSS*CWCLFLF"
+
+# NCBI translation tables as listed by NCBI, in TCAG order
+NCBI_CODES = {
+    1: "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+    2: "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSS**VVVVAAAADDEEGGGG",
+    3: "FFLLSSSSYY**CCWWTTTTPPPPHHQQRRRRIIMMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+    4: "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+    5: "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSSSVVVVAAAADDEEGGGG",
+    6: "FFLLSSSSYYQQCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+    9: "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG",
+    10: "FFLLSSSSYY**CCCWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+    11: "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+    12: "FFLLSSSSYY**CC*WLLLSPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+}
+
+IS_GC = np.zeros(256, dtype=bool)
+IS_GC[list(b"GCSgcs")] = True
+IS_N = np.zeros(256, dtype=bool)
+IS_N[list(b"Nn")] = True
+
+
+def get_genetic_code(table=1):
+    """
+    Returns an NCBI translation table reordered to be indexed by base codes.
+    """
+    if table not in NCBI_CODES:
+        raise ValueError(f"genetic code {table} not supported")
+    tcag = NCBI_CODES[table]
+    order = [2, 1, 3, 0]  # ACGT positions in TCAG
+    return "".join(
+        tcag[16 * order[i] + 4 * order[j] + order[k]]
+        for i in range(4)
+        for j in range(4)
+        for k in range(4)
+    )
+
+
+def to_array(seq):
+    """
+    Returns a sequence as a uint8 array of ASCII characters without copying if possible.
+    """
+    if isinstance(seq, np.ndarray):
+        return seq
+    if isinstance(seq, str):
+        seq = seq.encode()
+    return np.frombuffer(seq, dtype=np.uint8)
+
+
+def to_str(seq):
+    return to_array(seq).tobytes().decode()
+
+
+def to_codes(seq):
+    """
+    Returns the 2 bit base codes of a sequence, ambiguous bases are coded as 4.
+    """
+    return CODES[to_array(seq)]
+
+
+def pack(seq):
+    """
+    Packs a sequence into 2 bits per base, 4 bases to a byte with the first base in the
+    highest bits.  Returns the packed array and the positions of ambiguous bases, which
+    are packed as A.
+    """
+    codes = to_codes(seq)
+    ambiguous = np.flatnonzero(codes == AMBIGUOUS)
+    codes = codes.copy()
+    codes[ambiguous] = 0
+    padded = np.zeros((len(codes) + 3) // 4 * 4, dtype=np.uint8)
+    padded[: len(codes)] = codes
+    quads = padded.reshape(-1, 4)
+    packed = (quads[:, 0] << 6) | (quads[:, 1] << 4) | (quads[:, 2] << 2) | quads[:, 3]
+    return packed, ambiguous
+
+
+def unpack(packed, length, ambiguous=None):
+    """
+    Returns the sequence of a packed array as a str, ambiguous bases are returned as N.
+    """
+    shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+    codes = ((packed[:, None] >> shifts) & 3).ravel()[:length]
+    if ambiguous is not None and len(ambiguous) > 0:
+        codes[ambiguous] = AMBIGUOUS
+    return to_str(BASES[codes])
+
+
+def reverse_complement(seq):
+    """
+    Returns the reverse complement of a sequence as a str, IUPAC ambiguity codes are
+    complemented and case is preserved.
+    """
+    return to_str(COMPLEMENT[to_array(seq)[::-1]])
+
+
+def translate(seq, frame=0, stop="*", code=STANDARD_CODE):
+    """
+    Translates a sequence from a 0-based frame offset with a genetic code indexed by
+    base codes, stop codons are written as stop and codons with ambiguous bases as X.
+    Trailing bases that do not make up a codon are ignored.
+    """
+    codes = to_codes(seq)[frame:]
+    n = len(codes) // 3
+    codons = codes[: 3 * n].reshape(n, 3).astype(np.int64)
+    index = codons[:, 0] * 16 + codons[:, 1] * 4 + codons[:, 2]
+    ambiguous = (codons == AMBIGUOUS).any(axis=1)
+    index[ambiguous] = 64
+    table = code.replace("*", "\0") + "X"
+    protein = to_str(np.frombuffer(table.encode(), dtype=np.uint8)[index])
+    return protein.replace("\0", stop)
+
+
+def six_frame_translate(seq, stop="*", code=STANDARD_CODE):
+    """
+    Returns the translations of the three forward frames followed by those of the three
+    reverse frames as [(frame, protein)], frames are labelled 1, 2, 3, -1, -2 and -3.
+    """
+    seq = to_array(seq)
+    rc_seq = COMPLEMENT[seq[::-1]]
+    translations = []
+    for frame in range(3):
+        translations.append((frame + 1, translate(seq, frame, stop, code)))
+    for frame in range(3):
+        translations.append((-(frame + 1), translate(rc_seq, frame, stop, code)))
+    return translations
+
+
+def count_gc_n(seq):
+    """
+    Returns the number of G, C and S bases and the number of N bases of a sequence.
+    """
+    seq = to_array(seq)
+    return int(IS_GC[seq].sum()), int(IS_N[seq].sum())
+
+
+def count_n(seq):
+    """
+    Returns the number of N bases of a sequence.
+    """
+    return int(IS_N[to_array(seq)].sum())
+
+
+def gc_content(seq):
+    """
+    Returns the proportion of G and C among the bases of a sequence that are not N.
+    """
+    gc, n = count_gc_n(seq)
+    length = len(to_array(seq)) - n
+    return gc / length if length > 0 else 0.0
+
+
+def hash_kmers(codes, k):
+    """
+    Returns the 0-based positions and 2 bit encoded values of the k-mers of an array of
+    base codes that contain no ambiguous base, k can be at most 32.
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64)
+    values = np.zeros(n, dtype=np.uint64)
+    for i in range(k):
+        values = (values << np.uint64(2)) | (codes[i : i + n] & 3).astype(np.uint64)
+    ambiguous = np.concatenate([[0], np.cumsum(codes == AMBIGUOUS)])
+    positions = np.flatnonzero(ambiguous[k:] == ambiguous[:-k])
+    return positions, values[positions]
@@ -22,6 +22,17 @@ import sys
 import os
 import click
 import subprocess
+import gzip
+import shutil
+import traceback
+import numpy as np
+import pysam
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../gen")
+from refcache import ReferenceCache, DEFAULT_CACHE_DIR
+from fasta import read_fasta
+from seqkernel import count_n
 
 
 @click.command()
@@ -68,6 +79,71 @@ import subprocess
     default="",
     help="Illumina read 2 fastq files",
 )
+@click.option(
+    "-t",
+    "--threads",
+    default=2,
+    show_default=True,
+    help="number of threads for alignment and consensus calling",
+)
+@click.option(
+    "-e",
+    "--consensus_engine",
+    default="samtools",
+    show_default=True,
+    type=click.Choice(["samtools", "pileup"]),
+    help="consensus caller for Illumina alignments, the pileup engine is faster but "
+    "calls substitutions only, leaving insertions out and deletions as Ns",
+)
+@click.option(
+    "-d",
+    "--min_depth",
+    default=3,
+    show_default=True,
+    help="minimum depth for a consensus base, otherwise N, with the pileup engine",
+)
+@click.option(
+    "-q",
+    "--min_base_quality",
+    default=13,
+    show_default=True,
+    help="minimum base quality for a base to be counted, with the pileup engine",
+)
+@click.option(
+    "-f",
+    "--min_allele_fraction",
+    default=0.25,
+    show_default=True,
+    help="minimum allele fraction for an allele to be included in an IUPAC ambiguity "
+    "call, with the pileup engine",
+)
+@click.option(
+    "-c",
+    "--reference_cache_dir",
+    default=DEFAULT_CACHE_DIR,
+    show_default=True,
+    help="shared cache directory for reference indices",
+)
+@click.option(
+    "--write_merged_fastq",
+    is_flag=True,
+    default=False,
+    help="write out merged fastq files and align from them instead of streaming the input fastq files",
+)
+@click.option(
+    "-b",
+    "--sample_file",
+    required=False,
+    default="",
+    help="sample file for batch mode, each line being <sample_id>\\t<read1_fastq_files>\\t<read2_fastq_files>[\\t<ont_fastq_files>]",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=4,
+    show_default=True,
+    help="number of samples processed concurrently in batch mode",
+)
 def main(
     input_ont_fastq_files,
     input_ilm_read1_fastq_files,
@@ -75,11 +151,202 @@ def main(
     sample_id,
     output_dir,
     reference_fasta_file,
+    threads,
+    consensus_engine,
+    min_depth,
+    min_base_quality,
+    min_allele_fraction,
+    reference_cache_dir,
+    write_merged_fastq,
+    sample_file,
+    jobs,
 ):
     """
     Aligns all fastq files to a reference sequence file and generates a consensus sequence.
 
+    In batch mode, every sample in the sample file is processed into <output_dir>/<sample_id>
+    and a combined summary is written to <output_dir>/summary.txt.  Completed samples are
+    skipped and incomplete samples resume from their last completed step when rerun.
+
     e.g. align_and_consensus -1 r1.fastq.gz -2 r2.fastq.gz -n ont.fastq.qz  -r ref.fasta
+         align_and_consensus -b samples.txt -r ref.fasta -j 8
+         align_and_consensus -1 r1.fastq.gz -2 r2.fastq.gz -r ref.fasta -e pileup
+    """
+    options = dict(
+        threads=threads,
+        consensus_engine=consensus_engine,
+        min_depth=min_depth,
+        min_base_quality=min_base_quality,
+        min_allele_fraction=min_allele_fraction,
+        reference_cache_dir=reference_cache_dir,
+        write_merged_fastq=write_merged_fastq,
+    )
+    if sample_file != "":
+        align_and_consensus_batch(
+            sample_file, output_dir, reference_fasta_file, jobs, options
+        )
+    else:
+        align_and_consensus(
+            sample_id,
+            output_dir,
+            reference_fasta_file,
+            input_ilm_read1_fastq_files,
+            input_ilm_read2_fastq_files,
+            input_ont_fastq_files,
+            **options,
+        )
+
+
+def align_and_consensus_batch(
+    sample_file, output_dir, reference_fasta_file, jobs, options
+):
+    output_dir = os.path.abspath(output_dir)
+    reference_fasta_file = os.path.abspath(reference_fasta_file)
+    log_dir = os.path.join(output_dir, "log")
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+    except OSError as error:
+        print(f"{error.filename} cannot be created")
+
+    samples = []
+    with open(sample_file, "r") as file:
+        for line in file:
+            if not line.startswith("#") and line.strip() != "":
+                fields = line.rstrip("\n").split("\t")
+                fields += [""] * (4 - len(fields))
+                samples.append(Sample(*fields[:4]))
+
+    # build the reference indices once before any sample starts
+    reference_cache = ReferenceCache(options["reference_cache_dir"])
+    if any(s.fastq1 != "" for s in samples):
+        print("Construct bwa reference")
+        reference_cache.get_bwa_index(reference_fasta_file)
+    if any(s.ont_fastq != "" for s in samples):
+        print("Construct minimap2 reference")
+        reference_cache.get_minimap2_index(reference_fasta_file)
+
+    print(f"Processing {len(samples)} samples with {jobs} concurrent jobs")
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            s.id: executor.submit(
+                run_sample, s, output_dir, reference_fasta_file, log_dir, options
+            )
+            for s in samples
+        }
+        statuses = {}
+        for s in samples:
+            statuses[s.id] = futures[s.id].result()
+            print(f"{s.id} - {statuses[s.id]}")
+
+    # combined coverage and consensus summary
+    output_summary_file = os.path.join(output_dir, "summary.txt")
+    with open(output_summary_file, "w") as file:
+        file.write(
+            "#sample_id\tstatus\tcontig\tlength\tnumreads\tcovbases\tcoverage\tmeandepth\tconsensus_called_bases\tconsensus_n_bases\n"
+        )
+        for s in samples:
+            for row in summarise_sample(s, f"{output_dir}/{s.id}"):
+                file.write("\t".join([s.id, statuses[s.id]] + row) + "\n")
+    print(f"Summary written to {output_summary_file}")
+
+    if any(status != "completed" for status in statuses.values()):
+        exit(1)
+
+
+def run_sample(sample, output_dir, reference_fasta_file, log_dir, options):
+    """
+    Runs align_and_consensus for one sample inside a batch worker with its output
+    redirected to the sample log file.
+    """
+    tgt = f"{log_dir}/{sample.id}.OK"
+    if os.path.exists(tgt):
+        return "completed"
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    stdout_fd = os.dup(1)
+    stderr_fd = os.dup(2)
+    status = "failed"
+    with open(f"{log_dir}/{sample.id}.log", "a") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            align_and_consensus(
+                sample.id,
+                f"{output_dir}/{sample.id}",
+                reference_fasta_file,
+                sample.fastq1,
+                sample.fastq2,
+                sample.ont_fastq,
+                **options,
+            )
+            open(tgt, "w").close()
+            status = "completed"
+        except SystemExit:
+            pass
+        except Exception:
+            # one failed sample must not abort the rest of the batch
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(stdout_fd, 1)
+            os.dup2(stderr_fd, 2)
+            os.close(stdout_fd)
+            os.close(stderr_fd)
+    return status
+
+
+def summarise_sample(sample, output_dir):
+    """
+    Returns per contig rows of samtools coverage statistics and consensus base counts.
+    """
+    if sample.fastq1 != "" and sample.ont_fastq != "":
+        prefix = "ilm_ont"
+    elif sample.fastq1 != "":
+        prefix = "ilm"
+    else:
+        prefix = "ont"
+
+    consensus = {}
+    fasta_file = f"{output_dir}/fasta/{prefix}.consensus.fasta"
+    if os.path.exists(fasta_file):
+        for record in read_fasta(fasta_file):
+            n = count_n(record.seq)
+            consensus[record.name] = [len(record.seq) - n, n]
+
+    rows = []
+    stats_file = f"{output_dir}/stats/{prefix}.stats.txt"
+    if os.path.exists(stats_file):
+        with open(stats_file, "r") as file:
+            for line in file:
+                if not line.startswith("#"):
+                    # rname startpos endpos numreads covbases coverage meandepth meanbaseq meanmapq
+                    fields = line.rstrip().split("\t")
+                    called, n = consensus.get(fields[0], ["NA", "NA"])
+                    rows.append(fields[0:1] + fields[2:7] + [str(called), str(n)])
+    else:
+        rows.append(["NA"] * 8)
+    return rows
+
+
+def align_and_consensus(
+    sample_id,
+    output_dir,
+    reference_fasta_file,
+    input_ilm_read1_fastq_files,
+    input_ilm_read2_fastq_files,
+    input_ont_fastq_files,
+    threads,
+    consensus_engine,
+    min_depth,
+    min_base_quality,
+    min_allele_fraction,
+    reference_cache_dir,
+    write_merged_fastq,
+):
+    """
+    Aligns the fastq files of a sample and generates a consensus sequence in output_dir.
     """
     illumina = len(input_ilm_read1_fastq_files) != 0
     nanopore = len(input_ont_fastq_files) != 0
@@ -107,35 +374,43 @@ def main(
     except OSError as error:
         print(f"Directory cannot be created")
 
+    # reference indices are shared across samples and projects
+    reference_cache = ReferenceCache(reference_cache_dir)
+
     # process illumina reads
     if illumina:
         print("Processing illumina reads")
 
-        #  combine fastq files
-        read1_files = input_ilm_read1_fastq_files.split(",")
-        output_read1_fastq_file = os.path.join(fastq_dir, "ilm.r1.fastq.gz")
-        cmd = f"zcat {' '.join(read1_files)} | gzip > {output_read1_fastq_file}"
-        tgt = f"{output_read1_fastq_file}.OK"
-        desc = f"Combining read 1 fastq files"
-        run(cmd, tgt, desc)
-
-        #  combine fastq files
-        read2_files = " ".join(input_ilm_read2_fastq_files.split(","))
-        output_read2_fastq_file = os.path.join(fastq_dir, "ilm.r2.fastq.gz")
-        cmd = f"zcat {read2_files} | gzip > {output_read2_fastq_file}"
-        tgt = f"{output_read2_fastq_file}.OK"
-        desc = f"Combining read 2 fastq files"
-        run(cmd, tgt, desc)
+        #  stream fastq files directly into the aligner
+        read1_fastq_files = stream_fastq_files(input_ilm_read1_fastq_files)
+        read2_fastq_files = stream_fastq_files(input_ilm_read2_fastq_files)
+
+        if write_merged_fastq:
+            #  combine fastq files
+            read1_files = input_ilm_read1_fastq_files.split(",")
+            output_read1_fastq_file = os.path.join(fastq_dir, "ilm.r1.fastq.gz")
+            cmd = f"zcat {' '.join(read1_files)} | gzip > {output_read1_fastq_file}"
+            tgt = f"{output_read1_fastq_file}.OK"
+            desc = f"Combining read 1 fastq files"
+            run(cmd, tgt, desc)
+            read1_fastq_files = output_read1_fastq_file
+
+            #  combine fastq files
+            read2_files = " ".join(input_ilm_read2_fastq_files.split(","))
+            output_read2_fastq_file = os.path.join(fastq_dir, "ilm.r2.fastq.gz")
+            cmd = f"zcat {read2_files} | gzip > {output_read2_fastq_file}"
+            tgt = f"{output_read2_fastq_file}.OK"
+            desc = f"Combining read 2 fastq files"
+            run(cmd, tgt, desc)
+            read2_fastq_files = output_read2_fastq_file
 
         #  construct reference
-        cmd = f"{bwa} index -a bwtsw {reference_fasta_file}"
-        tgt = f"{reference_fasta_file}.bwa_index.OK"
-        desc = f"Construct bwa reference"
-        run(cmd, tgt, desc)
+        print("Construct bwa reference")
+        bwa_ref_index = reference_cache.get_bwa_index(reference_fasta_file)
 
         #  align
         output_bam_file = os.path.join(bam_dir, "ilm.bam")
-        cmd = f"{bwa} mem -t 2 -M {reference_fasta_file} {output_read1_fastq_file} {output_read2_fastq_file} | {samtools} view -hF4 | {samtools} sort -o {output_bam_file}"
+        cmd = f"{bwa} mem -t {threads} -M {bwa_ref_index} {read1_fastq_files} {read2_fastq_files} | {samtools} view -hF4 | {samtools} sort -o {output_bam_file}"
         tgt = f"{output_bam_file}.OK"
         desc = f"Align to reference with bwa"
         run(cmd, tgt, desc)
@@ -158,34 +433,45 @@ def main(
         #  consensus
         input_bam_file = os.path.join(bam_dir, "ilm.bam")
         output_fasta_file = os.path.join(fasta_dir, "ilm.consensus.fasta")
-        cmd = f"{samtools} consensus {input_bam_file} > {output_fasta_file}"
+        output_depth_file = os.path.join(stats_dir, "ilm.depth.txt.gz")
         tgt = f"{output_fasta_file}.OK"
         desc = f"Illumina consensus"
-        run(cmd, tgt, desc)
+        if consensus_engine == "pileup":
+            consensus = PileupConsensus(
+                min_depth, min_base_quality, min_allele_fraction, threads
+            )
+            func = lambda: consensus.call(
+                input_bam_file, output_fasta_file, output_depth_file
+            )
+            run_in_process(func, tgt, desc)
+        else:
+            cmd = f"{samtools} consensus {input_bam_file} > {output_fasta_file}"
+            run(cmd, tgt, desc)
 
     # process nanopore reads
     if nanopore:
         print("Processing nanopore reads")
 
-        #  combine fastq files
-        fastq_files = " ".join(input_ont_fastq_files.split(","))
-        output_fastq_file = os.path.join(fastq_dir, "ont.fastq.gz")
-        cmd = f"zcat {fastq_files} | gzip > {output_fastq_file}"
-        tgt = f"{output_fastq_file}.OK"
-        desc = f"Combining nanopore fastq files"
-        run(cmd, tgt, desc)
+        #  stream fastq files directly into the aligner
+        ont_fastq_files = stream_fastq_files(input_ont_fastq_files)
+
+        if write_merged_fastq:
+            #  combine fastq files
+            fastq_files = " ".join(input_ont_fastq_files.split(","))
+            output_fastq_file = os.path.join(fastq_dir, "ont.fastq.gz")
+            cmd = f"zcat {fastq_files} | gzip > {output_fastq_file}"
+            tgt = f"{output_fastq_file}.OK"
+            desc = f"Combining nanopore fastq files"
+            run(cmd, tgt, desc)
+            ont_fastq_files = output_fastq_file
 
         #  construct reference
-        cmd = f"{minimap2} -d {reference_fasta_file}.mmi {reference_fasta_file}"
-        tgt = f"{reference_fasta_file}.minimap2_index.OK"
-        desc = f"Construct minimap2 reference"
-        run(cmd, tgt, desc)
+        print("Construct minimap2 reference")
+        minimap2_ref_mmi_file = reference_cache.get_minimap2_index(reference_fasta_file)
 
         #  align
-        minimap2_ref_mmi_file = f"{reference_fasta_file}.mmi"
-        input_fastq_file = os.path.join(fastq_dir, "ont.fastq.gz")
         output_bam_file = os.path.join(bam_dir, "ont.bam")
-        cmd = f"{minimap2} -ax map-ont {minimap2_ref_mmi_file} {input_fastq_file}  | {samtools} view -hF4 | {samtools} sort -o {output_bam_file}"
+        cmd = f"{minimap2} -ax map-ont {minimap2_ref_mmi_file} {ont_fastq_files}  | {samtools} view -hF4 | {samtools} sort -o {output_bam_file}"
         tgt = f"{output_bam_file}.OK"
         desc = f"Align to reference with minimap2"
         run(cmd, tgt, desc)
@@ -205,18 +491,27 @@ def main(
         desc = f"Nanopore coverage statistics"
         run(cmd, tgt, desc)
 
-        #  consensus
+        #  consensus on overlapping regions in parallel
         input_bam_file = os.path.join(bam_dir, "ont.bam")
-        output_hdf_file = os.path.join(bam_dir, "ont.hdf")
-        cmd = f"{medaka} consensus {input_bam_file} {output_hdf_file} --model r941_min_hac_g507"
-        tgt = f"{output_hdf_file}.OK"
-        desc = f"Oxford Nanopore consensus contigs"
-        run(cmd, tgt, desc)
+        regions = get_medaka_regions(input_bam_file)
+        workers, worker_threads, batch_size = get_medaka_settings(threads, regions)
+        cmds = []
+        for i, region in enumerate(regions):
+            output_hdf_file = os.path.join(bam_dir, f"ont.{i}.hdf")
+            cmd = f"{medaka} consensus {input_bam_file} {output_hdf_file} --model r941_min_hac_g507 --regions {region} --threads {worker_threads} --batch_size {batch_size}"
+            tgt = f"{output_hdf_file}.OK"
+            desc = f"Oxford Nanopore consensus contigs {region}"
+            cmds.append((cmd, tgt, desc))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(run, *cmd) for cmd in cmds]:
+                future.result()
 
         #  consensus
-        input_hdf_file = os.path.join(bam_dir, "ont.hdf")
+        input_hdf_files = " ".join(
+            os.path.join(bam_dir, f"ont.{i}.hdf") for i in range(len(regions))
+        )
         output_fasta_file = os.path.join(fasta_dir, "ont.consensus.fasta")
-        cmd = f"{medaka} stitch --fill_char N {input_hdf_file} {reference_fasta_file} {output_fasta_file} "
+        cmd = f"{medaka} stitch --fill_char N {input_hdf_files} {reference_fasta_file} {output_fasta_file} "
         tgt = f"{output_fasta_file}.OK"
         desc = f"Oxford Nanopore consensus assembly/scaffold"
         run(cmd, tgt, desc)
@@ -254,10 +549,20 @@ def main(
         # consensus
         input_bam_file = os.path.join(bam_dir, "ilm_ont.bam")
         output_fasta_file = os.path.join(fasta_dir, "ilm_ont.consensus.fasta")
-        cmd = f"{samtools} consensus {input_bam_file} > {output_fasta_file}"
+        output_depth_file = os.path.join(stats_dir, "ilm_ont.depth.txt.gz")
         tgt = f"{output_fasta_file}.OK"
         desc = f"Illumina and Nanopore consensus"
-        run(cmd, tgt, desc)
+        if consensus_engine == "pileup":
+            consensus = PileupConsensus(
+                min_depth, min_base_quality, min_allele_fraction, threads
+            )
+            func = lambda: consensus.call(
+                input_bam_file, output_fasta_file, output_depth_file
+            )
+            run_in_process(func, tgt, desc)
+        else:
+            cmd = f"{samtools} consensus {input_bam_file} > {output_fasta_file}"
+            run(cmd, tgt, desc)
 
     # copy out consensus
     input_fasta_file = ""
@@ -275,6 +580,169 @@ def main(
     run(cmd, tgt, desc)
 
 
+class PileupConsensus(object):
+    """
+    Calls a reference coordinate consensus from base counts of a sorted and indexed BAM file.
+
+    Bases below min_base_quality are not counted, positions with less than min_depth
+    counted bases are masked with N and all alleles with at least min_allele_fraction
+    of the depth are combined into an IUPAC ambiguity code.  Insertions relative to
+    the reference are not called and deletions show up as low depth positions.
+    """
+
+    # A=1, C=2, G=4, T=8
+    IUPAC = np.frombuffer(b"NACMGRSVTWYHKDBN", dtype=np.uint8)
+    BASE_BITS = np.array([1, 2, 4, 8], dtype=np.uint8)
+
+    def __init__(self, min_depth, min_base_quality, min_allele_fraction, threads):
+        self.min_depth = min_depth
+        self.min_base_quality = min_base_quality
+        self.min_allele_fraction = min_allele_fraction
+        self.threads = threads
+
+    def call(self, bam_file, fasta_file, depth_file):
+        """
+        Writes the consensus FASTA file and a gzipped per position depth and support track.
+        Contigs are processed in parallel and written out in BAM header order.
+        """
+        with pysam.AlignmentFile(bam_file, "rb") as bam:
+            contigs = list(bam.references)
+
+        part_files = [f"{depth_file}.{i}.part" for i in range(len(contigs))]
+        with ProcessPoolExecutor(max_workers=self.threads) as executor:
+            seqs = list(
+                executor.map(
+                    self.call_contig,
+                    [bam_file] * len(contigs),
+                    contigs,
+                    part_files,
+                )
+            )
+
+        with open(fasta_file, "w") as file:
+            for contig, seq in zip(contigs, seqs):
+                file.write(f">{contig}\n")
+                for i in range(0, len(seq), 60):
+                    file.write(f"{seq[i:i+60]}\n")
+
+        # gzip members can be concatenated into a single valid gzip file
+        with open(depth_file, "wb") as file:
+            file.write(gzip.compress(b"#contig\tpos\tdepth\tA\tC\tG\tT\tbase\tsupport\n"))
+            for part_file in part_files:
+                with open(part_file, "rb") as part:
+                    shutil.copyfileobj(part, file)
+                os.remove(part_file)
+
+    def call_contig(self, bam_file, contig, depth_file):
+        with pysam.AlignmentFile(bam_file, "rb") as bam:
+            counts = np.array(
+                bam.count_coverage(
+                    contig, quality_threshold=self.min_base_quality
+                ),
+                dtype=np.int64,
+            )
+
+        depth = counts.sum(axis=0)
+        fraction = counts / np.maximum(depth, 1)
+        alleles = fraction >= self.min_allele_fraction
+        alleles &= counts > 0
+        bits = (alleles * self.BASE_BITS[:, None]).sum(axis=0)
+        bits[depth < self.min_depth] = 0
+        seq = self.IUPAC[bits]
+        support = counts.max(axis=0) / np.maximum(depth, 1)
+
+        with gzip.open(depth_file, "wt") as file:
+            track = np.empty(len(depth), dtype=object)
+            track[:] = contig
+            np.savetxt(
+                file,
+                np.column_stack(
+                    (
+                        track,
+                        np.arange(1, len(depth) + 1),
+                        depth,
+                        counts.T,
+                        seq.view("S1").astype(str),
+                        np.round(support, 4),
+                    )
+                ),
+                fmt="%s",
+                delimiter="\t",
+            )
+
+        return seq.tobytes().decode()
+
+
+class Sample(object):
+    def __init__(self, id, fastq1, fastq2, ont_fastq):
+        self.id = id
+        self.fastq1 = fastq1
+        self.fastq2 = fastq2
+        self.ont_fastq = ont_fastq
+
+
+def get_medaka_regions(bam_file, region_size=50000, overlap=1000):
+    """
+    Splits the contigs of a BAM file into overlapping regions for medaka consensus.
+
+    Regions are written as medaka region strings, that is 0-based and end exclusive,
+    contigs no longer than region_size are analysed as a whole.
+    """
+    regions = []
+    with pysam.AlignmentFile(bam_file, "rb") as bam:
+        for contig, length in zip(bam.references, bam.lengths):
+            if length <= region_size:
+                regions.append(contig)
+                continue
+            for start in range(0, length - overlap, region_size - overlap):
+                end = min(start + region_size, length)
+                regions.append(f"{contig}:{start}-{end}")
+    return regions
+
+
+def get_medaka_settings(threads, regions):
+    """
+    Splits the available cores between parallel medaka workers.
+
+    Each worker gets at least 2 threads where available.  A region holds at most
+    about 6 of medaka's 10kb chunks, so the batch size is reduced from the default
+    of 100 to avoid every concurrent worker allocating a full batch.
+    """
+    threads = max(1, min(threads, os.cpu_count() or 1))
+    workers = max(1, min(len(regions), threads // 2))
+    worker_threads = max(1, threads // workers)
+    batch_size = 10
+    return workers, worker_threads, batch_size
+
+
+def stream_fastq_files(fastq_files):
+    """
+    Returns a bash argument that streams a comma separated list of fastq files.
+
+    A single file is passed through as is.  Gzipped files are concatenated without
+    decompression as bwa and minimap2 read multi-member gzip streams, other inputs
+    are decompressed on the fly where needed.
+    """
+    files = fastq_files.split(",")
+    if len(files) == 1:
+        return files[0]
+    elif all(file.endswith(".gz") for file in files):
+        return f"<(cat {' '.join(files)})"
+    else:
+        return f"<(zcat -f {' '.join(files)})"
+
+
+def run_in_process(func, tgt, desc):
+    if os.path.exists(tgt):
+        print(f"{desc} -  already executed")
+        return
+    else:
+        print(f"{desc}")
+        func()
+        open(tgt, "w").close()
+        print(f"{desc} -  successfully executed")
+
+
 def run(cmd, tgt, desc):
     try:
         if os.path.exists(tgt):
@@ -282,7 +750,7 @@ def run(cmd, tgt, desc):
             return
         else:
             print(f"{cmd}")
-            subprocess.run(cmd, shell=True, check=True)
+            subprocess.run(cmd, shell=True, check=True, executable="/bin/bash")
             subprocess.run(f"touch {tgt}", shell=True, check=True)
             print(f"{desc} -  successfully executed")
     except subprocess.CalledProcessError as e:
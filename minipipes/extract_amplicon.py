@@ -22,9 +22,14 @@ import sys
 import os
 import click
 import subprocess
-import re
+import numpy as np
 from shutil import copy2
 
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../gen")
+from local_alignment import align_strands
+from kmer_index import KmerIndex, COMPLEMENT_MASKS, encode_pattern
+from fasta import FastaFile, read_fasta
+
 
 @click.command()
 @click.option(
@@ -44,58 +49,62 @@ from shutil import copy2
 @click.option(
     "-r",
     "--reference_fasta_file",
-    required=True,
-    show_default=True,
+    default=None,
     help="reference fasta file",
 )
-def main(output_dir, primer_fasta_file, reference_fasta_file):
+@click.option(
+    "-i",
+    "--kmer_index_dir",
+    default=None,
+    help="k-mer index built by kmer_index.py to pick the reference sequence from",
+)
+@click.option(
+    "-m",
+    "--max_mismatches",
+    default=3,
+    show_default=True,
+    help="maximum primer mismatches when picking the reference from a k-mer index",
+)
+def main(
+    output_dir, primer_fasta_file, reference_fasta_file, kmer_index_dir, max_mismatches
+):
     """
     Extracts amplicon from a reference sequence file and a pair of primers
 
+    With a k-mer index, the reference is the indexed sequence with sites of the most
+    primers within the maximum mismatches.
+
     e.g. extract_amplicon -p primers.fasta -r ref.fasta
+         extract_amplicon -p primers.fasta -i genbank.260.vrl.fasta.gz.k12.idx
     """
+    if (reference_fasta_file is None) == (kmer_index_dir is None):
+        exit("either a reference fasta file or a k-mer index is required")
 
     # version
     version = "1.0.0"
 
-    # programs
-    water = "/usr/local/emboss-6.6.0/bin/water"
-
     # initialize
     mpm = MiniPipeManager(f"{output_dir}/extract_amplicon.log")
 
-    # read reference sequences
-    seq = ""
-    with open(reference_fasta_file, "r") as file:
-        for line in file:
-            if line.startswith(">"):
-                pass
-            else:
-                seq += line.rstrip()
-
     # read primer sequences
-    seq1 = ""
-    seq2 = ""
-    no_seq = 0
-    with open(primer_fasta_file, "r") as file:
-        for line in file:
-            if line.startswith(">"):
-                no_seq += 1
-            else:
-                if no_seq == 1:
-                    seq1 += line.rstrip()
-                elif no_seq == 2:
-                    seq2 += line.rstrip()
-                else:
-                    exit("Only 2 sequences are expected")
-
-    # reverse_complement
-    seq1_forward = seq1.upper()
-    seq1_reverse = reverse_complement(seq1_forward)
-    seq2_forward = seq2.upper()
-    seq2_reverse = reverse_complement(seq2_forward)
+    primers = [record.seq for record in read_fasta(primer_fasta_file)]
+    if len(primers) != 2:
+        exit("Only 2 sequences are expected")
+    seq1, seq2 = primers
 
-    # write out to separate files
+    # read reference sequences
+    if kmer_index_dir is not None:
+        mpm.log("Match primer sites in k-mer index")
+        index = KmerIndex(kmer_index_dir)
+        ref_index = get_most_matched_sequence(index, [seq1, seq2], max_mismatches)
+        ref_id = index.names[ref_index]
+        seq = index.fetch(ref_index)
+    else:
+        with FastaFile(reference_fasta_file) as fasta:
+            ref_id = fasta.names[0]
+            seq = fasta.fetch(ref_id)
+
+    # create directories
     trace_dir = f"{output_dir}/trace"
     try:
         os.makedirs(output_dir, exist_ok=True)
@@ -103,78 +112,17 @@ def main(output_dir, primer_fasta_file, reference_fasta_file):
     except OSError as error:
         print(f"{error.filename} cannot be created")
 
-    output_file = f"{output_dir}/p1_forward.fasta"
-    with open(output_file, "w") as file:
-        file.write(">primer1_forward\n")
-        file.write(seq1_forward)
-        file.write("\n")
-
-    output_file = f"{output_dir}/p1_reverse.fasta"
-    with open(output_file, "w") as file:
-        file.write(">primer1_reverse\n")
-        if seq1_reverse is not None:
-            file.write(seq1_reverse)
-        file.write("\n")
-
-    output_file = f"{output_dir}/p2_forward.fasta"
-    with open(output_file, "w") as file:
-        file.write(">primer2_forward\n")
-        file.write(seq2_forward)
-        file.write("\n")
-
-    output_file = f"{output_dir}/p2_reverse.fasta"
-    with open(output_file, "w") as file:
-        file.write(">primer2_reverse\n")
-        if seq2_reverse is not None:
-            file.write(seq2_reverse)
-        file.write("\n")
-
-    # invoke smith waterman alignment for each direction
-    primer_fasta_file = f"{output_dir}/p1_forward.fasta"
-    water_alignment_file = f"{output_dir}/p1_forward.water"
-    cmd = f"{water} {primer_fasta_file} {reference_fasta_file}  {water_alignment_file} -gapopen 10 -gapextend 0.5"
-    tgt = f"{primer_fasta_file}.OK"
-    desc = f"P1F sequence alignment"
-    mpm.run(cmd, tgt, desc)
-    p1_forward_alignment = parse_water_alignment(water_alignment_file)
-
-    primer_fasta_file = f"{output_dir}/p1_reverse.fasta"
-    water_alignment_file = f"{output_dir}/p1_reverse.water"
-    cmd = f"{water} {primer_fasta_file} {reference_fasta_file}  {water_alignment_file} -gapopen 10 -gapextend 0.5"
-    tgt = f"{primer_fasta_file}.OK"
-    desc = f"P1R sequence alignment"
-    mpm.run(cmd, tgt, desc)
-    p1_reverse_alignment = parse_water_alignment(water_alignment_file)
-
-    primer_fasta_file = f"{output_dir}/p2_forward.fasta"
-    water_alignment_file = f"{output_dir}/p2_forward.water"
-    cmd = f"{water} {primer_fasta_file} {reference_fasta_file}  {water_alignment_file} -gapopen 10 -gapextend 0.5"
-    tgt = f"{primer_fasta_file}.OK"
-    desc = f"P2F sequence alignment"
-    mpm.run(cmd, tgt, desc)
-    p2_forward_alignment = parse_water_alignment(water_alignment_file)
-
-    primer_fasta_file = f"{output_dir}/p2_reverse.fasta"
-    water_alignment_file = f"{output_dir}/p2_reverse.water"
-    cmd = f"{water} {primer_fasta_file} {reference_fasta_file} {water_alignment_file} -gapopen 10 -gapextend 0.5"
-    tgt = f"{primer_fasta_file}.OK"
-    desc = f"P2R sequence alignment"
-    mpm.run(cmd, tgt, desc)
-    p2_reverse_alignment = parse_water_alignment(water_alignment_file)
+    # smith waterman alignment of both primers against both strands in one pass
+    mpm.log("primer sequence alignment")
+    p1_alignments, p2_alignments = align_strands(
+        [seq1.upper(), seq2.upper()], seq, ["primer1", "primer2"], ref_id
+    )
 
     # for good match - extract amplicon, report length
     # yes I know the issue here.  need to ensure it is the right pair and they are consistent with one another to amplify
     # later fix.
-    best_p1_alignment = (
-        p1_forward_alignment
-        if p1_forward_alignment.identity > p1_reverse_alignment.identity
-        else p1_reverse_alignment
-    )
-    best_p2_alignment = (
-        p2_forward_alignment
-        if p2_forward_alignment.identity > p2_reverse_alignment.identity
-        else p2_reverse_alignment
-    )
+    best_p1_alignment = get_best_alignment(*p1_alignments)
+    best_p2_alignment = get_best_alignment(*p2_alignments)
 
     # check overlap
     amplicon_size = 0
@@ -206,110 +154,41 @@ def main(output_dir, primer_fasta_file, reference_fasta_file):
     # write log file
     mpm.print_log()
 
-def reverse_complement(seq):
+def get_most_matched_sequence(index, primers, max_mismatches):
+    """
+    Returns the index of the sequence with sites of the most primers on either strand
+    within max_mismatches, ties are broken by the number of sites and then by the
+    fewest mismatches.
+    """
+    no_seqs = len(index.names)
+    no_primers = np.zeros(no_seqs, dtype=np.int64)
+    no_sites = np.zeros(no_seqs, dtype=np.int64)
+    no_mismatches = np.zeros(no_seqs, dtype=np.int64)
+    for primer in primers:
+        masks = encode_pattern(primer)
+        weights = np.ones(len(masks), dtype=np.int16)
+        counts = np.zeros(no_seqs, dtype=np.int64)
+        for pattern in [masks, COMPLEMENT_MASKS[masks[::-1]]]:
+            begs, scores, mismatches = index.match(pattern, weights, max_mismatches)
+            seq_ids = index.locate(begs)
+            counts += np.bincount(seq_ids, minlength=no_seqs)
+            no_mismatches += np.bincount(
+                seq_ids, weights=mismatches, minlength=no_seqs
+            ).astype(np.int64)
+        no_primers += counts > 0
+        no_sites += counts
+    if no_sites.sum() == 0:
+        exit("no sequence in the k-mer index has a site of the primers")
+    return int(np.lexsort((no_mismatches, -no_sites, -no_primers))[0])
+
+
+def get_best_alignment(forward_alignment, reverse_alignment):
     return (
-        seq[::-1]
-        .upper()
-        .replace("A", "t")
-        .replace("T", "a")
-        .replace("G", "c")
-        .replace("C", "g")
-        .replace("M", "k")
-        .replace("R", "y")
-        .replace("W", "w")
-        .replace("S", "s")
-        .replace("Y", "r")
-        .replace("K", "m")
-        .replace("V", "b")
-        .replace("H", "d")
-        .replace("D", "h")
-        .replace("B", "v")
-        .replace("N", "n")
-        .upper()
+        forward_alignment
+        if forward_alignment.identity > reverse_alignment.identity
+        else reverse_alignment
     )
 
-# Aligned_sequences: 2
-# 1: primer2_reverse
-# 2: AY261360.1
-# Matrix: EDNAFULL
-# Gap_penalty: 10.0
-# Extend_penalty: 0.5
-#
-# Length: 19
-# Identity:      15/19 (78.9%)
-# Similarity:    15/19 (78.9%)
-# Gaps:           2/19 (10.5%)
-# Score: 56.5
-def parse_water_alignment(file):
-    with open(file, "r") as file:
-        qseq = ""
-        rseq = ""
-        length = 0
-        identity = 0
-        gaps = 0
-        score = 0
-        beg = 10000000000
-        end = -1
-        align = ""
-        for line in file:
-            if line.startswith("# 1:"):
-                m = re.search(r"\# 1: (.+)", line)
-                if m is not None:
-                    qseq = m.group(1)
-            elif line.startswith("# 2:"):
-                m = re.search(r"\# 2: (.+)", line)
-                if m is not None:
-                    rseq = m.group(1)
-            elif line.startswith("# Length"):
-                m = re.search(r"(\d+)", line)
-                if m is not None:
-                   length = m.group(1)
-            elif line.startswith("# Identity"):
-                m = re.search(r"(\d+)\/", line)
-                if m is not None:
-                    identity = int(m.group(1))
-            elif line.startswith("# Gaps"):
-                m = re.search(r"(\d+)\/", line)
-                if m is not None:
-                    gaps = m.group(1)
-            elif line.startswith("# Score"):
-                m = re.search(r"([\d\.]+)", line)
-                if m is not None:
-                    score = m.group(1)
-            elif len(rseq) != 0 and line.startswith(rseq[:13]):
-                m = re.search(fr"{rseq[:13]}\s+([\d\.]+) [^\d]+ ([\d\.]+)", line)
-                if m is not None:
-                    beg = int(m.group(1)) if int(m.group(1)) < beg else beg
-                    end = int(m.group(2)) if int(m.group(2)) > end else end
-
-            if not line.startswith("#") and len(line) > 1:
-                align += line
-
-        return Alignment(qseq, rseq, length, identity, gaps, score, beg, end, align)
-
-
-class Alignment(object):
-    def __init__(self, qseq, rseq, length, identity, gaps, score, beg, end, align):
-        self.qseq = qseq
-        self.rseq = rseq
-        self.length = length
-        self.identity = identity
-        self.gaps = gaps
-        self.score = score
-        self.beg = beg
-        self.end = end
-        self.align = align
-
-    def print(self):
-        print(f"qseq      : {self.qseq}")
-        print(f"rseq      : {self.rseq}")
-        print(f"length    : {self.length}")
-        print(f"identity  : {self.identity}")
-        print(f"gaps      : {self.gaps}")
-        print(f"score     : {self.score}")
-        print(f"beg       : {self.beg}")
-        print(f"end       : {self.end}")
-        print(f"\n{self.align}")
 
 class MiniPipeManager(object):
     def __init__(self, log_file):
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# The MIT License
+# Copyright (c) 2024 Adrian Tan <adrian_tan@nparks.gov.sg>
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import os
+import click
+import subprocess
+from shutil import copy2
+
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../gen")
+from local_alignment import align_records
+from fasta import read_fasta
+from seqkernel import reverse_complement
+
+
+@click.command()
+@click.argument("input_fasta_file")
+@click.option(
+    "-o",
+    "--output_dir",
+    default=f"{os.getcwd()}/extract_segments_output",
+    show_default=True,
+    help="output directory",
+)
+@click.option(
+    "-r",
+    "--reference_fasta_file",
+    required=True,
+    help="reference segment fasta file, the first sequence is used",
+)
+@click.option(
+    "-c",
+    "--min_coverage",
+    default=0.0,
+    show_default=True,
+    help="minimum proportion of the reference identically aligned for a segment to be extracted",
+)
+@click.option(
+    "-t",
+    "--threads",
+    default=4,
+    show_default=True,
+    help="number of genomes aligned concurrently",
+)
+def main(output_dir, input_fasta_file, reference_fasta_file, min_coverage, threads):
+    """
+    Extracts the segment homologous to a reference segment from every genome in a fasta file
+
+    The reference is aligned against both strands of each genome and the segment is
+    taken from the better strand in the orientation of the reference.  Segments are
+    written to segments.fasta and the alignment of every genome to segments.txt.
+
+    e.g. extract_segments.py 44genomes.complete.asfv.fasta -r MT851941.1.p72.fasta
+    """
+    # version
+    version = "1.0.0"
+
+    # create directories
+    trace_dir = f"{output_dir}/trace"
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(trace_dir, exist_ok=True)
+    except OSError as error:
+        print(f"{error.filename} cannot be created")
+
+    # initialize
+    mpm = MiniPipeManager(f"{output_dir}/extract_segments.log")
+
+    # read reference sequence
+    ref = next(read_fasta(reference_fasta_file))
+    mpm.log(f"reference : {ref.name} ({len(ref.seq)}bp)")
+
+    # align reference against genomes in parallel and stream out segments
+    segments_fasta_file = f"{output_dir}/segments.fasta"
+    segments_txt_file = f"{output_dir}/segments.txt"
+    no_genomes = 0
+    no_segments = 0
+    with open(segments_fasta_file, "w") as fasta, open(segments_txt_file, "w") as txt:
+        txt.write(
+            "genome\tstrand\tbeg\tend\tlength\tidentity\tcoverage\textracted\n"
+        )
+        for record, [[forward, reverse]] in align_records(
+            [ref.seq.upper()], read_fasta(input_fasta_file), [ref.name], threads
+        ):
+            no_genomes += 1
+            alignment = get_best_alignment(forward, reverse)
+            length = alignment.end - alignment.beg + 1 if alignment.score > 0 else 0
+            coverage = alignment.identity / len(ref.seq) if len(ref.seq) > 0 else 0
+            extracted = length > 0 and coverage >= min_coverage
+            txt.write(
+                f"{record.name}\t{alignment.strand}\t{alignment.beg}\t{alignment.end}\t"
+                f"{length}\t{alignment.identity}\t{coverage:.4f}\t"
+                f"{'yes' if extracted else 'no'}\n"
+            )
+            if extracted:
+                no_segments += 1
+                segment = record.seq[alignment.beg - 1 : alignment.end]
+                if alignment.strand == "-":
+                    segment = reverse_complement(segment)
+                fasta.write(f">{record.desc}\n{segment}\n")
+
+    mpm.log(f"{no_segments}/{no_genomes} segments extracted")
+    mpm.log(f"segments written to {segments_fasta_file}")
+    mpm.log(f"alignment summary written to {segments_txt_file}")
+
+    # copy files to trace
+    copy2(__file__, trace_dir)
+
+    # write log file
+    mpm.print_log()
+
+
+def get_best_alignment(forward_alignment, reverse_alignment):
+    return (
+        forward_alignment
+        if forward_alignment.identity > reverse_alignment.identity
+        else reverse_alignment
+    )
+
+
+class MiniPipeManager(object):
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.log_msg = []
+
+    def run(self, cmd, tgt, desc):
+        try:
+            if os.path.exists(tgt):
+                self.log(f"{desc} -  already executed")
+                self.log(cmd)
+                return
+            else:
+                self.log(f"{desc}")
+                subprocess.run(cmd, shell=True, check=True)
+                subprocess.run(f"touch {tgt}", shell=True, check=True)
+                self.log(cmd)
+        except subprocess.CalledProcessError as e:
+            self.log(f" - failed")
+            exit(1)
+
+    def log(self, msg):
+        print(msg)
+        self.log_msg.append(msg)
+
+    def print_log(self):
+        self.log(f"\nlogs written to {self.log_file}")
+        with open(self.log_file, "w") as f:
+            f.write("\n".join(self.log_msg))
+
+
+if __name__ == "__main__":
+    main()  # type: ignore[arg-type]
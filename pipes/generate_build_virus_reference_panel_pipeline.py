@@ -24,6 +24,9 @@ import re
 import subprocess
 import sys
 
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../gen")
+from bgzf import is_bgzf
+
 
 @click.command()
 @click.option(
@@ -50,20 +53,56 @@ import sys
     show_default=True,
     help="output directory",
 )
-def main(make_file, sequence_id_file, download_type, output_dir):
+@click.option(
+    "-d",
+    "--database_fasta_file",
+    multiple=True,
+    help="local RefSeq or GenBank fasta database to extract the sequences from "
+    "instead of downloading them, may be repeated",
+)
+@click.option(
+    "-b",
+    "--batch_size",
+    default=200,
+    show_default=True,
+    help="number of accessions fetched per request",
+)
+@click.option(
+    "-c",
+    "--connections",
+    default=3,
+    show_default=True,
+    help="maximum concurrent requests to NCBI",
+)
+def main(
+    make_file,
+    sequence_id_file,
+    download_type,
+    output_dir,
+    database_fasta_file,
+    batch_size,
+    connections,
+):
     """
     Download genbank sequences
 
+    With local fasta databases, the sequences are extracted into a single indexed
+    panel fasta file instead, looked up in the accession index of BGZF databases.
+
     e.g.  generate_download_genbank_seq_pipeline -s id.txt -m download_gb_seq.mk -o /home/atks/downloads
+          generate_build_virus_reference_panel_pipeline -s id.txt -d /usr/local/ref/refseq/226/viral/refseq.226.viral.fasta.gz -o panel
     """
     print("\t{0:<20} :   {1:<10}".format("make file", make_file))
     print("\t{0:<20} :   {1:<10}".format("sequence ID file", sequence_id_file))
     print("\t{0:<20} :   {1:<10}".format("download type", download_type))
     print("\t{0:<20} :   {1:<10}".format("output dir", output_dir))
+    print("\t{0:<20} :   {1:<10}".format("batch size", batch_size))
+    print("\t{0:<20} :   {1:<10}".format("connections", connections))
+    for file in database_fasta_file:
+        print("\t{0:<20} :   {1:<10}".format("database fasta file", file))
 
-    ext = "fasta"
-    if download_type == "genbank":
-        ext = "genbank"
+    if len(database_fasta_file) > 0 and download_type != "fasta":
+        exit("only fasta sequences can be extracted from a local database")
 
     release_number = subprocess.run(
         ["curl", f"https://ftp.ncbi.nlm.nih.gov/genbank/GB_Release_Number"],
@@ -105,27 +144,66 @@ def main(make_file, sequence_id_file, download_type, output_dir):
                 print(f"generated {no_ids} IDs")
             else:
                 ids.append(line)
-    print(
-        f"Will download {len(ids)} {download_type} records from GenBank release {release_number}"
-    )
+    if len(database_fasta_file) > 0:
+        print(f"Will extract {len(ids)} sequences from local databases")
+    else:
+        print(
+            f"Will download {len(ids)} {download_type} records from GenBank release {release_number}"
+        )
 
     # generate make file
     print("Generating pipeline")
     pg = PipelineGenerator(make_file)
 
-    efetch = "/usr/local/edirect-17.0/efetch"
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except OSError as error:
+        print(f"Directory {output_dir} cannot be created")
+    id_file = f"{output_dir}/sequence_ids.txt"
+    with open(id_file, "w") as f:
+        for id in ids:
+            f.write(f"{id}\n")
+
+    if len(database_fasta_file) > 0:
+        # index the accessions of the BGZF databases, an index that is up to date is
+        # kept, so that the sequences are looked up instead of scanned for
+        accession_index = "/home/atks/programs/CAVS-pipelines/gen/accession_index.py"
+        index_tgts = []
+        for i, database in enumerate(database_fasta_file):
+            if not is_bgzf(database):
+                continue
+            log = f"{output_dir}/accession_index{i}.log"
+            err = f"{output_dir}/accession_index{i}.err"
+            tgt = f"{output_dir}/accession_index{i}.OK"
+            dep = ""
+            cmd = f"{accession_index} {database} > {log} 2> {err}"
+            pg.add(tgt, dep, cmd)
+            index_tgts.append(tgt)
 
-    for id in ids:
-        output_sequence_file = f"{output_dir}/{id}.{ext}"
-        log = ""
-        err = f"{output_sequence_file}.err"
-        tgt = f"{output_sequence_file}.OK"
+        # extract the listed accessions from the databases
+        extract_fasta_subset = (
+            "/home/atks/programs/CAVS-pipelines/gen/extract_fasta_subset.py"
+        )
+        output_panel_file = f"{output_dir}/panel.fasta"
+        databases = " ".join(database_fasta_file)
+        log = f"{output_dir}/extract.log"
+        err = f"{output_dir}/extract.err"
+        tgt = f"{output_dir}/extract.OK"
+        dep = " ".join(index_tgts)
+        cmd = f"{extract_fasta_subset} {databases} -a {id_file} -o {output_panel_file} > {log} 2> {err}"
+        pg.add(tgt, dep, cmd)
+    else:
+        # fetch in batches, a rerun only fetches the records not yet downloaded
+        efetch = "/home/atks/programs/CAVS-pipelines/gen/efetch.py"
+        log = f"{output_dir}/efetch.log"
+        err = f"{output_dir}/efetch.err"
+        tgt = f"{output_dir}/efetch.OK"
         dep = ""
-        cmd = f"{efetch} -db nuccore -id {id} -format {download_type} > {output_sequence_file} 2> {err}"
+        cmd = f"{efetch} -i {id_file} -f {download_type} -o {output_dir} -b {batch_size} -c {connections} > {log} 2> {err}"
         pg.add(tgt, dep, cmd)
 
     # clean files
-    cmd = f"rm -fr {output_dir}/*.OK  {output_dir}/*.err"
+    cmd = f"rm -fr {output_dir}/*.OK  {output_dir}/*.err {output_dir}/*.log"
     pg.add_clean(cmd)
 
     # write make file
@@ -24,6 +24,7 @@ import argparse
 # ./generate_illumina_virus_detection_pipeline.py -o /home/melody/Out -s /home/melody/ilm30.sa
 # ./generate_illumina_virus_detection_pipeline.py -v -o /home/melody/Out_test -s /home/melody/test.sa
 # ./generate_illumina_virus_detection_pipeline.py -s /home/melody/testdir/test2.sa
+# ./generate_illumina_virus_detection_pipeline.py -s /home/melody/test.sa -r 2024_02
 
 
 def main():
@@ -34,6 +35,7 @@ def main():
     uniprot_database = home_directory + "/db/viral_proteins/uniref90.fasta.gz"
     # uniprot_database = home_directory + "/out.fa"
     diamond = "/usr/local/diamond-2.0.11/diamond"
+    diamond_cache = "/home/atks/programs/CAVS-pipelines/gen/diamond_cache.py"
     seqtk = "/usr/local/seqtk-1.3/seqtk"
     trinity = "/usr/local/trinityrnaseq-v2.13.1/Trinity"
     refseq = home_directory + "/db/refseq/blastdb/refseq.virus.fasta"
@@ -54,6 +56,12 @@ def main():
         help="Takes in the data that you wish to use to run FastQC on",
         type=str,
     )
+    parser.add_argument(
+        "-r",
+        "--uniref_release",
+        help="UniRef release of the uniref90.fasta.gz database, e.g. 2024_02",
+        type=str,
+    )
     args = parser.parse_args()
 
     # Reading the file
@@ -159,10 +167,12 @@ def main():
 
     f.write("\n\n")
 
-    # generates diamond reference database for indexing
+    # links the diamond reference database from the shared cache, building it only
+    # once per uniref release, the release cannot be told from uniref90.fasta.gz
+    release = f"-r {args.uniref_release} " if args.uniref_release else ""
     f.write(f"{args.output_directory}/generate_db.OK:\n")
     f.write(
-        f"\t{diamond} makedb --in {uniprot_database} -d {args.output_directory}/nr > {args.output_directory}/nr.log 2> {args.output_directory}/nr.err\n"
+        f"\t{diamond_cache} {uniprot_database} {release}-o {args.output_directory}/nr.dmnd > {args.output_directory}/nr.log 2> {args.output_directory}/nr.err\n"
     )
     f.write(f"\ttouch {args.output_directory}/generate_db.OK\n\n")
 
@@ -24,6 +24,9 @@ import click
 import sys
 import pysam
 
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../../gen")
+from fasta import read_fasta
+
 lion = "vera"
 
 
@@ -115,19 +118,10 @@ def main(
     print("=================")
     print("reading reference")
     print("=================")
-    REF = []
-    name = ""
-    with open(reference_fasta_file, "r") as file:
-        index = 0
-        for line in file:
-            line = line.rstrip()
-            if line.startswith(">"):
-                name = line.lstrip(">")
-            else:
-                for c in line:
-                    REF.append(c)
-    CHROM = Chromosome(name, len(REF))
-    print(f"Reference length = {len(REF)}")
+    # the whole header line names the reference as before
+    record = next(read_fasta(reference_fasta_file))
+    CHROM = Chromosome(record.desc, len(record.seq))
+    print(f"Reference length = {CHROM.len}")
 
     print("==========================")
     print("reading contigs alignments")
@@ -172,25 +166,13 @@ def main(
     print("reading contigs")
     print("===============")
     CONSENSUS = []
-    with open(contigs_file, "r") as file:
-        seq = ""
-        contig_index = -1
-        for line in file:
-            line = line.rstrip()
-            if line.startswith(">"):
-                if contig_index != -1:
-                    ALIGNMENTS[contig_index].set_seq(seq)
-                    seq = ""
-                line = line.lstrip(">")
-                # >_Severe_acute_respiratory_syndrome-related_coronavirus_contig_1
-                # Depth-of-coverage:2603.59
-                # Taxon:694009
-                # refseq:NC_045512.2
-                qacc, depth, taxon, ref = line.split(" ")
-                contig_index = CONTIG2ALIGNMENT[qacc]
-            else:
-                seq = seq + line
-        ALIGNMENTS[contig_index].set_seq(seq)
+    for record in read_fasta(contigs_file):
+        # >_Severe_acute_respiratory_syndrome-related_coronavirus_contig_1
+        # Depth-of-coverage:2603.59
+        # Taxon:694009
+        # refseq:NC_045512.2
+        qacc, depth, taxon, ref = record.desc.split(" ")
+        ALIGNMENTS[CONTIG2ALIGNMENT[qacc]].set_seq(record.seq)
 
     print("========")
     print("add gaps")
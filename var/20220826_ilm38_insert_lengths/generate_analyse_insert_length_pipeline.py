@@ -72,12 +72,12 @@ def main(make_file, working_dir, sample_file):
     # initialize
     pg = PipelineGenerator(make_file)
 
-    # create index
-    bwa = "/usr/local/bwa-0.7.17/bwa"
+    # create index in the shared cache, linked next to the fasta file
+    refcache = "/home/atks/programs/CAVS-pipelines/gen/refcache.py"
     tgt = f"{log_dir}/bam_index.OK"
     ref_fasta_file = f"{ref_dir}/NC_039223.1.fasta"
     dep = ""
-    cmd = f"{bwa} index -a bwtsw {ref_fasta_file}"
+    cmd = f"{refcache} {ref_fasta_file} -x bwa -l"
     pg.add(tgt, dep, cmd)
 
     for idx, sample in enumerate(samples):
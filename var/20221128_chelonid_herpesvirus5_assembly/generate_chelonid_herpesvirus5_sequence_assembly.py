@@ -208,6 +208,7 @@ def main(make_file, working_dir):
 
     # mapping with minimap2
     minimap2 = "/usr/local/minimap2-2.24/minimap2"
+    refcache = "/home/atks/programs/CAVS-pipelines/gen/refcache.py"
     samtools = "/usr/local/samtools-1.15/samtools"
 
     # EPI_ISL_6600690 database
@@ -219,13 +220,13 @@ def main(make_file, working_dir):
     cmd = f"ln -fs {input_fasta_file} {output_fasta_file}"
     pg.add(tgt, dep, cmd)
 
-    database_file = f"{working_dir}/minimap2/EPI_ISL_6600690.mmi"
+    # minimap2 index built in the shared cache and linked next to the fasta file
     input_fasta_file = f"{working_dir}/database/EPI_ISL_6600690.fasta"
     log = f"{log_dir}/EPI_ISL_6600690.mmi.log"
     err = f"{log_dir}/EPI_ISL_6600690.mmi.err"
     dep = f"{log_dir}/EPI_ISL_6600690.fasta.OK"
     tgt = f"{log_dir}/EPI_ISL_6600690.mmi.OK"
-    cmd = f"{minimap2} -d {database_file} {input_fasta_file} > {log} 2> {err}"
+    cmd = f"{refcache} {input_fasta_file} -x minimap2 -l > {log} 2> {err}"
     pg.add(tgt, dep, cmd)
 
     # map amba
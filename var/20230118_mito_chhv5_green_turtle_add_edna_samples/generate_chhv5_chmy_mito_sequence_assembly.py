@@ -69,43 +69,44 @@ def main(make_file, working_dir):
     #################
     # reference files
     #################
+    record_store = "/home/atks/programs/CAVS-pipelines/gen/record_store.py"
     id = "HQ878327.2"
     output_genbank_file = f"{ref_dir}/{id}.genbank"
     dep = ""
     tgt = f"{output_genbank_file }.OK"
-    cmd = f"efetch -db nuccore -id {id} -format genbank > {output_genbank_file}"
+    cmd = f"{record_store} {id} -f genbank -o {output_genbank_file}"
     pg.add(tgt, dep, cmd)
 
     output_fasta_file = f"{ref_dir}/{id}.fasta"
     dep = ""
     tgt = f"{output_fasta_file}.OK"
-    cmd = f"efetch -db nuccore -id {id} -format fasta > {output_fasta_file}"
+    cmd = f"{record_store} {id} -f fasta -o {output_fasta_file}"
     pg.add(tgt, dep, cmd)
 
     id = "JQ034420.1"
     output_genbank_file = f"{ref_dir}/{id}.genbank"
     dep = ""
     tgt = f"{output_genbank_file }.OK"
-    cmd = f"efetch -db nuccore -id {id} -format genbank > {output_genbank_file}"
+    cmd = f"{record_store} {id} -f genbank -o {output_genbank_file}"
     pg.add(tgt, dep, cmd)
 
     output_fasta_file = f"{ref_dir}/{id}.fasta"
     dep = ""
     tgt = f"{output_fasta_file}.OK"
-    cmd = f"efetch -db nuccore -id {id} -format fasta > {output_fasta_file}"
+    cmd = f"{record_store} {id} -f fasta -o {output_fasta_file}"
     pg.add(tgt, dep, cmd)
 
     id = "AB012104.1"
     output_genbank_file = f"{ref_dir}/{id}.genbank"
     dep = ""
     tgt = f"{output_genbank_file }.OK"
-    cmd = f"efetch -db nuccore -id {id} -format genbank > {output_genbank_file}"
+    cmd = f"{record_store} {id} -f genbank -o {output_genbank_file}"
     pg.add(tgt, dep, cmd)
 
     output_fasta_file = f"{ref_dir}/{id}.fasta"
     dep = ""
     tgt = f"{output_fasta_file}.OK"
-    cmd = f"efetch -db nuccore -id {id} -format fasta > {output_fasta_file}"
+    cmd = f"{record_store} {id} -f fasta -o {output_fasta_file}"
     pg.add(tgt, dep, cmd)
 
     ###############
@@ -246,17 +247,18 @@ def main(make_file, working_dir):
     #########
     minimap2 = "/usr/local/minimap2-2.24/minimap2"
     bwa = "/usr/local/bwa-0.7.17/bwa"
+    refcache = "/home/atks/programs/CAVS-pipelines/gen/refcache.py"
     samtools = "/usr/local/samtools-1.16/bin/samtools"
     seqtk = "/usr/local/seqtk-1.3/seqtk"
     seqkit = "/usr/local/seqkit-2.1.0/bin/seqkit"
 
-    # create bwa indices
+    # create bwa indices in the shared cache, linked next to the fasta files
     input_fasta_file = f"{ref_dir}/HQ878327.2.fasta"
     output_bwt_file = f"{input_fasta_file}.bwt"
     log = f"{output_bwt_file}.log"
     dep = f"{input_fasta_file}.OK"
     tgt = f"{output_bwt_file}.OK"
-    cmd = f"{bwa} index -a bwtsw {input_fasta_file} 2> {log}"
+    cmd = f"{refcache} {input_fasta_file} -x bwa -l 2> {log}"
     pg.add(tgt, dep, cmd)
 
     input_fasta_file = f"{ref_dir}/JQ034420.1.fasta"
@@ -264,7 +266,7 @@ def main(make_file, working_dir):
     log = f"{output_bwt_file}.log"
     dep = f"{input_fasta_file}.OK"
     tgt = f"{output_bwt_file}.OK"
-    cmd = f"{bwa} index -a bwtsw {input_fasta_file} 2> {log}"
+    cmd = f"{refcache} {input_fasta_file} -x bwa -l 2> {log}"
     pg.add(tgt, dep, cmd)
 
     input_fasta_file = f"{ref_dir}/AB012104.1.fasta"
@@ -272,16 +274,16 @@ def main(make_file, working_dir):
     log = f"{output_bwt_file}.log"
     dep = f"{input_fasta_file}.OK"
     tgt = f"{output_bwt_file}.OK"
-    cmd = f"{bwa} index -a bwtsw {input_fasta_file} 2> {log}"
+    cmd = f"{refcache} {input_fasta_file} -x bwa -l 2> {log}"
     pg.add(tgt, dep, cmd)
 
-    # create minimap2 indices
+    # create minimap2 indices in the shared cache, linked next to the fasta files
     input_fasta_file = f"{ref_dir}/HQ878327.2.fasta"
     output_mmi_file = f"{input_fasta_file}.mmi"
     log = f"{output_mmi_file}.log"
     dep = f"{input_fasta_file}.OK"
     tgt = f"{output_mmi_file}.OK"
-    cmd = f"{minimap2} -d {output_mmi_file} {input_fasta_file} 2> {log}"
+    cmd = f"{refcache} {input_fasta_file} -x minimap2 -l 2> {log}"
     pg.add(tgt, dep, cmd)
 
     input_fasta_file = f"{ref_dir}/JQ034420.1.fasta"
@@ -289,7 +291,7 @@ def main(make_file, working_dir):
     log = f"{output_mmi_file}.log"
     dep = f"{input_fasta_file}.OK"
     tgt = f"{output_mmi_file}.OK"
-    cmd = f"{minimap2} -d {output_mmi_file} {input_fasta_file} 2> {log}"
+    cmd = f"{refcache} {input_fasta_file} -x minimap2 -l 2> {log}"
     pg.add(tgt, dep, cmd)
 
     input_fasta_file = f"{ref_dir}/AB012104.1.fasta"
@@ -297,7 +299,7 @@ def main(make_file, working_dir):
     log = f"{output_mmi_file}.log"
     dep = f"{input_fasta_file}.OK"
     tgt = f"{output_mmi_file}.OK"
-    cmd = f"{minimap2} -d {output_mmi_file} {input_fasta_file} 2> {log}"
+    cmd = f"{refcache} {input_fasta_file} -x minimap2 -l 2> {log}"
     pg.add(tgt, dep, cmd)
 
     # map all the relevant sequences
@@ -21,12 +21,28 @@
 import sys
 import os
 import click
+import hashlib
 import subprocess
 import re
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../../gen")
+from fasta import read_fasta
+
+# amino acid codes for k-mer hashing, anything else is coded as X
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWYX"
+AA_CODES = np.full(256, len(AMINO_ACIDS) - 1, dtype=np.uint64)
+for code, aa in enumerate(AMINO_ACIDS):
+    AA_CODES[ord(aa)] = code
+    AA_CODES[ord(aa.lower())] = code
+
+# reference protein index shared with the worker processes
+protein_index = None
 
 
 @click.command()
-@click.argument("input_prokka_tbl_file")
+@click.argument("input_prokka_tbl_files", nargs=-1, required=True)
 @click.option(
     "-r",
     "--ref_proteins_faa_file",
@@ -39,7 +55,36 @@ import re
     "--output_annotated_tbl_file",
     required=True,
     show_default=True,
-    help="output annotated tbl file",
+    help="output annotated tbl file, a directory when transferring to several tbl files",
+)
+@click.option(
+    "-m",
+    "--mode",
+    default="inference",
+    show_default=True,
+    type=click.Choice(["inference", "transfer"]),
+    help="take annotations from the prokka inference or transfer them by protein similarity",
+)
+@click.option(
+    "-k",
+    "--kmer_size",
+    default=5,
+    show_default=True,
+    help="amino acid k-mer length of the protein sketches",
+)
+@click.option(
+    "-s",
+    "--min_similarity",
+    default=0.3,
+    show_default=True,
+    help="minimum k-mer jaccard similarity for an annotation to be transferred",
+)
+@click.option(
+    "-t",
+    "--threads",
+    default=4,
+    show_default=True,
+    help="number of genomes annotated concurrently",
 )
 @click.option(
     "-d",
@@ -49,32 +94,66 @@ import re
     help="output debug statements",
 )
 def main(
-    input_prokka_tbl_file, ref_proteins_faa_file, output_annotated_tbl_file, debug
+    input_prokka_tbl_files,
+    ref_proteins_faa_file,
+    output_annotated_tbl_file,
+    mode,
+    kmer_size,
+    min_similarity,
+    threads,
+    debug,
 ):
     """
     Fix prokka ASFV annotations
 
+    In inference mode, genes are taken from the reference proteins prokka inferred
+    each CDS from.  In transfer mode, the predicted proteins of each CDS are read from
+    the prokka .faa file next to the .tbl file and matched to the reference proteins,
+    first by exact sequence and then by k-mer sketch similarity, with genomes
+    annotated in parallel.
+
     e.g. fix_asfv_gb_sub.py prokka.tbl -r ref.faa -o annotated.tbl
+         fix_asfv_gb_sub.py */prokka.tbl -r ref.faa -m transfer -o annotated_dir
     """
 
     # read reference protein file
-    ref_proteins = {}
-    id = ""
-    gene = ""
-    sequence = ""
-    with open(ref_proteins_faa_file, "r") as f:
-        for line in f:
-            if line.startswith(">"):
-                m = re.match(r">(\S+) ~~~(.+)~~~", line)
-                id = m.group(1)
-                gene = m.group(2)
-            else:
-                sequence = line.strip()
-                ref_proteins[id] = Protein(id, gene, sequence)
+    ref_proteins = read_ref_proteins(ref_proteins_faa_file)
 
     if debug:
         print(f"No of protein records read: {len(ref_proteins)}")
 
+    if mode == "transfer":
+        index = ProteinIndex(ref_proteins.values(), kmer_size)
+        if len(input_prokka_tbl_files) == 1:
+            output_tbl_files = [output_annotated_tbl_file]
+        else:
+            output_tbl_files = get_output_tbl_files(
+                input_prokka_tbl_files, output_annotated_tbl_file
+            )
+        with ProcessPoolExecutor(
+            threads, initializer=set_protein_index, initargs=(index,)
+        ) as executor:
+            for tbl_file, counts in zip(
+                input_prokka_tbl_files,
+                executor.map(
+                    transfer_annotations,
+                    input_prokka_tbl_files,
+                    output_tbl_files,
+                    [min_similarity] * len(output_tbl_files),
+                ),
+            ):
+                no_cds, no_exact, no_similar = counts
+                no_unmatched = no_cds - no_exact - no_similar
+                print(
+                    f"{tbl_file}: {no_cds} CDS, {no_exact} exact matches, "
+                    f"{no_similar} similar matches, {no_unmatched} unmatched"
+                )
+        return
+
+    if len(input_prokka_tbl_files) != 1:
+        exit("inference mode annotates a single tbl file")
+    input_prokka_tbl_file = input_prokka_tbl_files[0]
+
     #    CDS             complement(9490..10107)
     #                      /gene="MGF 110-5L-6L CDS"
     #                      /codon_start=1
@@ -195,6 +274,191 @@ def main(
             print(f"no of length discrepancies:  {no_len_discrepancy}")
 
 
+def read_ref_proteins(ref_proteins_faa_file):
+    """
+    Reads reference proteins with headers of the form >id ~~~gene~~~.
+    """
+    ref_proteins = {}
+    for record in read_fasta(ref_proteins_faa_file):
+        m = re.match(r"(\S+) ~~~(.+)~~~", record.desc)
+        id = m.group(1)
+        gene = m.group(2)
+        ref_proteins[id] = Protein(id, gene, record.seq)
+    return ref_proteins
+
+
+def set_protein_index(index):
+    global protein_index
+    protein_index = index
+
+
+def get_output_tbl_files(tbl_files, output_dir):
+    """
+    Returns the output tbl files of several tbl files in output_dir, named by their
+    path relative to the directory the tbl files share so that prokka.tbl files of
+    different genomes are kept apart, e.g. g1/prokka.tbl to output_dir/g1/prokka.tbl.
+    """
+    paths = [os.path.abspath(file) for file in tbl_files]
+    if len(set(paths)) != len(paths):
+        exit("tbl files to be annotated together must be different files")
+    common_dir = os.path.commonpath([os.path.dirname(path) for path in paths])
+    output_tbl_files = []
+    for path in paths:
+        output_tbl_file = f"{output_dir}/{os.path.relpath(path, common_dir)}"
+        os.makedirs(os.path.dirname(output_tbl_file), exist_ok=True)
+        output_tbl_files.append(output_tbl_file)
+    return output_tbl_files
+
+
+def transfer_annotations(tbl_file, output_tbl_file, min_similarity):
+    """
+    Writes out a prokka tbl file with the genes and protein IDs of the best matching
+    reference protein of each CDS, returns the number of CDS and of exact and similar
+    matches.
+    """
+    faa_file = re.sub(r"\.tbl$", ".faa", tbl_file)
+    proteins = {record.name: record.seq for record in read_fasta(faa_file)}
+    no_cds = no_exact = no_similar = 0
+    n = 1
+    with open(output_tbl_file, "w") as of:
+        for feature in read_tbl(tbl_file):
+            if feature.type == "CDS":
+                no_cds += 1
+            gene = ""
+            protein_id = ""
+            note = ""
+            locus_tag = feature.qualifiers.get("locus_tag", "")
+            if feature.type == "CDS" and locus_tag in proteins:
+                ref_protein, similarity = protein_index.match(proteins[locus_tag])
+                if ref_protein is not None and similarity == 1:
+                    no_exact += 1
+                elif ref_protein is not None and similarity >= min_similarity:
+                    no_similar += 1
+                else:
+                    ref_protein = None
+                if ref_protein is not None:
+                    gene = ref_protein.gene
+                    protein_id = ref_protein.id
+                    note = (
+                        f"identical to {ref_protein.id}"
+                        if similarity == 1
+                        else f"similar to {ref_protein.id} ({similarity:.2f} k-mer jaccard)"
+                    )
+            of.write(f"{feature.beg}\t{feature.end}\t{feature.type}\n")
+            of.write(f"\t\t\tid\tprot_{n}\n")
+            of.write(f"\t\t\tgene\t{gene}\n")
+            of.write(f"\t\t\tprotein_id\t{protein_id}\n")
+            if note != "":
+                of.write(f"\t\t\tnote\t{note}\n")
+            n += 1
+    return no_cds, no_exact, no_similar
+
+
+def read_tbl(tbl_file):
+    """
+    Yields the features of a prokka tbl file.
+    """
+    feature = None
+    with open(tbl_file, "r") as f:
+        for line in f:
+            if line.startswith(">"):
+                continue
+            elif not line.startswith("\t"):
+                if feature is not None:
+                    yield feature
+                beg, end, type = line.rstrip("\n").split("\t")[:3]
+                feature = TblFeature(int(beg), int(end), type)
+            elif feature is not None:
+                fields = line.strip("\t\n").split("\t")
+                if fields[0] not in feature.qualifiers:
+                    feature.qualifiers[fields[0]] = fields[1] if len(fields) > 1 else ""
+    if feature is not None:
+        yield feature
+
+
+class TblFeature(object):
+    def __init__(self, beg, end, type):
+        self.beg = beg
+        self.end = end
+        self.type = type
+        self.qualifiers = dict()
+
+
+class ProteinIndex(object):
+    """
+    Reference proteins indexed by a hash of their sequence for exact matches and by an
+    inverted index of bottom sketches of their k-mer hashes for similar ones.
+
+    A query is only compared in full against the few references sharing the most
+    sketch hashes with it, so matching does not grow with the number of references.
+    """
+
+    def __init__(self, proteins, k=5, sketch_size=64, no_candidates=5):
+        self.k = k
+        self.sketch_size = sketch_size
+        self.no_candidates = no_candidates
+        self.proteins = []
+        self.kmers = []
+        self.exact = dict()
+        self.sketches = dict()
+        for protein in proteins:
+            i = len(self.proteins)
+            self.proteins.append(protein)
+            self.exact.setdefault(hash_protein(protein.sequence), i)
+            kmers = self.hash_kmers(protein.sequence)
+            self.kmers.append(kmers)
+            for h in kmers[: self.sketch_size]:
+                self.sketches.setdefault(int(h), []).append(i)
+
+    def hash_kmers(self, sequence):
+        """
+        Returns the sorted unique hashes of the k-mers of a protein sequence.
+        """
+        codes = AA_CODES[np.frombuffer(sequence.rstrip("*").encode(), dtype=np.uint8)]
+        n = len(codes) - self.k + 1
+        if n <= 0:
+            return np.zeros(0, dtype=np.uint64)
+        values = np.zeros(n, dtype=np.uint64)
+        for i in range(self.k):
+            values = values * np.uint64(len(AMINO_ACIDS)) + codes[i : i + n]
+        # mix the bits so that the smallest hashes are a random sample of k-mers
+        values = values * np.uint64(0x9E3779B97F4A7C15)
+        values ^= values >> np.uint64(31)
+        return np.unique(values)
+
+    def match(self, sequence):
+        """
+        Returns the best matching reference Protein and its k-mer jaccard similarity,
+        1 for an identical sequence and None if no reference shares a sketch hash.
+        """
+        i = self.exact.get(hash_protein(sequence))
+        if i is not None:
+            return self.proteins[i], 1
+        kmers = self.hash_kmers(sequence)
+        shared = dict()
+        for h in kmers[: self.sketch_size]:
+            for j in self.sketches.get(int(h), []):
+                shared[j] = shared.get(j, 0) + 1
+        candidates = sorted(shared, key=lambda j: (-shared[j], j))[: self.no_candidates]
+        best = None
+        best_similarity = 0
+        for j in candidates:
+            intersection = len(np.intersect1d(kmers, self.kmers[j], assume_unique=True))
+            union = len(kmers) + len(self.kmers[j]) - intersection
+            similarity = intersection / union if union > 0 else 0
+            if similarity > best_similarity:
+                best = j
+                best_similarity = similarity
+        if best is None:
+            return None, 0
+        # k-mer identical proteins that differ in sequence are not exact matches
+        return self.proteins[best], min(best_similarity, 0.999)
+
+
+def hash_protein(sequence):
+    return hashlib.md5(sequence.rstrip("*").upper().encode()).digest()
+
+
 class Protein(object):
     def __init__(self):
         self.id = ""
@@ -74,18 +74,19 @@ def main(make_file, working_dir):
     #################
     # reference files
     #################
+    record_store = "/home/atks/programs/CAVS-pipelines/gen/record_store.py"
     id = "FR682468.2"
     output_fasta_file = f"{ref_dir}/{id}.fasta"
     dep = ""
     tgt = f"{output_fasta_file }.OK"
-    cmd = f"efetch -db nuccore -id {id} -format fasta > {output_fasta_file}"
+    cmd = f"{record_store} {id} -f fasta -o {output_fasta_file}"
     pg.add(tgt, dep, cmd)
 
     id = "FR682468.2"
     output_genbank_file = f"{ref_dir}/{id}.genbank"
     dep = ""
     tgt = f"{output_genbank_file }.OK"
-    cmd = f"efetch -db nuccore -id {id} -format genbank > {output_genbank_file}"
+    cmd = f"{record_store} {id} -f genbank -o {output_genbank_file}"
     pg.add(tgt, dep, cmd)
 
     ###############
@@ -176,12 +177,13 @@ def main(make_file, working_dir):
     # mapping with minimap2
     minimap2 = "/usr/local/minimap2-2.24/minimap2"
     bwa = "/usr/local/bwa-0.7.17/bwa"
+    refcache = "/home/atks/programs/CAVS-pipelines/gen/refcache.py"
     samtools = "/usr/local/samtools-1.15/samtools"
 
     # bwa index -a bwtsw NC_039223.1.fa
     # minimap2 -d HQ878327.mmi HQ878327.fasta
     bwa_ref_fasta_file = f"{ref_dir}/FR682468.2.fasta"
-    minimap2_ref_mmi_file = f"{ref_dir}/FR682468.2.mmi"
+    minimap2_ref_mmi_file = f"{ref_dir}/FR682468.2.fasta.mmi"
 
     seqkit = "/usr/local/seqkit-2.1.0/bin/seqkit"
     ref_fasta_file = f"{ref_dir}/FR682468.2.fasta"
@@ -191,7 +193,7 @@ def main(make_file, working_dir):
     err = f"{ref_dir}/bwa_index.err"
     dep = f"{ref_fasta_file}.OK"
     tgt = f"{ref_dir}/bwa_index.OK"
-    cmd = f"{bwa} index -a bwtsw {ref_fasta_file} > {log} 2> {err}"
+    cmd = f"{refcache} {ref_fasta_file} -x bwa -l > {log} 2> {err}"
     pg.add(tgt, dep, cmd)
 
     # minimap2 index
@@ -199,7 +201,7 @@ def main(make_file, working_dir):
     err = f"{ref_dir}/minimap2_index.err"
     dep = f"{ref_fasta_file}.OK"
     tgt = f"{ref_dir}/minimap2_index.OK"
-    cmd = f"{minimap2} -d {ref_dir}/FR682468.2.mmi {ref_fasta_file} > {log} 2> {err}"
+    cmd = f"{refcache} {ref_fasta_file} -x minimap2 -l > {log} 2> {err}"
     pg.add(tgt, dep, cmd)
 
     for sample in samples:
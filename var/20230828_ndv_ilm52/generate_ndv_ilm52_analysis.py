@@ -50,9 +50,10 @@ def main(make_file, working_dir):
     pg = PipelineGenerator(make_file)
 
     # programs
-    efetch = "/usr/local/edirect-17.0/efetch"
+    record_store = "/home/atks/programs/CAVS-pipelines/gen/record_store.py"
     samtools = "/usr/local/samtools-1.17/bin/samtools"
     bwa = "/usr/local/bwa-0.7.17/bwa"
+    refcache = "/home/atks/programs/CAVS-pipelines/gen/refcache.py"
     seqkit = "/usr/local/seqkit-2.1.0/bin/seqkit"
 
     # create directories in destination folder directory
@@ -82,7 +83,7 @@ def main(make_file, working_dir):
     output_fasta_file = f"{ref_dir}/{id}.fasta"
     dep = ""
     tgt = f"{output_fasta_file }.OK"
-    cmd = f"{efetch} -db nuccore -id {id} -format fasta > {output_fasta_file}"
+    cmd = f"{record_store} {id} -f fasta -o {output_fasta_file}"
     pg.add(tgt, dep, cmd)
 
     ###############
@@ -194,7 +195,7 @@ def main(make_file, working_dir):
     err = f"{ref_dir}/bwa_index.err"
     dep = f"{ref_fasta_file}.OK"
     tgt = f"{ref_dir}/bwa_index.OK"
-    cmd = f"{bwa} index -a bwtsw {ref_fasta_file} > {log} 2> {err}"
+    cmd = f"{refcache} {ref_fasta_file} -x bwa -l > {log} 2> {err}"
     pg.add(tgt, dep, cmd)
 
     for sample in samples:
@@ -21,7 +21,9 @@
 import sys
 import os
 import click
-import subprocess
+
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../../gen")
+from refcache import ReferenceCache
 
 
 @click.command()
@@ -40,36 +42,31 @@ def main(
 
     e.g. index reference file for bwa and minimap2
     """
-    # programs
-    minimap2 = "/usr/local/minimap2-2.24/minimap2"
-    bwa = "/usr/local/bwa-0.7.17/bwa"
+    # indices are built once in the shared reference cache and linked next to the fasta file
+    reference_cache = ReferenceCache()
 
     #  construct bwa reference
-    cmd = f"{bwa} index -a bwtsw {reference_fasta_file}"
+    func = lambda: reference_cache.link_index(reference_fasta_file, "bwa")
     tgt = f"{reference_fasta_file}.bwa_index.OK"
     desc = f"Construct bwa reference"
-    run(cmd, tgt, desc)
+    run_in_process(func, tgt, desc)
 
     #  construct minimap2 reference
-    cmd = f"{minimap2} -d {reference_fasta_file}.mmi {reference_fasta_file}"
+    func = lambda: reference_cache.link_index(reference_fasta_file, "minimap2")
     tgt = f"{reference_fasta_file}.minimap2_index.OK"
     desc = f"Construct minimap2 reference"
-    run(cmd, tgt, desc)
+    run_in_process(func, tgt, desc)
 
 
-def run(cmd, tgt, desc):
-    try:
-        if os.path.exists(tgt):
-            print(f"{desc} -  already executed")
-            return
-        else:
-            print(f"{cmd}")
-            subprocess.run(cmd, shell=True, check=True)
-            subprocess.run(f"touch {tgt}", shell=True, check=True)
-            print(f"{desc} -  successfully executed")
-    except subprocess.CalledProcessError as e:
-        print(f" - failed")
-        exit(1)
+def run_in_process(func, tgt, desc):
+    if os.path.exists(tgt):
+        print(f"{desc} -  already executed")
+        return
+    else:
+        print(f"{desc}")
+        func()
+        open(tgt, "w").close()
+        print(f"{desc} -  successfully executed")
 
 
 if __name__ == "__main__":
@@ -22,7 +22,11 @@ import sys
 import os
 import click
 import subprocess
-import re
+
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../../gen")
+from local_alignment import align_strands
+from seqkernel import reverse_complement
+from fasta import FastaFile, read_fasta
 
 
 @click.command()
@@ -64,34 +68,13 @@ def main(
     e.g. extract_gene -g gene.fasta -r ref.fasta
     """
 
-    # read reference sequences
-    seq = ""
-    with open(reference_fasta_file, "r") as file:
-        for line in file:
-            if line.startswith(">"):
-                pass
-            else:
-                seq += line.rstrip()
+    # read reference sequence
+    with FastaFile(reference_fasta_file) as fasta:
+        ref_id = fasta.names[0]
+        seq = fasta.fetch(ref_id)
 
     # read gene sequence
-    gene = ""
-    with open(gene_fasta_file, "r") as file:
-        for line in file:
-            if line.startswith(">"):
-                pass
-            else:
-                gene += line.rstrip()
-
-    # reverse_complement
-    gene_fwd = gene.upper()
-    gene_rev = (
-        gene[::-1]
-        .replace("A", "t")
-        .replace("T", "a")
-        .replace("G", "c")
-        .replace("C", "g")
-        .upper()
-    )
+    gene = next(read_fasta(gene_fasta_file)).seq
 
     # create working directory
     output_dir = f"{working_dir}/extract_gene_output"
@@ -100,39 +83,10 @@ def main(
     except OSError as error:
         print(f"Directory cannot be created")
 
-    # write out to separate files
-    output_fasta_file = f"{output_dir}/gene_fwd.fasta"
-    cmd = f"echo '>gene_fwd\n{gene_fwd}' > {output_fasta_file}"
-    tgt = f"{output_fasta_file}.OK"
-    desc = f"Create forward gene FASTA file"
-    run(cmd, tgt, desc)
-
-    output_fasta_file = f"{output_dir}/gene_rev.fasta"
-    cmd = f"echo '>gene_rev\n{gene_rev}' > {output_fasta_file}"
-    tgt = f"{output_fasta_file}.OK"
-    desc = f"Create reverse gene FASTA file"
-    run(cmd, tgt, desc)
-
-    # invoke smith waterman alignment for each direction
-    water = "/usr/local/emboss-6.6.0/bin/water"
-
-    input_fasta_file = f"{output_dir}/gene_fwd.fasta"
-    alignment_file = f"{output_dir}/gene_fwd_ref.water"
-    cmd = f"{water} {input_fasta_file} {reference_fasta_file} {alignment_file} -gapopen 10 -gapextend 0.5"
-    tgt = f"{alignment_file}.OK"
-    desc = f"Align forward gene to reference"
-    run(cmd, tgt, desc)
-
-    input_fasta_file = f"{output_dir}/gene_rev.fasta"
-    alignment_file = f"{output_dir}/gene_rev_ref.water"
-    cmd = f"{water} {input_fasta_file} {reference_fasta_file} {alignment_file} -gapopen 10 -gapextend 0.5"
-    tgt = f"{alignment_file}.OK"
-    desc = f"Align reverse gene to reference"
-    run(cmd, tgt, desc)
-
-    # examine alignments
-    gene_fwd_alignment = parse_water_alignment(f"{output_dir}/gene_fwd_ref.water")
-    gene_rev_alignment = parse_water_alignment(f"{output_dir}/gene_rev_ref.water")
+    # smith waterman alignment against both strands
+    [[gene_fwd_alignment, gene_rev_alignment]] = align_strands(
+        [gene.upper()], seq, ["gene"], ref_id
+    )
 
     # find best alignment.
     best_alignment = (
@@ -145,15 +99,8 @@ def main(
     output_fasta_file = f"{output_dir}/extracted_gene.fasta"
     gene_seq = seq[best_alignment.beg - 1 : best_alignment.end]
     print(f"orig: {gene_seq}")
-    if best_alignment.qseq == "gene_rev":
-        gene_seq = (
-            gene_seq[::-1]
-            .replace("A", "t")
-            .replace("T", "a")
-            .replace("G", "c")
-            .replace("C", "g")
-            .upper()
-        )
+    if best_alignment.strand == "-":
+        gene_seq = reverse_complement(gene_seq).upper()
     cmd = f"echo '>{extracted_gene_fasta_header}\n{gene_seq}' > {output_fasta_file}"
     tgt = f"{output_fasta_file}.OK"
     desc = f"Extract gene and save in FASTA file"
@@ -162,7 +109,7 @@ def main(
     print(f"Extracted gene stats")
     print(f'gene  : {gene[0:20]}{"..." if len(gene)>20 else ""} ({len(gene)}bp)')
     print(f'reference : {seq[0:30]}{"..." if len(seq)>30 else ""} ({len(seq)}bp)')
-    print(f"best alignment  : {best_alignment.qseq}")
+    print(f"best alignment  : {best_alignment.qseq} ({best_alignment.strand})")
     print(f"size: {best_alignment.length}")
     print(f"locus: {best_alignment.qseq}:{best_alignment.beg}-{best_alignment.end}")
     print("==========")
@@ -172,90 +119,6 @@ def main(
     print("==========")
 
 
-# Aligned_sequences: 2
-# 1: primer2_reverse
-# 2: AY261360.1
-# Matrix: EDNAFULL
-# Gap_penalty: 10.0
-# Extend_penalty: 0.5
-#
-# Length: 19
-# Identity:      15/19 (78.9%)
-# Similarity:    15/19 (78.9%)
-# Gaps:           2/19 (10.5%)
-# Score: 56.5
-def parse_water_alignment(file):
-    with open(file, "r") as file:
-        qseq = ""
-        rseq = ""
-        length = 0
-        identity = 0
-        gaps = 0
-        score = 0
-        beg = 10000000000
-        end = -1
-        for line in file:
-            if line.startswith("# 1:"):
-                m = re.search("\# 1: (.+)", line)
-                qseq = m.group(1)
-            elif line.startswith("# 2:"):
-                m = re.search("\# 2: (.+)", line)
-                rseq = m.group(1)
-            elif line.startswith("# Length"):
-                m = re.search("(\d+)", line)
-                length = m.group(1)
-            elif line.startswith("# Identity"):
-                m = re.search("(\d+)\/", line)
-                identity = m.group(1)
-            elif line.startswith("# Gaps"):
-                m = re.search("(\d+)\/", line)
-                gaps = m.group(1)
-            elif line.startswith("# Score"):
-                m = re.search("([\d\.]+)", line)
-                score = m.group(1)
-            elif len(rseq) != 0 and line.startswith(rseq[:13]):
-                m = re.search(f"{rseq[:13]}\s+([\d\.]+) [^\d]+ ([\d\.]+)", line)
-                beg = int(m.group(1)) if int(m.group(1)) < beg else beg
-                end = int(m.group(2)) if int(m.group(2)) > end else end
-            else:
-                pass
-
-        alignment = Alignment(qseq, rseq, length, identity, gaps, score, beg, end)
-        return alignment
-
-
-class Alignment(object):
-    def __init__(self):
-        self.qseq = ""
-        self.rseq = ""
-        self.length = 0
-        self.identity = 0
-        self.gaps = 0
-        self.score = 0
-        self.beg = 0
-        self.end = 0
-
-    def __init__(self, qseq, rseq, length, identity, gaps, score, beg, end):
-        self.qseq = qseq
-        self.rseq = rseq
-        self.length = length
-        self.identity = identity
-        self.gaps = gaps
-        self.score = score
-        self.beg = beg
-        self.end = end
-
-    def print(self):
-        print(f"qseq      : {self.qseq}")
-        print(f"rseq      : {self.rseq}")
-        print(f"length    : {self.length}")
-        print(f"identity  : {self.identity}")
-        print(f"gaps      : {self.gaps}")
-        print(f"score     : {self.score}")
-        print(f"beg       : {self.beg}")
-        print(f"end       : {self.end}")
-
-
 def run(cmd, tgt, desc):
     try:
         if os.path.exists(tgt):
@@ -18,9 +18,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import os.path
+import os
+import sys
 import click
-import re
+
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../../gen")
+from genbank_metadata import GenBankMetadataCache, DEFAULT_CACHE_FILE
 
 
 @click.command()
@@ -33,10 +36,27 @@ import re
     show_default=True,
     help="reference fasta file",
 )
-def main(input_fasta_files, write):
+@click.option(
+    "-c",
+    "--cache_file",
+    default=DEFAULT_CACHE_FILE,
+    show_default=True,
+    help="genbank metadata cache file",
+)
+@click.option(
+    "-t",
+    "--threads",
+    default=4,
+    show_default=True,
+    help="number of genbank files parsed concurrently",
+)
+def main(input_fasta_files, write, cache_file, threads):
     """
     Rename FASTA header
 
+    The matching genbank file of each FASTA file is parsed once and its metadata
+    cached by file content for later runs.
+
     e.g. rename_seq_header.py target.fa
     """
     n = 0
@@ -44,6 +64,14 @@ def main(input_fasta_files, write):
     n_submission_date_annotated = 0
     n_collection_date_annotated = 0
 
+    genbank_files = []
+    for input_fasta_file in input_fasta_files:
+        genbank_file = input_fasta_file.replace("fasta", "genbank")
+        if os.path.isfile(genbank_file):
+            genbank_files.append(genbank_file)
+    with GenBankMetadataCache(cache_file) as cache:
+        metadata = cache.get_metadata(genbank_files, threads)
+
     for input_fasta_file in input_fasta_files:
         n += 1
         acc = ""
@@ -59,29 +87,18 @@ def main(input_fasta_files, write):
         sub_date = "no date"
         sub_year = "no year"
         col_date = "no date"
-        if os.path.isfile(genbank_file):
-            with open(genbank_file) as file:
-                for line in file:
-                    if line.startswith("ORIGIN"):
-                        break
-                    else:
-                        line = line.strip()
-                        m = re.match(r'/country="(.+)"', line)
-                        if m:
-                            n_country_annotated += 1
-                            country = m.group(1)
-                            continue
-                        m = re.match(r"JOURNAL   Submitted \((.+)\).+", line)
-                        if m:
-                            n_submission_date_annotated += 1
-                            sub_date = m.group(1)
-                            sub_year = sub_date.split("-")[2]
-                            continue
-                        m = re.match(r'/collection_date="(.+)"', line)
-                        if m:
-                            n_collection_date_annotated += 1
-                            col_date = m.group(1)
-                            continue
+        if genbank_file in metadata and len(metadata[genbank_file]) > 0:
+            record = metadata[genbank_file][0]
+            if record.country:
+                n_country_annotated += 1
+                country = record.country
+            if record.submission_date:
+                n_submission_date_annotated += 1
+                sub_date = record.submission_date
+                sub_year = record.get_submission_year()
+            if record.collection_date:
+                n_collection_date_annotated += 1
+                col_date = record.collection_date
 
         print(f"{acc}\t{country}\t{col_date}\t{sub_year}\t{header}")
 
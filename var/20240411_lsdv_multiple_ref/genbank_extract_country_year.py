@@ -18,9 +18,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import os.path
+import os
+import sys
 import click
-import re
+
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../../gen")
+from genbank_metadata import GenBankMetadataCache, DEFAULT_CACHE_FILE
 
 
 @click.command()
@@ -33,52 +36,52 @@ import re
     show_default=True,
     help="reference fasta file",
 )
-def main(input_genbank_files, write):
+@click.option(
+    "-c",
+    "--cache_file",
+    default=DEFAULT_CACHE_FILE,
+    show_default=True,
+    help="genbank metadata cache file",
+)
+@click.option(
+    "-t",
+    "--threads",
+    default=4,
+    show_default=True,
+    help="number of genbank files parsed concurrently",
+)
+def main(input_genbank_files, write, cache_file, threads):
     """
     Extract country IDs from genbank files.
 
-    e.g. genbank_extract_country_year.py
+    Every record of each genbank file is reported, metadata is cached by file content
+    for later runs.
+
+    e.g. genbank_extract_country_year.py *.genbank
     """
     n = 0
     n_country_annotated = 0
     n_date_annotated = 0
 
+    with GenBankMetadataCache(cache_file) as cache:
+        metadata = cache.get_metadata(input_genbank_files, threads)
+
     for genbank_file in input_genbank_files:
-        n += 1
-        acc = ""
-        header = ""
-        with open(genbank_file) as file:
-            for line in file:
-                if line.startswith(">"):
-                    header = line.strip()
-                    acc = header.lstrip(">").split(" ")[0]
-                    break
-        genbank_file = input_fasta_file.replace("fasta", "seq")
-        country = "no country"
-        date = "no date"
-        year = "no year"
-        if os.path.isfile(genbank_file):
-            with open(genbank_file) as file:
-                for line in file:
-                    if line.startswith("ORIGIN"):
-                        break
-                    else:
-                        line = line.strip()
-                        m = re.match(r'/country="(.+)"', line)
-                        if m:
-                            n_country_annotated += 1
-                            country = m.group(1)
-                            continue
-                        m = re.match(r"JOURNAL   Submitted \((.+)\).+", line)
-                        if m:
-                            n_date_annotated += 1
-                            date = m.group(1)
-                            year = date.split("-")[2]
-                            continue
+        for record in metadata[genbank_file]:
+            n += 1
+            header = f">{record.accession} {record.definition}"
+            country = "no country"
+            year = "no year"
+            if record.country:
+                n_country_annotated += 1
+                country = record.country
+            if record.submission_date:
+                n_date_annotated += 1
+                year = record.get_submission_year()
 
-        print(f"{acc}\t{country}\t{year}\t{header}")
+            print(f"{record.accession}\t{country}\t{year}\t{header}")
 
-    print(f"no fasta files       : {n}")
+    print(f"no records           : {n}")
     print(f"no country annotated : {n_country_annotated}")
     print(f"no date annotated    : {n_date_annotated}")
 
@@ -22,9 +22,16 @@ import sys
 import os
 import click
 import subprocess
-import re
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, repeat
 from shutil import copy2
 
+sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../../gen")
+from kmer_index import KmerIndex, GENOME_ENCODING, COMPLEMENT_MASKS, encode_pattern
+from fasta import read_fasta
+
 
 @click.command()
 @click.option(
@@ -44,28 +51,85 @@ from shutil import copy2
 @click.option(
     "-r",
     "--reference_fasta_file",
-    required=True,
+    default=None,
+    help="genome sequences fasta file",
+)
+@click.option(
+    "-i",
+    "--kmer_index_dir",
+    default=None,
+    help="k-mer index of genome sequences built by kmer_index.py",
+)
+@click.option(
+    "-m",
+    "--max_mismatches",
+    default=3,
+    show_default=True,
+    help="maximum weighted number of mismatches of a primer binding site",
+)
+@click.option(
+    "-l",
+    "--three_prime_length",
+    default=5,
+    show_default=True,
+    help="number of bases at the 3' end of a primer where mismatches are weighted",
+)
+@click.option(
+    "-w",
+    "--three_prime_weight",
+    default=2,
     show_default=True,
-    help="reference fasta file",
+    help="weight of a mismatch at the 3' end of a primer",
 )
-def main(output_dir, primer_fasta_file, reference_fasta_file):
+@click.option(
+    "-s",
+    "--max_amplicon_size",
+    default=3000,
+    show_default=True,
+    help="maximum amplicon size",
+)
+@click.option(
+    "-t",
+    "--threads",
+    default=4,
+    show_default=True,
+    help="number of genomes searched concurrently",
+)
+def main(
+    output_dir,
+    primer_fasta_file,
+    reference_fasta_file,
+    kmer_index_dir,
+    max_mismatches,
+    three_prime_length,
+    three_prime_weight,
+    max_amplicon_size,
+    threads,
+):
     """
     Performs in silico PCR on a sample fasta file from a set of degenerate primers
 
+    A primer binds wherever its weighted number of mismatches is within the maximum, a
+    degenerate primer base matches any base it represents and ambiguous bases in the
+    genomes match nothing.  Every pair of forward and reverse primer binding sites on
+    opposite strands within the maximum amplicon size is reported as an amplicon.
+
+    With a k-mer index, only the sites seeded by the k-mers within the maximum
+    mismatches of a primer are verified, which scales to whole GenBank divisions.
+    Primers shorter than the k-mer length are matched at every position of the
+    indexed sequences.
+
     e.g. insilico_pcr.py -p primers.fasta -r sample.fasta
+         insilico_pcr.py -p primers.fasta -i genbank.260.vrl.fasta.gz.k12.idx
     """
+    if (reference_fasta_file is None) == (kmer_index_dir is None):
+        exit("either a reference fasta file or a k-mer index is required")
 
     # version
     version = "1.0.0"
 
-    # programs
-    bowtie2_build = "/usr/local/bowtie2-2.4.5/bowtie2-build"
-    bowtie2 = "/usr/local/bowtie2-2.4.5/bowtie2"
-
     # initialize
-    mpm = MiniPipeManager(f"{output_dir}/extract_amplicon.log")
-
-    # build bowtie2 data base from sample fasta file
+    mpm = MiniPipeManager(f"{output_dir}/insilico_pcr.log")
 
     # read primer sequence pairs
     # primers must be named in pairs and be labelled forward and reverse
@@ -115,12 +179,66 @@ def main(output_dir, primer_fasta_file, reference_fasta_file):
     except OSError as error:
         print(f"{error.filename} cannot be created")
 
+    # search genomes in parallel, amplicons are written in the order of the genomes
+    primer_sets = list(primers.values())
+    pcr = InSilicoPCR(
+        primer_sets,
+        max_mismatches,
+        three_prime_length,
+        three_prime_weight,
+        max_amplicon_size,
+    )
+    amplicons_file = f"{output_dir}/amplicons.txt"
+    no_genomes = 0
+    no_amplified_genomes = {name: 0 for name in primers.keys()}
+    with open(amplicons_file, "w") as out, ProcessPoolExecutor(threads) as executor:
+        out.write(
+            "genome\tprimer_set\tstrand\tbeg\tend\tsize\tfwd_mismatches\trev_mismatches\n"
+        )
+        if kmer_index_dir is not None:
+            # verify the seeded sites of each primer set in parallel
+            mpm.log(f"Search genomes in {kmer_index_dir}")
+            no_genomes = len(KmerIndex(kmer_index_dir).names)
+            amplicons = []
+            for result in executor.map(
+                pcr.search_index, repeat(kmer_index_dir), primer_sets
+            ):
+                amplicons.extend(result)
+            amplicons.sort(key=lambda x: (x[0], x[1].beg, x[1].end))
+            for seq_id, group in groupby(amplicons, key=lambda x: x[0]):
+                write_amplicons(out, [x[1] for x in group], no_amplified_genomes)
+        else:
+            mpm.log(f"Search genomes in {reference_fasta_file}")
+            pending = deque()
+            for record in read_fasta(reference_fasta_file):
+                no_genomes += 1
+                pending.append(executor.submit(pcr.search, record.name, record.seq))
+                # bound the number of genomes held in memory
+                if len(pending) >= 4 * threads:
+                    write_amplicons(
+                        out, pending.popleft().result(), no_amplified_genomes
+                    )
+            while pending:
+                write_amplicons(out, pending.popleft().result(), no_amplified_genomes)
+
+    for name, count in no_amplified_genomes.items():
+        mpm.log(f"{name} : {count}/{no_genomes} genomes amplified")
+    mpm.log(f"amplicons written to {amplicons_file}")
+
     # copy files to trace
     copy2(__file__, trace_dir)
 
     # write log file
     mpm.print_log()
 
+
+def write_amplicons(out, amplicons, no_amplified_genomes):
+    for amplicon in amplicons:
+        out.write(f"{amplicon.to_tsv()}\n")
+    for primer_set in set(amplicon.primer_set for amplicon in amplicons):
+        no_amplified_genomes[primer_set] += 1
+
+
 class PrimerSet(object):
     def __init__(self, name, fwd_primer, rev_primer):
         self.name = name
@@ -132,27 +250,198 @@ class PrimerSet(object):
         print(f"fwd_primer : {self.fwd_primer}")
         print(f"rev_primer : {self.rev_primer}")
 
-def reverse_complement(seq):
-    return (
-        seq[::-1]
-        .upper()
-        .replace("A", "t")
-        .replace("T", "a")
-        .replace("G", "c")
-        .replace("C", "g")
-        .replace("M", "k")
-        .replace("R", "y")
-        .replace("W", "w")
-        .replace("S", "s")
-        .replace("Y", "r")
-        .replace("K", "m")
-        .replace("V", "b")
-        .replace("H", "d")
-        .replace("D", "h")
-        .replace("B", "v")
-        .replace("N", "n")
-        .upper()
-    )
+
+class InSilicoPCR(object):
+    def __init__(
+        self,
+        primer_sets,
+        max_mismatches=3,
+        three_prime_length=5,
+        three_prime_weight=2,
+        max_amplicon_size=3000,
+    ):
+        self.primer_sets = primer_sets
+        self.max_mismatches = max_mismatches
+        self.three_prime_length = three_prime_length
+        self.three_prime_weight = three_prime_weight
+        self.max_amplicon_size = max_amplicon_size
+
+    def search(self, genome, seq):
+        """
+        Returns the amplicons of all primer sets in a genome sequence.
+        """
+        g = GENOME_ENCODING[np.frombuffer(seq.encode(), dtype=np.uint8)]
+        amplicons = []
+        for primer_set in self.primer_sets:
+            fwd = self.get_sites(g, primer_set.fwd_primer)
+            rev = self.get_sites(g, primer_set.rev_primer)
+            # forward primer on the forward strand, reverse primer on the reverse strand
+            for beg, end, fwd_mm, rev_mm in self.pair_sites(fwd[0], rev[1]):
+                amplicons.append(
+                    Amplicon(genome, primer_set.name, "+", beg, end, fwd_mm, rev_mm)
+                )
+            # reverse primer on the forward strand, forward primer on the reverse strand
+            for beg, end, rev_mm, fwd_mm in self.pair_sites(rev[0], fwd[1]):
+                amplicons.append(
+                    Amplicon(genome, primer_set.name, "-", beg, end, fwd_mm, rev_mm)
+                )
+        amplicons.sort(key=lambda amplicon: (amplicon.beg, amplicon.end))
+        return amplicons
+
+    def search_index(self, index_dir, primer_set):
+        """
+        Returns the amplicons of a primer set in the sequences of a k-mer index, each with
+        the index of the sequence it is in.
+        """
+        index = open_index(index_dir)
+        for primer in [primer_set.fwd_primer, primer_set.rev_primer]:
+            masks, weights = self.get_patterns(primer)[0]
+            if not index.is_seedable(masks, weights, self.max_mismatches):
+                print(
+                    f"{primer_set.name} primer {primer} cannot be seeded from "
+                    f"{index_dir}, matching it against every position",
+                    file=sys.stderr,
+                )
+        fwd = [
+            self.match_index(index, *pattern)
+            for pattern in self.get_patterns(primer_set.fwd_primer)
+        ]
+        rev = [
+            self.match_index(index, *pattern)
+            for pattern in self.get_patterns(primer_set.rev_primer)
+        ]
+        amplicons = []
+        for strand, left, right in [("+", fwd[0], rev[1]), ("-", rev[0], fwd[1])]:
+            for beg, end, left_mm, right_mm in self.pair_sites(left, right):
+                # sites are paired in the concatenated sequence of the index
+                seq_id = int(index.locate(beg - 1))
+                if int(index.locate(end - 1)) != seq_id:
+                    continue
+                start = int(index.starts[seq_id])
+                if strand == "+":
+                    fwd_mm, rev_mm = left_mm, right_mm
+                else:
+                    fwd_mm, rev_mm = right_mm, left_mm
+                amplicon = Amplicon(
+                    index.names[seq_id],
+                    primer_set.name,
+                    strand,
+                    beg - start,
+                    end - start,
+                    fwd_mm,
+                    rev_mm,
+                )
+                amplicons.append((seq_id, amplicon))
+        return amplicons
+
+    def get_patterns(self, primer):
+        """
+        Returns the base bitmasks and mismatch weights of a primer binding to the forward
+        strand and of a primer binding to the reverse strand, which reads as the reverse
+        complement on the forward strand.
+        """
+        masks = encode_primer(primer)
+        weights = np.ones(len(masks), dtype=np.int16)
+        weights[max(0, len(masks) - self.three_prime_length) :] = self.three_prime_weight
+        return [(masks, weights), (COMPLEMENT_MASKS[masks[::-1]], weights[::-1])]
+
+    def get_sites(self, g, primer):
+        """
+        Returns the binding sites of a primer on the forward and on the reverse strand as
+        (start positions, end positions, number of mismatches), positions are 0-based and
+        on the forward strand.
+        """
+        return [self.find_sites(g, *pattern) for pattern in self.get_patterns(primer)]
+
+    def match_index(self, index, masks, weights):
+        begs, scores, mismatches = index.match(masks, weights, self.max_mismatches)
+        return begs, begs + len(masks) - 1, mismatches
+
+    def find_sites(self, g, masks, weights):
+        """
+        Matches a primer at every offset of the genome at once, one primer base at a time.
+        """
+        length = len(masks)
+        n = max(0, len(g) - length + 1)
+        score = np.zeros(n, dtype=np.int16)
+        mismatches = np.zeros(n, dtype=np.int16)
+        for i in range(length):
+            mismatch = (g[i : i + n] & masks[i]) == 0
+            score += mismatch * weights[i]
+            mismatches += mismatch
+        begs = np.flatnonzero(score <= self.max_mismatches)
+        return begs, begs + length - 1, mismatches[begs]
+
+    def pair_sites(self, left, right):
+        """
+        Pairs forward strand sites with downstream reverse strand sites within the maximum
+        amplicon size and returns the 1-based amplicon coordinates and mismatches.
+        """
+        pairs = []
+        left_begs, left_ends, left_mismatches = left
+        right_begs, right_ends, right_mismatches = right
+        for beg, end, mismatches in zip(left_begs, left_ends, left_mismatches):
+            lo = np.searchsorted(right_ends, end, side="right")
+            hi = np.searchsorted(
+                right_ends, beg + self.max_amplicon_size - 1, side="right"
+            )
+            for j in range(lo, hi):
+                if right_begs[j] >= beg:
+                    pairs.append(
+                        (
+                            int(beg) + 1,
+                            int(right_ends[j]) + 1,
+                            int(mismatches),
+                            int(right_mismatches[j]),
+                        )
+                    )
+        return pairs
+
+
+class Amplicon(object):
+    def __init__(
+        self, genome, primer_set, strand, beg, end, fwd_mismatches, rev_mismatches
+    ):
+        self.genome = genome
+        self.primer_set = primer_set
+        self.strand = strand
+        self.beg = beg
+        self.end = end
+        self.size = end - beg + 1
+        self.fwd_mismatches = fwd_mismatches
+        self.rev_mismatches = rev_mismatches
+
+    def to_tsv(self):
+        return "\t".join(
+            str(field)
+            for field in [
+                self.genome,
+                self.primer_set,
+                self.strand,
+                self.beg,
+                self.end,
+                self.size,
+                self.fwd_mismatches,
+                self.rev_mismatches,
+            ]
+        )
+
+
+def encode_primer(primer):
+    try:
+        return encode_pattern(primer)
+    except KeyError as error:
+        exit(f"invalid base {error} in primer {primer}")
+
+
+# k-mer indices opened in this process
+indices = dict()
+
+
+def open_index(index_dir):
+    if index_dir not in indices:
+        indices[index_dir] = KmerIndex(index_dir)
+    return indices[index_dir]
 
 
 class MiniPipeManager(object):
@@ -76,17 +76,18 @@ def main(make_file, working_dir, sample_file):
     # reference genome assembly for sunda pangolin
     # https://www.ncbi.nlm.nih.gov/assembly/GCF_014570535.1
 
+    record_store = "/home/atks/programs/CAVS-pipelines/gen/record_store.py"
     id = "AJ810453.1"
     output_genbank_file = f"{ref_dir}/{id}.genbank"
     dep = ""
     tgt = f"{output_genbank_file }.OK"
-    cmd = f"efetch -db nuccore -id {id} -format genbank > {output_genbank_file}"
+    cmd = f"{record_store} {id} -f genbank -o {output_genbank_file}"
     pg.add(tgt, dep, cmd)
 
     output_fasta_file = f"{ref_dir}/{id}.fasta"
     dep = ""
     tgt = f"{output_fasta_file}.OK"
-    cmd = f"efetch -db nuccore -id {id} -format fasta > {output_fasta_file}"
+    cmd = f"{record_store} {id} -f fasta -o {output_fasta_file}"
     pg.add(tgt, dep, cmd)
 
     #################
@@ -19,57 +19,116 @@
 # THE SOFTWARE.
 
 import os
+import sys
 import click
-import re
-from queue import PriorityQueue
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(f'{os.path.dirname(os.path.realpath(__file__))}/../../gen')
+from fasta import read_fasta
+from seqkernel import get_genetic_code, translate, reverse_complement
+
+# number of bases sent to a worker at a time
+BATCH_SIZE = 1 << 20
 
 @click.command()
-@click.option('-i', '--input_fasta_file', required=True, help='input FASTA file')
+@click.option('-i', '--input_fasta_file', required=True, help='input FASTA file, may be gzipped')
 @click.option('-o', '--output_fasta_file', required=True, help='output FASTA file')
-def main(input_fasta_file, output_fasta_file):
+@click.option('-f', '--frames', default='1', show_default=True, help='comma separated frames to translate, 1,2,3,-1,-2,-3 or all')
+@click.option('-g', '--genetic_code', default=1, show_default=True, help='NCBI translation table')
+@click.option('-s', '--stop', default='drop', show_default=True, type=click.Choice(['keep', 'drop', 'truncate']), help='keep stop codons as *, drop them or truncate at the first one')
+@click.option('-t', '--threads', default=1, show_default=True, help='number of processes')
+def main(input_fasta_file, output_fasta_file, frames, genetic_code, stop, threads):
     """
     Convert nucleotides to amino acids
 
+    Sequences may span multiple lines and are translated in batches across processes,
+    trailing bases that do not make up a codon are ignored.  With more than one frame,
+    the frame is appended to the sequence name.
+
     e.g. nt_to_aa.py -i in.fasta -o out.fasta
-   """
+         nt_to_aa.py -i contigs.fasta.gz -o contigs.aa.fasta -f all -s keep -t 8
+    """
     print(f'input FASTA file: {input_fasta_file}')
     print(f'output FASTA file: {output_fasta_file}')
 
-    with open(output_fasta_file, 'w') as out_file:
-        with open(input_fasta_file, 'r') as in_file:
-            for line in in_file:
-                if line.startswith('>'):
-                    out_file.write(line)
+    frames = parse_frames(frames)
+    translator = Translator(frames, get_genetic_code(genetic_code), stop)
+
+    no_sequences = 0
+    no_incomplete = 0
+    with open(output_fasta_file, 'w') as out_file, ProcessPoolExecutor(threads) as executor:
+        pending = deque()
+        for batch in batch_records(read_fasta(input_fasta_file)):
+            pending.append(executor.submit(translator.translate, batch))
+            # bound the number of batches held in memory
+            if len(pending) >= 4 * threads:
+                out_file.write(pending.popleft().result())
+            for name, desc, seq in batch:
+                no_sequences += 1
+                no_incomplete += len(seq) % 3 != 0
+        while pending:
+            out_file.write(pending.popleft().result())
+
+    print(f'no sequences translated: {no_sequences}')
+    if no_incomplete > 0:
+        print(f'no sequences with incomplete trailing codons: {no_incomplete}')
+
+class Translator(object):
+    def __init__(self, frames, code, stop):
+        self.frames = frames
+        self.code = code
+        self.stop = stop
+
+    def translate(self, batch):
+        """
+        Returns the translations of a batch of sequences as FASTA text.
+        """
+        lines = []
+        for name, desc, seq in batch:
+            rc_seq = None
+            for frame in self.frames:
+                if frame > 0:
+                    aa = translate(seq, frame - 1, '*', self.code)
+                else:
+                    if rc_seq is None:
+                        rc_seq = reverse_complement(seq)
+                    aa = translate(rc_seq, -frame - 1, '*', self.code)
+                if self.stop == 'drop':
+                    aa = aa.replace('*', '')
+                elif self.stop == 'truncate':
+                    aa = aa.split('*', 1)[0]
+                if len(self.frames) == 1:
+                    lines.append(f'>{desc}')
                 else:
-                    out_file.write(nt2aa(line) + '\n')
+                    lines.append(f'>{name}_frame={frame}{desc[len(name):]}')
+                lines.append(aa)
+        return ''.join(f'{line}\n' for line in lines)
 
-n2a = {
-   'TTT' : 'F', 'TTC' : 'F', 'TTA' : 'L', 'TTG' : 'L',
-   'TCT' : 'S', 'TCC' : 'S', 'TCA' : 'S', 'TCG' : 'S',
-   'TAT' : 'Y', 'TAC' : 'Y', 'TAA' : '', 'TAG' : '',
-   'TGT' : 'C', 'TGC' : 'C', 'TGA' : '', 'TGG' : 'W',
-   'CTT' : 'L', 'CTC' : 'L', 'CTA' : 'L', 'CTG' : 'L',
-   'CCT' : 'P', 'CCC' : 'P', 'CCA' : 'P', 'CCG' : 'P',
-   'CAT' : 'H', 'CAC' : 'H', 'CAA' : 'Q', 'CAG' : 'Q',
-   'CGT' : 'R', 'CGC' : 'R', 'CGA' : 'R', 'CGG' : 'R',
-   'ATT' : 'I', 'ATC' : 'I', 'ATA' : 'I', 'ATG' : 'M',
-   'ACT' : 'T', 'ACC' : 'T', 'ACA' : 'T', 'ACG' : 'T',
-   'AAT' : 'N', 'AAC' : 'N', 'AAA' : 'K', 'AAG' : 'K',
-   'AGT' : 'S', 'AGC' : 'S', 'AGA' : 'R', 'AGG' : 'R',
-   'GTT' : 'V', 'GTC' : 'V', 'GTA' : 'V', 'GTG' : 'V',
-   'GCT' : 'A', 'GCC' : 'A', 'GCA' : 'A', 'GCG' : 'A',
-   'GAT' : 'D', 'GAC' : 'D', 'GAA' : 'E', 'GAG' : 'E',
-   'GGT' : 'G', 'GGC' : 'G', 'GGA' : 'G', 'GGG' : 'G'
-}
+def parse_frames(frames):
+    if frames == 'all':
+        return [1, 2, 3, -1, -2, -3]
+    frames = [int(frame) for frame in frames.split(',')]
+    for frame in frames:
+        if frame not in [1, 2, 3, -1, -2, -3]:
+            exit(f'frame {frame} not valid')
+    return frames
 
-def nt2aa(nt):
-    nt = nt.strip()
-    n = len(nt)
-    if n%3==0:
-        res = [n2a[nt[i:i+3]] for i in range(0,len(nt),3)]
-        return ''.join(res)
-    else:
-        return nt
+def batch_records(records):
+    """
+    Yields lists of (name, desc, seq) with about BATCH_SIZE bases in each.
+    """
+    batch = []
+    size = 0
+    for record in records:
+        batch.append((record.name, record.desc, record.seq.upper()))
+        size += len(record.seq)
+        if size >= BATCH_SIZE:
+            yield batch
+            batch = []
+            size = 0
+    if len(batch) > 0:
+        yield batch
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
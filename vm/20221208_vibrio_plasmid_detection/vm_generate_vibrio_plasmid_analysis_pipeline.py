@@ -99,16 +99,17 @@ def main(make_file, working_dir, sample_file):
     pg = PipelineGenerator(make_file)
 
     # download sequences
+    record_store = "/home/atks/programs/CAVS-pipelines/gen/record_store.py"
     output_fasta = f"{ref_dir}/KM067908.fasta"
     tgt = f"{log_dir}/KM067908.fasta.OK"
     dep = ""
-    cmd = f"efetch -db nuccore -id KM067908 -format fasta > {output_fasta}"
+    cmd = f"{record_store} KM067908 -f fasta -o {output_fasta}"
     pg.add(tgt, dep, cmd)
 
     output_gb = f"{ref_dir}/KM067908.gb"
     tgt = f"{log_dir}/KM067908.gb.OK"
     dep = ""
-    cmd = f"efetch -db nuccore -id KM067908 -format genbank > {output_gb}"
+    cmd = f"{record_store} KM067908 -f genbank -o {output_gb}"
     pg.add(tgt, dep, cmd)
 
     # annotate species
@@ -173,7 +174,7 @@ def main(make_file, working_dir, sample_file):
     pg.add(tgt, dep, cmd)
 
     # convert nucleotides to amini acids
-    nt_to_aa = f"{scripts_dir}/nt_to_aa.py"
+    nt_to_aa = "/home/atks/programs/CAVS-pipelines/vm/20221208_vibrio_plasmid_detection/nt_to_aa.py"
     input_fasta = f"{ref_dir}/pirab.fasta"
     output_fasta = f"{ref_dir}/pirab.aa.fasta"
     tgt = f"{log_dir}/pirab.aa.fasta.OK"